@@ -21,6 +21,14 @@ import sys
 import json
 import os, os.path
 import re
+import hashlib
+import shutil
+import tempfile
+import gzip
+import lzma
+import multiprocessing
+import threading
+import codecs
 from os import listdir
 import numpy as np
 from numpy import zeros,array,setdiff1d,ndarray,arange
@@ -34,8 +42,11 @@ from numpy import linspace,floor
 from numpy import any,minimum,maximum
 from numpy import sort as npsort
 from bisect import bisect
+import itertools
+from collections.abc import MutableMapping
+from operator import itemgetter
 from warnings import warn,simplefilter
-from time import time
+from time import time,perf_counter
 import pydoc
 
 # Enable warning repetitions
@@ -46,6 +57,10 @@ try:
     import urllib.request as urllib2
 except ImportError:
     import urllib2
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
 if 'io' in sys.modules: # define open using Linux-style line endings
     import io
     def open_(*args,**argv):
@@ -191,6 +206,23 @@ BACKEND_DATABASE_NAME_DEFAULT = '.'
 
 VARIABLES['BACKEND_DATABASE_NAME'] = BACKEND_DATABASE_NAME_DEFAULT
 
+# Keep a binary columnar copy of each parsed table next to its data file
+# (see saveSidecar/loadSidecar). Set to False to always parse the text.
+VARIABLES['SIDECAR_CACHE'] = True
+
+# Compression of the data files written by cache2storage and queryHITRAN:
+#  'gz', 'xz' or '' for plain text. None keeps the compression of the
+#  existing data file of a table (plain text for new tables).
+VARIABLES['STORAGE_COMPRESSION'] = None
+
+# Dtypes of the columns of loaded tables: 'default', 'lossless' or 'compact'
+#  (see STORAGE_PROFILES). Single tables can have their own profile (see setStorageProfile).
+VARIABLES['STORAGE_PROFILE'] = 'default'
+
+# Make the results of selects of plain columns views of the source table
+#  instead of copies (see TableView).
+VARIABLES['SELECT_VIEWS'] = True
+
 # For this node local DB is schema-dependent!
 LOCAL_TABLE_CACHE = {
    'sampletab' : { # table
@@ -790,6 +822,62 @@ PARAMETER_META = CaselessDict(
   },
 })
 
+# COMPRESSED STORAGE
+# Data files can be kept compressed as TABLE.data.gz or TABLE.data.xz
+#  (TABLE.par.gz and TABLE.par.xz for the .par files). They are decompressed
+#  on the fly while the table is read; an uncompressed file has priority.
+
+STORAGE_COMPRESSIONS = ('gz','xz')
+STORAGE_GZIP_LEVEL = 6 # zlib default: much faster than gzip's 9 at almost the same size
+STORAGE_XZ_PRESET = 6 # smallest files but slow to write; gz is the faster choice
+STORAGE_READ_CHUNK = 1024*1024 # characters decompressed at once
+STORAGE_QUEUE_CHUNKS = 4 # decompressed chunks waiting for the parser
+
+def getStorageCompression(fullpath_data):
+    # 'gz', 'xz' or None for a plain text file.
+    ext = fullpath_data.rsplit('.',1)[-1]
+    return ext if ext in STORAGE_COMPRESSIONS else None
+
+def findStorageFile(fullpath):
+    # The file or one of its compressed versions; None if there is none.
+    for name in [fullpath]+[fullpath+'.'+ext for ext in STORAGE_COMPRESSIONS]:
+        if os.path.isfile(name): return name
+    return None
+
+def openStorageFile(fullpath_data,mode='r'):
+    # Open a data file in text mode, compressed or not.
+    compression = getStorageCompression(fullpath_data)
+    if compression=='gz':
+        return gzip.open(fullpath_data,mode+'t',compresslevel=STORAGE_GZIP_LEVEL,newline='\n')
+    if compression=='xz':
+        return lzma.open(fullpath_data,mode+'t',preset=STORAGE_XZ_PRESET if 'w' in mode else None,newline='\n')
+    return open_(fullpath_data,mode)
+
+def getStorageFileName(TableName,Compression=None):
+    # Name of the data file to write: compressed as given by Compression,
+    #  VARIABLES['STORAGE_COMPRESSION'] or the existing data file, in this order.
+    fullpath_data = VARIABLES['BACKEND_DATABASE_NAME'] + '/' + TableName + '.data'
+    if Compression is None:
+        Compression = VARIABLES['STORAGE_COMPRESSION']
+    if Compression is None:
+        existing = findStorageFile(fullpath_data)
+        Compression = getStorageCompression(existing) if existing else ''
+    if Compression:
+        if Compression not in STORAGE_COMPRESSIONS:
+            raise Exception('Unknown compression "%s", use one of %s' % (Compression,STORAGE_COMPRESSIONS))
+        fullpath_data += '.' + Compression
+    return fullpath_data
+
+def removeStaleStorageFiles(fullpath_data):
+    # Delete the versions of a written data file with other compressions,
+    #  they would shadow it or be shadowed by it, and their binary caches.
+    base = fullpath_data
+    if getStorageCompression(base): base = base.rsplit('.',1)[0]
+    for name in [base]+[base+'.'+ext for ext in STORAGE_COMPRESSIONS]:
+        if name!=fullpath_data and os.path.isfile(name):
+            os.remove(name)
+            shutil.rmtree(getSidecarName(name),ignore_errors=True)
+
 def getFullTableAndHeaderName(TableName,ext=None):
     #print('TableName=',TableName)
     if ext is None: ext = 'data'
@@ -797,8 +885,10 @@ def getFullTableAndHeaderName(TableName,ext=None):
     if os.path.isabs(TableName): flag_abspath = True        
     fullpath_data = TableName + '.' + ext
     if not flag_abspath: fullpath_data = os.path.join(VARIABLES['BACKEND_DATABASE_NAME'],fullpath_data)
+    fullpath_data = findStorageFile(fullpath_data) or fullpath_data
     if not os.path.isfile(fullpath_data):
         fullpath_data = VARIABLES['BACKEND_DATABASE_NAME'] + '/' + TableName + '.par'
+        fullpath_data = findStorageFile(fullpath_data) or fullpath_data
         if not os.path.isfile(fullpath_data) and TableName!='sampletab':
             raise Exception('Lonely header \"%s\"' % fullpath_data)
     fullpath_header = TableName + '.header'
@@ -817,6 +907,8 @@ def getRowObject(RowID,TableName):
     for par_name in LOCAL_TABLE_CACHE[TableName]['header']['order']:
         par_value = LOCAL_TABLE_CACHE[TableName]['data'][par_name][RowID]
         par_format = LOCAL_TABLE_CACHE[TableName]['header']['format'][par_name]
+        # values of narrow columns are upcast for the expression evaluator
+        if type(par_value) in NARROW_SCALAR_TYPES: par_value = widenValue(par_value,par_format)
         RowObject.append((par_name,par_value,par_format))
     return RowObject
 
@@ -832,10 +924,12 @@ def addRowObject(RowObject,TableName):
         LOCAL_TABLE_CACHE[TableName]['data'][par_name].append(par_value)
 
 def setRowObject(RowID,RowObject,TableName):
+    materializeViews(TableName)
     number_of_rows = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
     if RowID >= 0 and RowID < number_of_rows:
        for par_name,par_value,par_format in RowObject:
            LOCAL_TABLE_CACHE[TableName]['data'][par_name][RowID] = par_value
+       invalidateTableIndex(TableName)
     else:
        # !!! XXX ATTENTION: THIS IS A TEMPORARY INSERTION XXX !!!
        LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows'] += 1
@@ -882,7 +976,7 @@ def formatString(par_format,par_value,lang='FORTRAN'):
     regex = FORMAT_PYTHON_REGEX
     (lng,trail,lngpnt,ty) = re.search(regex,par_format).groups()
     if type(par_value) is np.ma.core.MaskedConstant:
-        result = '%%%ds' % lng % '#'
+        result = '%%%ss' % lng % '#'
         return result
     result = par_format % par_value
     if ty.lower() in set(['f','e']):
@@ -1008,48 +1102,815 @@ def getRowObjectFromString(input_string,TableName):
             pos += 1   
     return RowObject
 
+# BULK WRITER
+# Columns are formatted as a whole: the format of each column is parsed once
+#  and the Fortran-style corrections of formatString are applied only to 
+#  the values they can change. The output is identical to putRowObjectToString.
+
+WRITER_CHUNK_LINES = 50000
+
+# Get a function formatting a list of column values as formatString does.
+def getColumnFormatter(par_format):
+    (lng,trail,lngpnt,ty) = re.search(FORMAT_PYTHON_REGEX,par_format).groups()
+    fortran_float = ty.lower() in set(['f','e'])
+    if fortran_float:
+        lng_int = int(lng) if lng else 0
+        lngpnt_int = int(lngpnt) if lngpnt else 0
+        fix_zero = lng_int==lngpnt_int+1
+        fmt_fixed = '%%%ds' % lng_int
+    def fix(result,par_value):
+        res = result.strip()
+        if fix_zero:
+            if res[0:1]=='0':
+                result = fmt_fixed % res[1:]
+        if par_value<0:
+            if res[1:2]=='0':
+                result = fmt_fixed % (res[0:1]+res[2:])
+        return result
+    def formatter(column):
+        if isinstance(column,CategoricalColumn) and not fortran_float:
+            # each distinct value is formatted once
+            strings = list(map(par_format.__mod__,column.labels))
+            return [strings[code] for code in column.codes.tolist()]
+        if isinstance(column,ndarray):
+            values = np.ma.getdata(column).tolist()
+            mask = np.ma.getmaskarray(column).tolist() if np.ma.is_masked(column) else None
+        else:
+            values = list(column)
+            mask = [type(value) is np.ma.core.MaskedConstant for value in values]
+            if not any(mask): mask = None
+        if mask is None:
+            strings = list(map(par_format.__mod__,values))
+        else:
+            # masked values are written as '#' placeholders
+            masked_string = '%%%ss' % lng % '#'
+            strings = [masked_string if flag else par_format % value
+                       for value,flag in zip(values,mask)]
+        if not fortran_float or not strings:
+            return strings
+        if fix_zero:
+            indices = range(len(strings))
+        elif mask is None:
+            indices = np.flatnonzero(np.asarray(values)<0)
+        else:
+            indices = [i for i,value in enumerate(values) if not mask[i] and value<0]
+        for i in indices:
+            if mask is None or not mask[i]:
+                strings[i] = fix(strings[i],values[i])
+        return strings
+    return formatter
+
+# Write first nrows of the columns to the file as column-fixed text.
+def bulkWriteColumnFixed(OutfileData,columns,formats,nrows):
+    formatters = [getColumnFormatter(par_format) for par_format in formats]
+    for start in range(0,nrows,WRITER_CHUNK_LINES):
+        end = min(start+WRITER_CHUNK_LINES,nrows)
+        strings = [formatter(column[start:end]) for formatter,column in zip(formatters,columns)]
+        OutfileData.write('\n'.join(map(''.join,zip(*strings)))+'\n')
+
 # Conversion between OBJECT_FORMAT and STORAGE_FORMAT
 # This will substitute putTableToStorage and getTableFromStorage
-def cache2storage(TableName):
+def cache2storage(TableName,Compression=None):
+    # Compression: 'gz', 'xz' or '' (see VARIABLES['STORAGE_COMPRESSION'])
+    materializeTable(TableName)
     try:
        os.mkdir(VARIABLES['BACKEND_DATABASE_NAME'])
     except:
        pass
     #fullpath_data,fullpath_header = getFullTableAndHeaderName(TableName) # "lonely header" bug
-    fullpath_data = VARIABLES['BACKEND_DATABASE_NAME'] + '/' + TableName + '.data' # bugfix
+    fullpath_data = getStorageFileName(TableName,Compression) # bugfix
     fullpath_header = VARIABLES['BACKEND_DATABASE_NAME'] + '/' + TableName + '.header' # bugfix
-    OutfileData = open(fullpath_data,'w')
+    OutfileData = openStorageFile(fullpath_data,'w')
     OutfileHeader = open(fullpath_header,'w')
     # write table data
-    line_count = 1
-    line_number = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
-    for RowID in range(0,line_number):
-        line_count += 1
-        RowObject = getRowObject(RowID,TableName)
-        raw_string = putRowObjectToString(RowObject)
-        OutfileData.write(raw_string+'\n')
+    header = LOCAL_TABLE_CACHE[TableName]['header']
+    line_number = header['number_of_rows']
+    columns = [LOCAL_TABLE_CACHE[TableName]['data'][par_name] for par_name in header['order']]
+    formats = [header['format'][par_name] for par_name in header['order']]
+    bulkWriteColumnFixed(OutfileData,columns,formats,line_number)
+    OutfileData.close()
+    removeStaleStorageFiles(fullpath_data)
     # write table header
     TableHeader = getTableHeader(TableName)
     OutfileHeader.write(json.dumps(TableHeader,indent=2))
+    OutfileHeader.close()
+    
+# Layout of the column-fixed part of the table:
+#  list of (par_name,dtype,start,end) tuples, one per parameter in header['order'].
+def getColumnFixedLayout(header):
+    quantities = header['order']
+    formats = [header['format'][qnt] for qnt in quantities]
+    types = {'d':int, 'f':float, 'E':float, 's':str}
+    layout = []
+    end = 0
+    for qnt, fmt in zip(quantities, formats):
+        # pre-defined positions are needed to skip the existing parameters in headers (new feature)
+        if 'position' in header:
+            start = header['position'][qnt]
+        else:
+            start = end
+        dtype = types[fmt[-1]]
+        aux = fmt[fmt.index('%')+1:-1]
+        if '.' in aux:
+            aux = aux[:aux.index('.')]
+        size = int(aux)
+        end = start + size
+        layout.append((qnt,dtype,start,end))
+    return layout
+
+# Line-by-line converter for a single column-fixed parameter.
+def getColumnFixedConverter(qnt,dtype,start,end):
+    def cfunc(line, dtype=dtype, start=start, end=end, qnt=qnt):
+        # return dtype(line[start:end]) # this will fail on the float number with D exponent (Fortran notation)
+        if dtype==float:
+            try:
+                return dtype(line[start:end])
+            except ValueError: # possible D exponent instead of E 
+                try:
+                    return dtype(line[start:end].replace('D','E'))
+                except ValueError: # this is a special case and it should not be in the main version tree!
+                    # Dealing with the weird and unparsable intensity format such as "2.700-164, i.e with no E or D characters.
+                    res = re.search('(\d\.\d\d\d)\-(\d\d\d)',line[start:end])
+                    if res:
+                        return dtype(res.group(1)+'E-'+res.group(2))
+                    else:
+                        raise Exception('PARSE ERROR: unknown format of the par value (%s)'%line[start:end])
+        elif dtype==int and qnt=='local_iso_id':
+            if line[start:end]=='0': return 10
+            try:
+                return dtype(line[start:end])
+            except ValueError:
+                # convert letters to numbers: A->11, B->12, etc... ; .par file must be in ASCII or Unicode.
+                return 11+ord(line[start:end])-ord('A')
+        else:
+            return dtype(line[start:end])
+    return cfunc
+
+# Split a byte buffer into a 2D uint8 matrix with one line per row.
+# Lines shorter than the longest one are padded with zero bytes.
+def bulkSplitLines(buf):
+    if not buf:
+        return zeros((0,0),dtype=np.uint8)
+    if buf[-1:]!=b'\n': buf += b'\n'
+    nrows = buf.count(b'\n')
+    width = buf.index(b'\n')+1
+    if width*nrows==len(buf):
+        # all lines have the same length: reshape the buffer without copying
+        matrix = np.frombuffer(buf,dtype=np.uint8).reshape(nrows,width)
+        if (matrix[:,-1]==10).all():
+            return matrix[:,:-1]
+    lines = buf.split(b'\n')[:-1]
+    width = max(max(map(len,lines)),1)
+    return np.array(lines,dtype='S%d'%width).view(np.uint8).reshape(nrows,width)
+
+# Get bytes [start:end] of every row as a contiguous 2D uint8 block.
+def bulkSliceColumn(matrix,start,end):
+    nrows,width = matrix.shape
+    if end<=width:
+        block = np.ascontiguousarray(matrix[:,start:end])
+    else:
+        block = zeros((nrows,end-start),dtype=np.uint8)
+        if start<width: block[:,:width-start] = matrix[:,start:]
+    return block
+
+def bulkConvertFloat(column):
+    try:
+        return column.astype(float64)
+    except ValueError:
+        pass
+    column = column.copy()
+    # possible D exponent instead of E (Fortran notation)
+    mask = np.char.find(column,b'D')>=0
+    if mask.any():
+        column[mask] = np.char.replace(column[mask],b'D',b'E')
+    # weird and unparsable intensity format such as "2.700-164", i.e with no E or D characters
+    stripped = np.char.strip(column)
+    mask = (np.char.rfind(stripped,b'-')>0) & (np.char.find(np.char.upper(stripped),b'E')<0)
+    if mask.any():
+        head,sep,tail = np.char.rpartition(stripped[mask],b'-').T
+        column[mask] = np.char.add(np.char.add(head,b'E-'),tail)
+    try:
+        return column.astype(float64)
+    except ValueError:
+        for value in column:
+            try:
+                float(value)
+            except ValueError:
+                raise Exception('PARSE ERROR: unknown format of the par value (%s)'%value.decode('latin-1'))
+
+def bulkConvertInt(column,qnt):
+    if qnt!='local_iso_id':
+        return column.astype(int64)
+    try:
+        result = column.astype(int64)
+    except ValueError:
+        # convert letters to numbers: A->11, B->12, etc...
+        alpha = np.char.isalpha(column)
+        result = zeros(len(column),dtype=int64)
+        result[~alpha] = column[~alpha].astype(int64)
+        result[alpha] = column[alpha].astype('S1').view(np.uint8).astype(int64)+11-ord('A')
+    # cast local_iso_id=0 to 10
+    result[column==b'0'] = 10
+    return result
+
+# Parse column-fixed lines from a byte buffer in bulk.
+# Returns a list of numpy arrays in the order of the layout.
+def bulkParseColumnFixed(buf,layout):
+    matrix = bulkSplitLines(buf)
+    if matrix.shape[0]==0:
+        return [np.array([]) for item in layout]
+    return bulkParseMatrix(matrix,layout)
+
+# Parse the fields of the layout from the rows of a 2D uint8 block of bytes.
+def bulkParseMatrix(matrix,layout):
+    columns = []
+    for qnt,dtype,start,end in layout:
+        block = bulkSliceColumn(matrix,start,end)
+        if dtype==str:
+            # one byte per character (latin-1), decoded by widening to UCS4
+            column = block.astype(np.uint32).view('U%d'%(end-start)).ravel()
+        else:
+            column = block.view('S%d'%(end-start)).ravel()
+            if dtype==float:
+                column = bulkConvertFloat(column)
+            else:
+                column = bulkConvertInt(column,qnt)
+        columns.append(column)
+    return columns
+    
+# Read the whole file or a block of nlines lines; return (text,flag_EOF).
+def readTableText(InfileData,nlines=None):
+    if nlines is None:
+        return InfileData.read(),True
+    lines = []
+    while len(lines)<nlines:
+        line = InfileData.readline()
+        if line=='': # end of file is represented by an empty string
+            return ''.join(lines),True
+        lines.append(line)
+    return ''.join(lines),False
+
+# Convert comma-separated values to numbers; '#' placeholders and other
+#  unparsable values become NaN, as in getRowObjectFromString.
+def bulkConvertExtra(column,dtype):
+    values = np.array(column,dtype=str)
+    try:
+        return values.astype(dtype)
+    except ValueError:
+        pass
+    placeholder = np.char.strip(values)=='#'
+    try:
+        result = np.where(placeholder,'0',values).astype(dtype)
+        if placeholder.any():
+            result = result.astype(float64)
+            result[placeholder] = np.nan
+        return result
+    except ValueError:
+        pass
+    result = []
+    for value in column:
+        try:
+            result.append(dtype(value))
+        except ValueError:
+            result.append(np.nan)
+    return np.array(result)
+
+# Parse a block of lines with an optional column-fixed part followed by
+#  separated "extra" parameters. Lines too short for the column-fixed part
+#  or with too few values are skipped, as by the line-by-line parser.
+#  Return {par_name:column} or None if the block needs the line-by-line parser.
+def bulkParseExtra(text,header):
+    separator = header.get('extra_separator',',')
+    order = header.get('order',[])
+    extra = header['extra']
+    lines = text.split('\n')
+    if lines and lines[-1]=='': lines.pop()
+    if order:
+        layout = getColumnFixedLayout(header)
+        width = max(end for qnt,dtype,start,end in layout)
+    else:
+        width = 0
+    first = 1 if order else 0 # disregard the column-fixed container
+    last = first+len(extra)
+    rows = []; fixed = []
+    for line in lines:
+        values = line.split(separator)
+        if len(values)<last or len(line)<width: continue
+        rows.append(values[first:last])
+        if order: fixed.append(line[:width])
+    data = CaselessDict()
+    if order:
+        try:
+            columns = bulkParseColumnFixed('\n'.join(fixed).encode('latin-1'),layout)
+        except Exception:
+            return None
+        for qnt,column in zip(order,columns):
+            data[qnt] = column
+    columns = list(zip(*rows)) if rows else [()]*len(extra)
+    for par_name,column in zip(extra,columns):
+        (lng,trail,lngpnt,ty) = re.search(FORMAT_PYTHON_REGEX,header['extra_format'][par_name]).groups()
+        if ty=='d':
+            data[par_name] = bulkConvertExtra(column,int64)
+        elif ty.lower() in set(['e','f']):
+            data[par_name] = bulkConvertExtra(column,float64)
+        elif ty=='s':
+            data[par_name] = np.array(column)
+        else:
+            return None
+    return data
+
+# BINARY SIDECAR CACHE
+# After the first full parse, each table is dumped next to its data file
+# as a directory (TABLE.data.cache) holding one .npy file per column plus
+# a manifest. The manifest keeps the final table header and fingerprints
+# of the source data and header files; the sidecar is used only while
+# these fingerprints match.
+
+SIDECAR_VERSION = 2
+SIDECAR_EXT = '.cache'
+SIDECAR_MANIFEST = 'manifest.json'
+SIDECAR_HASH_BLOCK = 1024*1024 # bytes hashed at each end of the source file
+
+def getSidecarName(fullpath_data):
+    return fullpath_data + SIDECAR_EXT
+
+def getFileFingerprint(path):
+    # size, mtime and a hash of the first and last blocks of the file
+    stat = os.stat(path)
+    sha = hashlib.sha1()
+    with open(path,'rb') as fp:
+        sha.update(fp.read(SIDECAR_HASH_BLOCK))
+        if stat.st_size > SIDECAR_HASH_BLOCK:
+            fp.seek(max(SIDECAR_HASH_BLOCK,stat.st_size-SIDECAR_HASH_BLOCK))
+            sha.update(fp.read(SIDECAR_HASH_BLOCK))
+    return {'size':stat.st_size,'mtime':stat.st_mtime_ns,'hash':sha.hexdigest()}
+
+def saveSidecar(TableName,fullpath_data,fullpath_header):
+    header = LOCAL_TABLE_CACHE[TableName]['header']
+    data = LOCAL_TABLE_CACHE[TableName]['data']
+    sidecar = getSidecarName(fullpath_data)
+    manifest_name = os.path.join(sidecar,SIDECAR_MANIFEST)
+    try:
+        if not os.path.isdir(sidecar): os.mkdir(sidecar)
+        # manifest is written last, so a partially written sidecar is never valid
+        if os.path.isfile(manifest_name): os.remove(manifest_name)
+        columns = {}
+        for par_name in header['order']:
+            column = data[par_name]
+            entry = {'file':par_name+'.npy'}
+            if isinstance(column,CategoricalColumn):
+                # the codes are mapped like the other columns
+                entry['labels'] = par_name+'.labels.npy'
+                np.save(os.path.join(sidecar,entry['labels']),column.categories)
+                np.save(os.path.join(sidecar,entry['file']),column.codes)
+                columns[par_name] = entry
+                continue
+            if np.asarray(column).dtype.hasobject: return False
+            if isinstance(column,np.ma.MaskedArray):
+                entry['mask'] = par_name+'.mask.npy'
+                np.save(os.path.join(sidecar,entry['mask']),np.ma.getmaskarray(column))
+                column = np.ma.getdata(column)
+            np.save(os.path.join(sidecar,entry['file']),np.asarray(column))
+            columns[par_name] = entry
+        manifest = {'version':SIDECAR_VERSION,
+                    'profile':getStorageProfile(TableName),
+                    'data':getFileFingerprint(fullpath_data),
+                    'header':getFileFingerprint(fullpath_header),
+                    'table_header':header,
+                    'columns':columns}
+        with open(manifest_name,'w') as fp:
+            fp.write(json.dumps(manifest))
+    except (OSError,TypeError,ValueError) as e:
+        warn('cannot save binary cache for %s: %s' % (TableName,str(e)))
+        return False
+    return True
+
+def loadSidecarColumn(file_name):
+    # copy-on-write mapping: columns can be edited in memory without touching the file
+    try:
+        return np.load(file_name,mmap_mode='c')
+    except ValueError: # empty arrays can't be memory-mapped
+        return np.load(file_name)
+
+def loadSidecarManifest(fullpath_data,fullpath_header):
+    # Returns the manifest of a sidecar matching the data and header files or None.
+    sidecar = getSidecarName(fullpath_data)
+    try:
+        with open(os.path.join(sidecar,SIDECAR_MANIFEST)) as fp:
+            manifest = json.loads(fp.read())
+        if manifest.get('version')!=SIDECAR_VERSION: return None
+        if manifest['data']!=getFileFingerprint(fullpath_data): return None
+        if manifest['header']!=getFileFingerprint(fullpath_header): return None
+    except (OSError,KeyError,ValueError):
+        return None
+    return manifest
+
+def loadSidecar(TableName,fullpath_data,fullpath_header):
+    # Returns (header,data) from a valid sidecar or None.
+    sidecar = getSidecarName(fullpath_data)
+    manifest = loadSidecarManifest(fullpath_data,fullpath_header)
+    if manifest is None: return None
+    # the columns must have the dtypes of the profile of the table
+    if manifest.get('profile')!=getStorageProfile(TableName): return None
+    try:
+        header = manifest['table_header']
+        data = CaselessDict()
+        for par_name in header['order']:
+            entry = manifest['columns'][par_name]
+            column = loadSidecarColumn(os.path.join(sidecar,entry['file']))
+            if 'labels' in entry:
+                labels = np.load(os.path.join(sidecar,entry['labels'])).tolist()
+                column = CategoricalColumn(labels,column)
+            if 'mask' in entry:
+                mask = loadSidecarColumn(os.path.join(sidecar,entry['mask']))
+                column = np.ma.array(column,mask=mask)
+            data[par_name] = column
+    except (OSError,KeyError,ValueError):
+        return None
+    return header,data
+
+def loadSidecarTable(TableName,fullpath_data,fullpath_header):
+    result = loadSidecar(TableName,fullpath_data,fullpath_header)
+    if result is None: return False
+    header,data = result
+    LOCAL_TABLE_CACHE[TableName] = {'header':header,'data':data,'filehandler':None}
+    print('                     Lines loaded from binary cache: %d' % header['number_of_rows'])
+    return True
+
+# CATEGORICAL COLUMNS
+# Quantum number labels repeat a lot: a million lines have a few thousand
+#  distinct labels. These columns are kept dictionary-encoded, as a list of
+#  distinct labels plus an integer code per line. Items are read and written
+#  as str; numpy functions see the decoded array.
+
+CATEGORICAL_COLUMNS = set(['global_upper_quanta','global_lower_quanta',
+                           'local_upper_quanta','local_lower_quanta'])
+
+class CategoricalColumn(object):
+    """
+    Dictionary-encoded column of strings: column[i]==labels[codes[i]].
+    Slices share the labels of the column they were taken from.
+    """
+    def __init__(self,labels,codes):
+        self.labels = labels # list of distinct str values
+        self.codes = np.asarray(codes,dtype=np.int32)
+        self.index = {label:code for code,label in enumerate(labels)}
+
+    @classmethod
+    def encode(cls,values):
+        categories,codes = np.unique(np.asarray(values,dtype=str),return_inverse=True)
+        return cls(categories.tolist(),codes.ravel())
+
+    @property
+    def categories(self):
+        # labels as a numpy array
+        if len(self.labels)==0: return np.array([],dtype=str)
+        return np.array(self.labels)
+
+    @property
+    def dtype(self):
+        return self.categories.dtype
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def ndim(self):
+        return 1
+
+    @property
+    def size(self):
+        return self.codes.size
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __repr__(self):
+        return 'CategoricalColumn(%d values, %d labels)' % (len(self.codes),len(self.labels))
+
+    def __getitem__(self,key):
+        codes = self.codes[key]
+        if np.ndim(codes)==0:
+            return self.labels[codes]
+        column = CategoricalColumn.__new__(CategoricalColumn)
+        column.labels = self.labels
+        column.index = self.index
+        column.codes = codes
+        return column
+
+    def __setitem__(self,key,value):
+        if np.ndim(value)==0:
+            self.codes[key] = self.getCode(value)
+        else:
+            self.codes[key] = [self.getCode(item) for item in value]
+
+    def __iter__(self):
+        labels = self.labels
+        return (labels[code] for code in self.codes.tolist())
+
+    def __array__(self,dtype=None,copy=None):
+        values = self.categories[self.codes]
+        return values if dtype is None else values.astype(dtype)
+
+    def tolist(self):
+        return list(self)
+
+    def copy(self):
+        return CategoricalColumn(list(self.labels),self.codes.copy())
+
+    def compact(self):
+        # copy with only the labels of its items (slices keep all labels of their column)
+        used,codes = np.unique(self.codes,return_inverse=True)
+        return CategoricalColumn([self.labels[code] for code in used.tolist()],codes.ravel())
+
+    def getCode(self,value):
+        # code of a label; new labels are added to the shared list
+        value = str(value)
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.labels)
+            self.labels.append(value)
+        return code
+
+    def equal(self,value):
+        # boolean mask of the items equal to value, computed on the codes
+        return self.codes==self.index.get(value,-1)
+
+    def isin(self,values):
+        codes = [self.index[value] for value in values if isinstance(value,str) and value in self.index]
+        return np.isin(self.codes,codes)
+
+    def search(self,pattern):
+        # boolean mask of the items where the regular expression is found
+        regex = re.compile(pattern)
+        flags = np.array([regex.search(label) is not None for label in self.labels],dtype=bool)
+        return flags[self.codes]
+
+    def __eq__(self,other):
+        if isinstance(other,str):
+            return self.equal(other)
+        return np.asarray(self)==np.asarray(other)
+
+    def __ne__(self,other):
+        return ~self.__eq__(other)
+
+    __hash__ = None
+
+def asCategorical(column):
+    # The column itself if it is dictionary-encoded, its encoded copy otherwise.
+    if isinstance(column,CategoricalColumn): return column
+    return CategoricalColumn.encode(column)
+
+# STORAGE PROFILES
+# A profile chooses the dtypes of the columns of a loaded table:
+#  'default'  - int64 and float64 columns, as parsed;
+#  'lossless' - the narrowest signed integer dtype holding all values of a column,
+#               float32 for the float columns it represents exactly, and
+#               dictionary encoding for the repetitive ierr, iref and line_mixing_flag;
+#  'compact'  - 'lossless' plus float32 for the width and shift columns, whose
+#               text formats keep fewer digits than float32 does.
+# Computation routines upcast the narrow columns where precision matters.
+
+STORAGE_PROFILES = {
+    'default': {},
+    'lossless': {'narrow':True,'categorical':['ierr','iref','line_mixing_flag']},
+    'compact': {'narrow':True,'categorical':['ierr','iref','line_mixing_flag'],
+                'float32':'^(gamma|n|delta|deltap)_'},
+}
+
+TABLE_STORAGE_PROFILES = {}
+
+NARROW_INTEGER_TYPES = (np.int8,np.int16,np.int32)
+NARROW_SCALAR_TYPES = set([np.int8,np.int16,np.int32,np.float32])
+
+def getStorageProfile(TableName):
+    return TABLE_STORAGE_PROFILES.get(TableName,VARIABLES['STORAGE_PROFILE'])
+
+def setStorageProfile(TableName,Profile):
+    """
+    INPUT PARAMETERS: 
+        TableName:  name of the table                               (required)
+        Profile:    'default', 'lossless', 'compact' or None        (required)
+    OUTPUT PARAMETERS: 
+        none
+    ---
+    DESCRIPTION:
+        Set the storage profile choosing the dtypes of the columns of
+        the table (see STORAGE_PROFILES); None makes the table follow
+        VARIABLES['STORAGE_PROFILE'] again. A table which is in memory
+        is converted at once. Narrow integer columns refuse values
+        which don't fit them.
+    ---
+    EXAMPLE OF USAGE:
+        setStorageProfile('sampletab','compact')
+    ---
+    """
+    if Profile is None:
+        TABLE_STORAGE_PROFILES.pop(TableName,None)
+    elif Profile not in STORAGE_PROFILES:
+        raise Exception('Unknown storage profile "%s", use one of %s' % (Profile,sorted(STORAGE_PROFILES)))
+    else:
+        TABLE_STORAGE_PROFILES[TableName] = Profile
+    if isTableLoaded(TableName):
+        applyStorageProfile(LOCAL_TABLE_CACHE[TableName]['data'],getStorageProfile(TableName))
+
+def narrowColumn(column,single=False):
+    # Narrowest dtype holding the values of a numeric column; float32 is
+    #  used for float columns if it is exact or if single is True.
+    values = np.ma.getdata(column)
+    if values.dtype.kind=='i' and values.dtype.itemsize>1:
+        if len(values)==0: return column.astype(np.int8)
+        low,high = values.min(),values.max()
+        for dtype in NARROW_INTEGER_TYPES:
+            info = np.iinfo(dtype)
+            if low>=info.min and high<=info.max:
+                return column.astype(dtype) if dtype!=values.dtype else column
+    elif values.dtype==float64:
+        if single or np.array_equal(values.astype(float32).astype(float64),values,equal_nan=True):
+            return column.astype(float32)
+    return column
+
+def widenColumn(column,par_format=None):
+    # int64/float64 copy of a narrow numeric column, the column itself otherwise.
+    # Rounding float32 values to the decimals of a '%M.Nf' format gives back
+    #  the float64 values parsed from the text.
+    if isinstance(column,UnionColumn): return column.widen(par_format)
+    if not isinstance(column,ndarray) or column.dtype.itemsize>=8: return column
+    if column.dtype.kind=='i': return column.astype(int64)
+    if column.dtype.kind!='f': return column
+    column = column.astype(float64)
+    if par_format:
+        (lng,trail,lngpnt,ty) = re.search(FORMAT_PYTHON_REGEX,par_format).groups()
+        if ty=='f' and lngpnt: column = np.round(column,int(lngpnt))
+    return column
+
+def widenValue(value,par_format=None):
+    # Python scalar of a narrow numeric value, rounded like widenColumn does.
+    return widenColumn(np.asarray([value]),par_format)[0].item()
+
+def widenColumns(data,par_names,formats={}):
+    # Columns for computations: the narrow ones are upcast.
+    return CaselessDict({par_name:widenColumn(data[par_name],formats.get(par_name))
+                         for par_name in par_names})
+
+def applyStorageProfile(data,Profile):
+    # Convert the columns of a table to the dtypes of a storage profile.
+    settings = STORAGE_PROFILES[Profile]
+    categorical = CATEGORICAL_COLUMNS|set(settings.get('categorical',[]))
+    pattern = settings.get('float32')
+    for par_name in list(data.keys()):
+        column = data[par_name]
+        if isinstance(column,CategoricalColumn):
+            if par_name not in categorical: data[par_name] = np.asarray(column)
+            continue
+        if not isinstance(column,ndarray): continue
+        if column.dtype.kind=='U':
+            if par_name in categorical: data[par_name] = CategoricalColumn.encode(column)
+        elif settings.get('narrow'):
+            single = pattern is not None and re.search(pattern,par_name,re.I) is not None
+            data[par_name] = narrowColumn(column,single)
+        else:
+            data[par_name] = widenColumn(column)
+
+# BLOCKWISE PARSING
+# Text arriving in chunks (a download or a decompressed file) is parsed by the
+#  bulk parsers in blocks of about TEXT_PARSE_BLOCK characters in a separate
+#  thread, while the producer of the chunks keeps working.
+
+TEXT_PARSE_BLOCK = 1024*1024
+
+def parseTableText(text,header):
+    # Parse complete lines of a table; return {par_name:column} or None.
+    if header.get('extra'):
+        return bulkParseExtra(text,header)
+    columns = bulkParseColumnFixed(text.encode('latin-1'),getColumnFixedLayout(header))
+    return CaselessDict(zip(header['order'],columns))
+
+def parseTextChunks(chunks,header,result):
+    # Parse text chunks taken from a queue until None arrives, in blocks of complete lines;
+    #  append the list of parsed blocks (or None on failure) to result.
+    blocks = []
+    pending = []; size = 0
+    tail = ''
+    failed = False
+    while True:
+        chunk = chunks.get()
+        if chunk is not None:
+            pending.append(chunk); size += len(chunk)
+            if size<TEXT_PARSE_BLOCK: continue
+        text = tail+''.join(pending)
+        pending = []; size = 0
+        if chunk is not None:
+            # keep the incomplete last line for the next block
+            cut = text.rfind('\n')+1
+            text,tail = text[:cut],text[cut:]
+        if text and not failed:
+            try:
+                block = parseTableText(text,header)
+            except Exception:
+                block = None
+            if block is None:
+                failed = True
+            else:
+                blocks.append(block)
+        if chunk is None: break
+    result.append(None if failed else blocks)
+
+def concatenateTableBlocks(blocks,header):
+    # Join the blocks parsed by parseTextChunks; None stays None.
+    if blocks is None: return None
+    if not blocks: blocks = [parseTableText('',header)]
+    par_names = header.get('order',[])+header.get('extra',[])
+    data = CaselessDict()
+    for par_name in par_names:
+        data[par_name] = np.concatenate([block[par_name] for block in blocks])
+    return data
+
+def parseStorageStream(InfileData,header):
+    # Decompress the rest of a data file in this thread while another one parses it.
+    # Return the parsed columns or None if the text needs the line-by-line parser.
+    chunks = Queue(STORAGE_QUEUE_CHUNKS)
+    result = []
+    parser = threading.Thread(target=parseTextChunks,args=(chunks,header,result))
+    parser.daemon = True
+    parser.start()
+    try:
+        while True:
+            chunk = InfileData.read(STORAGE_READ_CHUNK)
+            if not chunk: break
+            chunks.put(chunk)
+    finally:
+        chunks.put(None)
+        parser.join()
+    return concatenateTableBlocks(result[0],header)
+
+# Bring parsed columns to the form kept in LOCAL_TABLE_CACHE: numpy columns, masked numeric
+#  "extra" columns and a header with the "extra" parameters merged into order/format/default.
+def finalizeTableColumns(header,data,Profile='default'):
+    glob_order = []; glob_format = {}; glob_default = {}
+    if "order" in header.keys():
+        glob_order += header['order']
+        glob_format.update(header['format'])
+        glob_default.update(header['default'])
+    if "extra" in header.keys():
+        glob_order += header['extra']
+        glob_format.update(header['extra_format'])
+        for par_name in header['extra']:
+            glob_default[par_name] = PARAMETER_META[par_name]['default_fmt']
+
+    # Convert all columns to numpy arrays
+    for par_name in glob_order:
+        data[par_name] = np.array(data[par_name])
+            
+    # Additionally: convert numeric arrays in "extra" part of the LOCAL_TABLE_CACHE to masked arrays.
+    # This is done to avoid "nan" values in the arithmetic operations involving these columns.
+    if 'extra' in header and header['extra']:
+        for par_name in header['extra']:
+            par_format = header['extra_format'][par_name]
+            regex = FORMAT_PYTHON_REGEX
+            (lng,trail,lngpnt,ty) = re.search(regex,par_format).groups()
+            if ty.lower() in ['d','e','f']:
+                column = data[par_name]
+                colmask = np.isnan(column)
+                data[par_name] = np.ma.array(column,mask=colmask)
     
-def storage2cache(TableName,cast=True,ext=None,nlines=None,pos=None):
+    applyStorageProfile(data,Profile)
+
+    # Delete all character-separated values, treat them as column-fixed.
+    for key in ('extra','extra_format','extra_separator'):
+        header.pop(key,None)
+    # Update header.order/format with header.extra/format if exist.
+    header['order'] = glob_order
+    header['format'] = glob_format
+    header['default'] = glob_default
+
+def storage2cache(TableName,cast=True,ext=None,nlines=None,pos=None,CacheName=None):
     """ edited by NHL
     TableName: name of the HAPI table to read in
     ext: file extension
     nlines: number of line in the block; if None, read all line at once 
     pos: file position to seek
+    CacheName: entry of LOCAL_TABLE_CACHE the data is read into; TableName if None
     """
+    if CacheName is None: CacheName = TableName
     #print 'storage2cache:'
     #print('TableName',TableName)
-    if nlines is not None:
-        print('WARNING: storage2cache is reading the block of maximum %d lines'%nlines)
     fullpath_data,fullpath_header = getFullTableAndHeaderName(TableName,ext)
-    if TableName in LOCAL_TABLE_CACHE and \
-       'filehandler' in LOCAL_TABLE_CACHE[TableName] and \
-       LOCAL_TABLE_CACHE[TableName]['filehandler'] is not None:
-        InfileData = LOCAL_TABLE_CACHE[TableName]['filehandler']
+    if CacheName in LOCAL_TABLE_CACHE and \
+       'filehandler' in LOCAL_TABLE_CACHE[CacheName] and \
+       LOCAL_TABLE_CACHE[CacheName]['filehandler'] is not None:
+        InfileData = LOCAL_TABLE_CACHE[CacheName]['filehandler']
+        flag_stream = False
+    elif nlines is None and CacheName==TableName and VARIABLES['SIDECAR_CACHE'] and \
+         loadSidecarTable(TableName,fullpath_data,fullpath_header):
+        return True
     else:
-        InfileData = open_(fullpath_data,'r')            
+        if nlines is not None:
+            print('WARNING: storage2cache is reading the block of maximum %d lines'%nlines)
+        InfileData = openStorageFile(fullpath_data,'r')
+        # a compressed file is parsed while it is decompressed
+        flag_stream = nlines is None and getStorageCompression(fullpath_data) is not None
     InfileHeader = open(fullpath_header,'r')
     #try:
     header_text = InfileHeader.read()
@@ -1060,10 +1921,10 @@ def storage2cache(TableName,cast=True,ext=None,nlines=None,pos=None):
         print(header_text)
         raise Exception('Invalid header')
     #print 'Header:'+str(Header)
-    LOCAL_TABLE_CACHE[TableName] = {}
-    LOCAL_TABLE_CACHE[TableName]['header'] = Header
-    LOCAL_TABLE_CACHE[TableName]['data'] = CaselessDict()
-    LOCAL_TABLE_CACHE[TableName]['filehandler'] = InfileData
+    LOCAL_TABLE_CACHE[CacheName] = {}
+    LOCAL_TABLE_CACHE[CacheName]['header'] = Header
+    LOCAL_TABLE_CACHE[CacheName]['data'] = CaselessDict()
+    LOCAL_TABLE_CACHE[CacheName]['filehandler'] = InfileData
     # Check if Header['order'] and Header['extra'] contain
     #  parameters with same names, raise exception if true.
     #intersct = set(Header['order']).intersection(set(Header.get('extra',[])))
@@ -1071,149 +1932,71 @@ def storage2cache(TableName,cast=True,ext=None,nlines=None,pos=None):
     if intersct:
         raise Exception('Parameters with the same names: {}'.format(intersct))
     # initialize empty data to avoid problems
-    glob_order = []; glob_format = {}; glob_default = {}
-    if "order" in LOCAL_TABLE_CACHE[TableName]['header'].keys():
-        glob_order += LOCAL_TABLE_CACHE[TableName]['header']['order']
-        glob_format.update(LOCAL_TABLE_CACHE[TableName]['header']['format'])
-        glob_default.update(LOCAL_TABLE_CACHE[TableName]['header']['default'])
-        for par_name in LOCAL_TABLE_CACHE[TableName]['header']['order']:
-            LOCAL_TABLE_CACHE[TableName]['data'][par_name] = []
-    if "extra" in LOCAL_TABLE_CACHE[TableName]['header'].keys():
-        glob_order += LOCAL_TABLE_CACHE[TableName]['header']['extra']
-        glob_format.update(LOCAL_TABLE_CACHE[TableName]['header']['extra_format'])
-        for par_name in LOCAL_TABLE_CACHE[TableName]['header']['extra']:
-            glob_default[par_name] = PARAMETER_META[par_name]['default_fmt']
-            LOCAL_TABLE_CACHE[TableName]['data'][par_name] = []
+    for par_name in Header.get('order',[])+Header.get('extra',[]):
+        LOCAL_TABLE_CACHE[CacheName]['data'][par_name] = []
     
-    header = LOCAL_TABLE_CACHE[TableName]['header']
-    if 'extra' in header and header['extra']:
-        line_count = 0
-        flag_EOF = False
-        #line_number = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
-        #for line in InfileData:
-        while True:
-            #print '%d line from %d' % (line_count,line_number)
-            #print 'line: '+line #
-            if nlines is not None and line_count>=nlines: break
-            line = InfileData.readline()
-            if line=='': # end of file is represented by an empty string
-                flag_EOF = True
-                break 
-            try:
-                RowObject = getRowObjectFromString(line,TableName)
-                line_count += 1
-            except:
-                continue
-            #print 'RowObject: '+str(RowObject)
-            addRowObject(RowObject,TableName)
-        #except:
-        #    raise Exception('TABLE FETCHING ERROR')
-        LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows'] = line_count
+    header = LOCAL_TABLE_CACHE[CacheName]['header']
+    data_columns = None
+    if flag_stream:
+        data_columns = parseStorageStream(InfileData,header)
+        if data_columns is None:
+            # lines which the bulk parsers can't handle: read the file again below
+            InfileData.close()
+            InfileData = LOCAL_TABLE_CACHE[CacheName]['filehandler'] = openStorageFile(fullpath_data,'r')
+    if data_columns is not None:
+        for par_name in data_columns:
+            LOCAL_TABLE_CACHE[CacheName]['data'][par_name] = data_columns[par_name]
+        par_names = header.get('order',[])+header.get('extra',[])
+        header['number_of_rows'] = line_count = len(data_columns[par_names[0]]) if par_names else 0
+        flag_EOF = True
+    elif 'extra' in header and header['extra']:
+        # read the block of lines as a single text buffer
+        text,flag_EOF = readTableText(InfileData,nlines)
+        data_columns = bulkParseExtra(text,header)
+        if data_columns is not None:
+            for par_name in data_columns:
+                LOCAL_TABLE_CACHE[CacheName]['data'][par_name] = data_columns[par_name]
+            line_count = len(data_columns[header['extra'][0]])
+        else:
+            # lines which the bulk parser can't handle: parse line by line
+            line_count = 0
+            for line in text.splitlines(True):
+                try:
+                    RowObject = getRowObjectFromString(line,CacheName)
+                    line_count += 1
+                except:
+                    continue
+                addRowObject(RowObject,CacheName)
+        LOCAL_TABLE_CACHE[CacheName]['header']['number_of_rows'] = line_count
     else:
         quantities = header['order']
-        formats = [header['format'][qnt] for qnt in quantities]
-        types = {'d':int, 'f':float, 'E':float, 's':str}
-        converters = []
-        end = 0
-        for qnt, fmt in zip(quantities, formats):
-            # pre-defined positions are needed to skip the existing parameters in headers (new feature)
-            if 'position' in header:
-                start = header['position'][qnt]
-            else:
-                start = end
-            dtype = types[fmt[-1]]
-            aux = fmt[fmt.index('%')+1:-1]
-            if '.' in aux:
-                aux = aux[:aux.index('.')]
-            size = int(aux)
-            end = start + size
-            def cfunc(line, dtype=dtype, start=start, end=end, qnt=qnt):
-                # return dtype(line[start:end]) # this will fail on the float number with D exponent (Fortran notation)
-                if dtype==float:
-                    try:
-                        return dtype(line[start:end])
-                    except ValueError: # possible D exponent instead of E 
-                        try:
-                            return dtype(line[start:end].replace('D','E'))
-                        except ValueError: # this is a special case and it should not be in the main version tree!
-                            # Dealing with the weird and unparsable intensity format such as "2.700-164, i.e with no E or D characters.
-                            res = re.search('(\d\.\d\d\d)\-(\d\d\d)',line[start:end])
-                            if res:
-                                return dtype(res.group(1)+'E-'+res.group(2))
-                            else:
-                                raise Exception('PARSE ERROR: unknown format of the par value (%s)'%line[start:end])
-                elif dtype==int and qnt=='local_iso_id':
-                    if line[start:end]=='0': return 10
-                    try:
-                        return dtype(line[start:end])
-                    except ValueError:
-                        # convert letters to numbers: A->11, B->12, etc... ; .par file must be in ASCII or Unicode.
-                        return 11+ord(line[start:end])-ord('A')
-                else:
-                    return dtype(line[start:end])
-            #cfunc.__doc__ = 'converter {} {}'.format(qnt, fmt) # doesn't work in earlier versions of Python
-            converters.append(cfunc)
-            #start = end
-        #data_matrix = [[cvt(line) for cvt in converters] for line in InfileData]
-        flag_EOF = False
-        line_count = 0
-        data_matrix = []
-        while True:
-            if nlines is not None and line_count>=nlines: break   
-            line = InfileData.readline()
-            if line=='': # end of file is represented by an empty string
-                flag_EOF = True
-                break 
-            data_matrix.append([cvt(line) for cvt in converters])
-            line_count += 1
-        data_columns = zip(*data_matrix)
+        layout = getColumnFixedLayout(header)
+        # read the block of lines as a single text buffer
+        text,flag_EOF = readTableText(InfileData,nlines)
+        try:
+            # bulk path: slice fixed-width columns out of one byte buffer
+            data_columns = bulkParseColumnFixed(text.encode('latin-1'),layout)
+        except UnicodeEncodeError:
+            # characters which can't be mapped to single bytes: parse line by line
+            converters = [getColumnFixedConverter(qnt,dtype,start,end) 
+                          for qnt,dtype,start,end in layout]
+            data_matrix = [[cvt(line) for cvt in converters] for line in text.splitlines(True)]
+            data_columns = [np.array(col) for col in zip(*data_matrix)]
         for qnt, col in zip(quantities, data_columns):
-            #LOCAL_TABLE_CACHE[TableName]['data'][qnt].extend(col) # old code
-            if type(col[0]) in {int,float}:
-                LOCAL_TABLE_CACHE[TableName]['data'][qnt] = np.array(col) # new code
-            else:
-                LOCAL_TABLE_CACHE[TableName]['data'][qnt].extend(col) # old code
-            #LOCAL_TABLE_CACHE[TableName]['data'][qnt] = list(col)
-            #LOCAL_TABLE_CACHE[TableName]['data'][qnt] = col
+            LOCAL_TABLE_CACHE[CacheName]['data'][qnt] = col
         header['number_of_rows'] = line_count = (
-            len(LOCAL_TABLE_CACHE[TableName]['data'][quantities[0]]))
+            len(LOCAL_TABLE_CACHE[CacheName]['data'][quantities[0]]))
             
-    # Convert all columns to numpy arrays
-    par_names = LOCAL_TABLE_CACHE[TableName]['header']['order']
-    if 'extra' in header and header['extra']:
-        par_names += LOCAL_TABLE_CACHE[TableName]['header']['extra']
-    for par_name in par_names:
-        column = LOCAL_TABLE_CACHE[TableName]['data'][par_name]
-        LOCAL_TABLE_CACHE[TableName]['data'][par_name] = np.array(column)                    
-            
-    # Additionally: convert numeric arrays in "extra" part of the LOCAL_TABLE_CACHE to masked arrays.
-    # This is done to avoid "nan" values in the arithmetic operations involving these columns.
-    if 'extra' in header and header['extra']:
-        for par_name in LOCAL_TABLE_CACHE[TableName]['header']['extra']:
-            par_format = LOCAL_TABLE_CACHE[TableName]['header']['extra_format'][par_name]
-            regex = FORMAT_PYTHON_REGEX
-            (lng,trail,lngpnt,ty) = re.search(regex,par_format).groups()
-            if ty.lower() in ['d','e','f']:
-                column = LOCAL_TABLE_CACHE[TableName]['data'][par_name]
-                colmask = np.isnan(column)
-                LOCAL_TABLE_CACHE[TableName]['data'][par_name] = np.ma.array(column,mask=colmask)
-    
-    # Delete all character-separated values, treat them as column-fixed.
-    try:
-        del LOCAL_TABLE_CACHE[TableName]['header']['extra']
-        del LOCAL_TABLE_CACHE[TableName]['header']['extra_format']
-        del LOCAL_TABLE_CACHE[TableName]['header']['extra_separator']
-    except:
-        pass
-    # Update header.order/format with header.extra/format if exist.
-    LOCAL_TABLE_CACHE[TableName]['header']['order'] = glob_order
-    LOCAL_TABLE_CACHE[TableName]['header']['format'] = glob_format
-    LOCAL_TABLE_CACHE[TableName]['header']['default'] = glob_default
+    finalizeTableColumns(LOCAL_TABLE_CACHE[CacheName]['header'],LOCAL_TABLE_CACHE[CacheName]['data'],
+                         getStorageProfile(TableName))
     if flag_EOF:
         InfileData.close()
-        LOCAL_TABLE_CACHE[TableName]['filehandler'] = None
+        LOCAL_TABLE_CACHE[CacheName]['filehandler'] = None
     InfileHeader.close()
     print('                     Lines parsed: %d' % line_count)
+    # whole table is parsed: keep its binary copy for the next loads
+    if flag_EOF and nlines is None and CacheName==TableName and VARIABLES['SIDECAR_CACHE']:
+        saveSidecar(TableName,fullpath_data,fullpath_header)
     return flag_EOF    
     
 ## old version based on regular expressions    
@@ -1304,11 +2087,13 @@ def scanForNewParfiles(StorageName):
         if fext == 'header': headers[fname] = True
     for file_name in file_names:
         # check if extension is 'par' and the header is absent
+        # (compressed .par.gz/.par.xz files count as .par files)
+        if getStorageCompression(file_name): file_name = file_name.rsplit('.',1)[0]
         try:
             fname,fext = re.search('(.+)\.(\w+)',file_name).groups()
         except:
             continue
-        if fext == 'par' and fname not in headers:
+        if fext == 'par' and fname not in headers and fname not in parfiles_without_header:
             parfiles_without_header.append(fname)
     return parfiles_without_header
 
@@ -1320,9 +2105,747 @@ def createHeader(TableName):
     fp.write(json.dumps(HITRAN_DEFAULT_HEADER,indent=2))
     fp.close()
 
-def loadCache():
+def benchmarkStorageCompression(TableName,Compressions=STORAGE_COMPRESSIONS,Repeat=3):
+    """
+    INPUT PARAMETERS: 
+        TableName:     name of the table in LOCAL_TABLE_CACHE       (required)
+        Compressions:  compressions to compare with plain text      (optional)
+        Repeat:        number of timed loads, the best one is kept  (optional)
+    OUTPUT PARAMETERS: 
+        Results: {compression:{'size','write','load','bandwidth'}}
+    ---
+    DESCRIPTION:
+        Write the table to a temporary folder as plain text and with each
+        compression, then time storage2cache on each file (binary cache
+        disabled). The files are read from the page cache, so the load
+        times are the CPU costs of reading and parsing.
+        A compressed file loads faster when the storage delivers less than
+        'bandwidth' bytes per second: below it, the time saved reading fewer
+        bytes is larger than the time spent decompressing. The bandwidth is
+        0 if compression never pays off and inf if it always does.
+        The results are printed as a table.
+    ---
+    EXAMPLE OF USAGE:
+        results = benchmarkStorageCompression('sampletab')
+    ---
+    """
+    entry = LOCAL_TABLE_CACHE[TableName]
+    entry['data'] # load a lazy table
+    database_name = VARIABLES['BACKEND_DATABASE_NAME']
+    sidecar_cache = VARIABLES['SIDECAR_CACHE']
+    folder = tempfile.mkdtemp()
+    results = {}
+    try:
+        VARIABLES['BACKEND_DATABASE_NAME'] = folder
+        VARIABLES['SIDECAR_CACHE'] = False
+        for compression in ('',)+tuple(Compressions):
+            t = time()
+            cache2storage(TableName,compression)
+            write_time = time()-t
+            load_time = None
+            for i in range(Repeat):
+                t = time()
+                storage2cache(TableName)
+                load_time = min(time()-t,load_time or float('inf'))
+                LOCAL_TABLE_CACHE[TableName] = entry
+            size = os.path.getsize(getStorageFileName(TableName,compression))
+            results[compression] = {'size':size,'write':write_time,'load':load_time}
+    finally:
+        LOCAL_TABLE_CACHE[TableName] = entry
+        VARIABLES['BACKEND_DATABASE_NAME'] = database_name
+        VARIABLES['SIDECAR_CACHE'] = sidecar_cache
+        shutil.rmtree(folder,ignore_errors=True)
+    plain = results.pop('')
+    print('%-6s %12s %9s %9s %s' % ('FORMAT','SIZE','WRITE,s','LOAD,s','NET WIN FOR STORAGE SLOWER THAN'))
+    print('%-6s %12d %9.3f %9.3f' % ('plain',plain['size'],plain['write'],plain['load']))
+    for compression in Compressions:
+        result = results[compression]
+        saved_bytes = plain['size']-result['size']
+        extra_time = result['load']-plain['load']
+        if saved_bytes<=0:
+            bandwidth = 0.
+        elif extra_time<=0:
+            bandwidth = float('inf')
+        else:
+            bandwidth = saved_bytes/extra_time
+        result['bandwidth'] = bandwidth
+        if bandwidth==float('inf'):
+            verdict = 'always'
+        elif bandwidth==0:
+            verdict = 'never'
+        else:
+            verdict = '%.1f MB/s' % (bandwidth/1e6)
+        print('%-6s %12d %9.3f %9.3f %s' % (compression,result['size'],result['write'],result['load'],verdict))
+    results[''] = plain
+    return results
+
+# IN-PLACE UPDATE OF STORED CELLS
+# Column-fixed rows can be patched in the storage file: the byte offsets
+#  of the rows are found once (arithmetically if all lines have the same
+#  width) and only the fields of the edited cells are overwritten.
+
+ROW_OFFSET_CACHE = {}
+ROW_OFFSET_SCAN_BLOCK = 16*1024*1024
+
+# Offsets of all line starts of a file, followed by the file size.
+def scanRowOffsets(fullpath_data):
+    offsets = [np.zeros(1,dtype=int64)]
+    base = 0
+    last = b''
+    with open(fullpath_data,'rb') as fp:
+        while True:
+            block = fp.read(ROW_OFFSET_SCAN_BLOCK)
+            if not block: break
+            offsets.append(np.flatnonzero(np.frombuffer(block,dtype=np.uint8)==10)+(base+1))
+            base += len(block)
+            last = block[-1:]
+    offsets = np.concatenate(offsets)
+    if last not in (b'',b'\n'):
+        offsets = np.append(offsets,base)
+    return offsets
+
+def getRowOffsets(fullpath_data,nrows,scan=False):
+    # Return nrows+1 offsets of the rows in a data file or None if the file has a different number of lines.
+    stat = os.stat(fullpath_data)
+    key = (stat.st_size,stat.st_mtime_ns)
+    cached = ROW_OFFSET_CACHE.get(fullpath_data)
+    if cached is not None and cached[0]==key and \
+       not (scan and isinstance(cached[1],range)): return cached[1]
+    with open(fullpath_data,'rb') as fp:
+        width = len(fp.readline())
+    if not scan and width*nrows==stat.st_size:
+        offsets = range(0,stat.st_size+1,width) # all lines have the same width
+    else:
+        offsets = scanRowOffsets(fullpath_data)
+        if len(offsets)!=nrows+1: return None
+    ROW_OFFSET_CACHE[fullpath_data] = (key,offsets)
+    return offsets
+
+def readStoredRows(fullpath_data,offsets,RowIDs):
+    # Read the given rows; None if some row is not a complete line.
+    rows = {}
+    with open(fullpath_data,'rb') as fp:
+        for RowID in RowIDs:
+            start = offsets[RowID]
+            fp.seek(max(start-1,0))
+            line = fp.read(offsets[RowID+1]-start+(1 if start>0 else 0))
+            if start>0:
+                if line[:1]!=b'\n': return None
+                line = line[1:]
+            if b'\n' in line[:-1]: return None
+            if line[-1:]!=b'\n' and RowID+2<len(offsets): return None
+            rows[RowID] = line
+    return rows
+
+def cache2storageCells(TableName,Cells):
+    """
+    Write the values of the given cells of a table into its storage file in place.
+    Cells is an iterable of (par_name,RowID) pairs.
+    The whole table is rewritten by cache2storage if the file can't be patched
+    (e.g. compressed storage, comma-separated parameters or a value not fitting
+    its field width).
+    Return True if the file was patched and False if it was rewritten.
+    """
+    # the cells were edited in place
+    invalidateTableIndex(TableName)
+    fullpath_data = VARIABLES['BACKEND_DATABASE_NAME'] + '/' + TableName + '.data'
+    fullpath_header = VARIABLES['BACKEND_DATABASE_NAME'] + '/' + TableName + '.header'
+    if getStorageFileName(TableName)!=fullpath_data:
+        cache2storage(TableName)
+        return False
+    patches = getStoredCellPatches(TableName,Cells,fullpath_data,fullpath_header)
+    if patches is None:
+        cache2storage(TableName)
+        return False
+    with open(fullpath_data,'r+b') as fp:
+        for offset,value in patches:
+            fp.seek(offset)
+            fp.write(value)
+    # the lines keep their widths: the offsets stay valid
+    cached = ROW_OFFSET_CACHE.get(fullpath_data)
+    if cached is not None:
+        stat = os.stat(fullpath_data)
+        ROW_OFFSET_CACHE[fullpath_data] = ((stat.st_size,stat.st_mtime_ns),cached[1])
+    return True
+
+def getStoredCellPatches(TableName,Cells,fullpath_data,fullpath_header):
+    # List of (file offset,bytes) for the cells or None if the file can't be patched.
+    if not os.path.isfile(fullpath_data) or not os.path.isfile(fullpath_header):
+        return None
+    header = LOCAL_TABLE_CACHE[TableName]['header']
+    with open(fullpath_header,'r') as fp:
+        try:
+            stored_header = json.loads(fp.read())
+        except ValueError:
+            return None
+    if stored_header.get('extra') or stored_header.get('order')!=header['order'] or \
+       stored_header.get('format')!=header['format']:
+        return None
+    nrows = header['number_of_rows']
+    layout = {qnt:(start,end) for qnt,dtype,start,end in getColumnFixedLayout(stored_header)}
+    width = max(end for start,end in layout.values())
+    data = LOCAL_TABLE_CACHE[TableName]['data']
+    fields = []
+    for par_name,RowID in set(Cells):
+        if RowID<0 or RowID>=nrows: return None
+        start,end = layout[par_name]
+        value = getColumnFormatter(header['format'][par_name])(data[par_name][RowID:RowID+1])[0]
+        if len(value)!=end-start: return None
+        try:
+            fields.append((RowID,start,value.encode('latin-1')))
+        except UnicodeEncodeError:
+            return None
+    RowIDs = set(RowID for RowID,start,value in fields)
+    for scan in (False,True):
+        offsets = getRowOffsets(fullpath_data,nrows,scan)
+        if offsets is None: return None
+        rows = readStoredRows(fullpath_data,offsets,RowIDs)
+        if rows is not None: break
+    if rows is None: return None
+    patches = []
+    for RowID,start,value in fields:
+        # a line of another width doesn't follow the layout of the header
+        if len(rows[RowID].rstrip(b'\r\n'))!=width: return None
+        patches.append((offsets[RowID]+start,value))
+    return patches
+
+# LAZY TABLES
+# A lazy table is registered in LOCAL_TABLE_CACHE with its header only.
+# Its columns are read from storage by storage2cache the first time
+#  the 'data' item of the table is accessed.
+
+class LazyTable(dict):
+    """
+    Entry of LOCAL_TABLE_CACHE holding only the table header
+    until the 'data' item is requested.
+    """
+    def __init__(self,TableName,header):
+        dict.__init__(self,header=header)
+        self.table_name = TableName
+
+    def __missing__(self,key):
+        if key!='data':
+            raise KeyError(key)
+        self.load()
+        return dict.__getitem__(self,'data')
+
+    def isLoaded(self):
+        return 'data' in self
+
+    def load(self):
+        storage2cache(self.table_name)
+        # storage2cache registers a new entry; take over its contents
+        #  so that references to this entry stay valid
+        self.update(LOCAL_TABLE_CACHE[self.table_name])
+        LOCAL_TABLE_CACHE[self.table_name] = self
+
+def getStorageHeader(TableName):
+    # Read the table header without reading the data.
+    # Extra parameters are merged into 'order' and 'format' the same
+    #  way storage2cache does, so the header describes all columns.
+    fullpath_data,fullpath_header = getFullTableAndHeaderName(TableName)
+    if VARIABLES['SIDECAR_CACHE']:
+        manifest = loadSidecarManifest(fullpath_data,fullpath_header)
+        if manifest is not None and 'table_header' in manifest:
+            return manifest['table_header']
+    with open(fullpath_header,'r') as InfileHeader:
+        header_text = InfileHeader.read()
+    try:
+        Header = json.loads(header_text)
+    except:
+        print('HEADER:')
+        print(header_text)
+        raise Exception('Invalid header')
+    if 'extra' in Header:
+        Header['order'] = Header.get('order',[]) + Header['extra']
+        Header['format'] = dict(Header.get('format',{}),**Header['extra_format'])
+        Header['default'] = dict(Header.get('default',{}))
+        for par_name in Header['extra']:
+            Header['default'][par_name] = PARAMETER_META[par_name]['default_fmt']
+        for key in ('extra','extra_format','extra_separator'):
+            Header.pop(key,None)
+    return Header
+
+def registerLazyTable(TableName):
+    LOCAL_TABLE_CACHE[TableName] = LazyTable(TableName,getStorageHeader(TableName))
+
+def isTableLoaded(TableName):
+    # True if the data of the table is in memory.
+    return TableName in LOCAL_TABLE_CACHE and \
+        not (isinstance(LOCAL_TABLE_CACHE[TableName],LazyTable) and \
+             not LOCAL_TABLE_CACHE[TableName].isLoaded())
+
+# TABLE VIEWS
+# A select of plain columns makes its destination a view of the source table:
+#  the columns of a view are the columns of its parent at the selected rows,
+#  taken when they are first read. Columns which are never read are never
+#  copied, and consecutive rows are a slice sharing the memory of the parent
+#  (such columns are read-only, getColumn copies them). A view is made an ordinary
+#  table (materialized) before it is edited, saved or sent to the GUI, and before
+#  setRowObject edits its parent.
+
+class ViewColumns(MutableMapping):
+    """
+    Columns of a view: the columns of the parent table at RowIDs
+    (a slice or an index array of rows), resolved on first access.
+    """
+    def __init__(self,columns,RowIDs):
+        self.parent_columns = columns # {par_name: column of the parent}
+        self.row_ids = RowIDs
+        self.names = list(columns)
+        self.columns = {}   # resolved or assigned columns
+        self.assigned = set()
+        self.shared = set() # columns sharing the memory of the parent
+
+    def __getitem__(self,par_name):
+        if par_name in self.columns:
+            return self.columns[par_name]
+        column = self.parent_columns[par_name]
+        if type(column)==list: column = np.asarray(column)
+        column = column[self.row_ids]
+        if isinstance(self.row_ids,slice):
+            if isinstance(column,CategoricalColumn):
+                column.codes.flags.writeable = False
+            else:
+                column.flags.writeable = False
+            self.shared.add(par_name)
+        self.columns[par_name] = column
+        return column
+
+    def __setitem__(self,par_name,column):
+        if par_name not in self.names: self.names.append(par_name)
+        self.columns[par_name] = column
+        self.assigned.add(par_name)
+        self.shared.discard(par_name)
+
+    def own(self,par_name):
+        # the column, copied first if it shares the memory of the parent
+        column = self[par_name]
+        if par_name in self.shared:
+            column = self.columns[par_name] = column.copy()
+            self.shared.discard(par_name)
+        return column
+
+    def __delitem__(self,par_name):
+        self.names.remove(par_name)
+        self.columns.pop(par_name,None)
+        self.assigned.discard(par_name)
+        self.shared.discard(par_name)
+
+    def __iter__(self):
+        return iter(list(self.names))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self,par_name):
+        return par_name in self.names
+
+class TableView(dict):
+    """
+    Entry of LOCAL_TABLE_CACHE holding a view of the rows
+    of another table until it is materialized.
+    """
+    def __init__(self,ParentName,header,columns,RowIDs):
+        dict.__init__(self,header=header,data=ViewColumns(columns,RowIDs))
+        self.parent = ParentName
+
+    def isView(self):
+        return isinstance(dict.__getitem__(self,'data'),ViewColumns)
+
+    def materialize(self):
+        columns = dict.__getitem__(self,'data')
+        if not isinstance(columns,ViewColumns): return
+        data = {}
+        for par_name in columns:
+            column = columns[par_name]
+            if isinstance(column,CategoricalColumn) and par_name not in columns.assigned:
+                column = column.compact()
+            elif par_name in columns.shared:
+                column = column.copy()
+            data[par_name] = column
+        self['data'] = data
+
+def getRowIDSlice(RowIDs):
+    # slice of an index array of consecutive increasing rows, the array otherwise
+    if len(RowIDs)==0: return slice(0,0)
+    if RowIDs[-1]-RowIDs[0]+1==len(RowIDs) and (len(RowIDs)==1 or np.diff(RowIDs).min()==1):
+        return slice(int(RowIDs[0]),int(RowIDs[-1])+1)
+    return RowIDs
+
+def composeRowIDs(RowIDs,SubRowIDs):
+    # rows of the parent of a view at the rows SubRowIDs of the view
+    if isinstance(RowIDs,slice):
+        if isinstance(SubRowIDs,slice):
+            return slice(RowIDs.start+SubRowIDs.start,RowIDs.start+SubRowIDs.stop)
+        return SubRowIDs+RowIDs.start
+    return RowIDs[SubRowIDs]
+
+def createView(DestinationTableName,TableName,ParameterNames,RowIDs):
+    # Make the (new and empty) destination table of a select a view of the rows RowIDs of TableName.
+    header = LOCAL_TABLE_CACHE[DestinationTableName]['header']
+    header['number_of_rows'] = len(RowIDs)
+    RowIDs = getRowIDSlice(RowIDs)
+    source = LOCAL_TABLE_CACHE[TableName]
+    data = source['data']
+    if isinstance(source,TableView) and source.isView() and not data.assigned&set(ParameterNames):
+        # a view of a view is a view of the same parent
+        TableName = source.parent
+        RowIDs = composeRowIDs(data.row_ids,RowIDs)
+        data = data.parent_columns
+    columns = {par_name:data[par_name] for par_name in ParameterNames}
+    LOCAL_TABLE_CACHE[DestinationTableName] = TableView(TableName,header,columns,RowIDs)
+
+def materializeTable(TableName):
+    # Make a view or a union an ordinary table.
+    table = LOCAL_TABLE_CACHE.get(TableName)
+    if isinstance(table,TableView) or isinstance(table,TableUnion): table.materialize()
+
+def materializeViews(TableName):
+    # Materialize a table and the views and unions of it (also of its views
+    #  and unions), before editing its columns in place.
+    deriveColumns(TableName)
+    names = set([TableName])
+    while True:
+        dependent = set([name for name,table in LOCAL_TABLE_CACHE.items() if
+                         isinstance(table,TableView) and table.isView() and table.parent in names or
+                         isinstance(table,TableUnion) and table.isUnion() and names&set(table.parents)])
+        if dependent<=names: break
+        names |= dependent
+    for name in names:
+        materializeTable(name)
+
+# TABLE UNIONS
+# A union joins the rows of several tables without copying their columns:
+#  the rows are ordered by nu, merging the nu order of each table (see getNuIndex),
+#  and each column of the union is the columns of the tables at the rows of
+#  this order, gathered when rows of it are read. The nu order of the union
+#  is its nu index, so bounds on nu are found by binary search as usual.
+#  Columns of a union are read-only; a union is materialized like a view, and
+#  getColumn gives a gathered copy of a column, leaving the union as it is.
+
+class UnionColumn(object):
+    """
+    Column of a union: row i is row RowIDs[i] of the column of
+    table TableIDs[i], gathered when it is read.
+    """
+    def __init__(self,columns,TableIDs,RowIDs):
+        self.columns = columns
+        self.table_ids = TableIDs
+        self.row_ids = RowIDs
+        self.categorical = None
+        if not [column for column in columns if not isinstance(column,CategoricalColumn)]:
+            # codes of the labels of the tables in the labels of the union
+            self.categorical = CategoricalColumn([],[])
+            self.remaps = [np.zeros(0,dtype=np.int32) for column in columns]
+
+    @property
+    def dtype(self):
+        return np.result_type(*[column.dtype for column in self.columns])
+
+    @property
+    def shape(self):
+        return self.row_ids.shape
+
+    @property
+    def ndim(self):
+        return 1
+
+    def __len__(self):
+        return len(self.row_ids)
+
+    def __repr__(self):
+        return 'UnionColumn(%d values, %d tables)' % (len(self.row_ids),len(self.columns))
+
+    def __getitem__(self,key):
+        if np.ndim(key)==0 and not isinstance(key,slice):
+            return self.columns[self.table_ids[key]][self.row_ids[key]]
+        return self.gather(self.table_ids[key],self.row_ids[key])
+
+    def __setitem__(self,key,value):
+        raise Exception('Columns of a union are read-only, use materializeTable first')
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __array__(self,dtype=None,copy=None):
+        values = np.asarray(self[:])
+        return values if dtype is None else values.astype(dtype)
+
+    def tolist(self):
+        return list(self)
+
+    def copy(self):
+        return self[:]
+
+    def widen(self,par_format=None):
+        return UnionColumn([widenColumn(column,par_format) for column in self.columns],
+                           self.table_ids,self.row_ids)
+
+    def getRemap(self,TableID):
+        labels = self.columns[TableID].labels
+        remap = self.remaps[TableID]
+        if len(remap)<len(labels):
+            remap = np.concatenate([remap,np.array([self.categorical.getCode(label) for label in
+                                                    labels[len(remap):]],dtype=np.int32)])
+            self.remaps[TableID] = remap
+        return remap
+
+    def gather(self,TableIDs,RowIDs):
+        # rows of a part of the union, taken table by table
+        parts = [(TableID,TableIDs==TableID) for TableID in range(len(self.columns))]
+        if self.categorical is not None:
+            codes = np.empty(len(RowIDs),dtype=np.int32)
+            for TableID,mask in parts:
+                codes[mask] = self.getRemap(TableID)[self.columns[TableID].codes[RowIDs[mask]]]
+            column = self.categorical[:0]
+            column.codes = codes
+            return column
+        values = [(mask,self.columns[TableID][RowIDs[mask]]) for TableID,mask in parts]
+        column = np.empty(len(RowIDs),dtype=self.dtype)
+        for mask,part in values:
+            column[mask] = np.ma.getdata(part) if np.ma.isMaskedArray(part) else part
+        if [part for mask,part in values if np.ma.is_masked(part)]:
+            column = np.ma.array(column,mask=np.zeros(len(column),dtype=bool))
+            for mask,part in values:
+                column.mask[mask] = np.ma.getmaskarray(part)
+        return column
+
+class TableUnion(dict):
+    """
+    Entry of LOCAL_TABLE_CACHE holding the rows of several tables
+    in the order of nu until it is materialized.
+    """
+    def __init__(self,TableNames,header,data):
+        dict.__init__(self,header=header,data=data)
+        self.parents = list(TableNames)
+
+    def isUnion(self):
+        data = dict.__getitem__(self,'data')
+        return [par_name for par_name in data if isinstance(data[par_name],UnionColumn)]!=[]
+
+    def materialize(self):
+        data = dict.__getitem__(self,'data')
+        for par_name in list(data):
+            if isinstance(data[par_name],UnionColumn):
+                column = data[par_name][:]
+                data[par_name] = column.compact() if isinstance(column,CategoricalColumn) else column
+
+def mergeNuOrder(runs):
+    # Stable k-way merge of increasing arrays (NaN last), folded two at a time:
+    #  the run of each merged value, its position in the run and the merged values.
+    values = runs[0]
+    table_ids = np.zeros(len(values),dtype=np.int16)
+    positions = arange(len(values))
+    for TableID,run in enumerate(runs[1:],1):
+        # values of earlier runs go first among equal values
+        merged = np.searchsorted(run,values,'left')+arange(len(values))
+        merged_run = np.searchsorted(values,run,'right')+arange(len(run))
+        new_values = np.empty(len(values)+len(run),dtype=np.result_type(values,run))
+        new_values[merged],new_values[merged_run] = values,run
+        new_table_ids = np.empty(len(new_values),dtype=np.int16)
+        new_table_ids[merged],new_table_ids[merged_run] = table_ids,TableID
+        new_positions = np.empty(len(new_values),dtype=np.intp)
+        new_positions[merged],new_positions[merged_run] = positions,arange(len(run))
+        values,table_ids,positions = new_values,new_table_ids,new_positions
+    return table_ids,positions,values
+
+def unionTables(DestinationTableName,SourceTables):
+    """
+    INPUT PARAMETERS: 
+        DestinationTableName: name of resulting table           (required)
+        SourceTables:         list of names of tables to join   (required)
+    OUTPUT PARAMETERS: 
+        none
+    ---
+    DESCRIPTION:
+        Make a table of the rows of all SourceTables ordered by nu
+        (rows with equal nu in the order of SourceTables),
+        without copying the columns of the tables. The table has
+        the parameters common to all SourceTables, with the formats
+        of the first one. Its columns are gathered from the tables
+        when they are read; it can be used in select, sort, group
+        and the absorption coefficient functions like any other table.
+        Editing one of the SourceTables first makes the union an
+        ordinary table with its own copy of the rows.
+    ---
+    EXAMPLE OF USAGE:
+        unionTables('H2O_CO2',['H2O','CO2'])
+        absorptionCoefficient_Lorentz(SourceTables='H2O_CO2')
+    ---
+    """
+    SourceTables = listOfTuples(SourceTables)
+    if not SourceTables:
+        raise Exception('no tables to join')
+    for TableName in SourceTables:
+        if TableName not in LOCAL_TABLE_CACHE.keys():
+            raise Exception('%s: no such table. Check tableList() for more info.' % TableName)
+        if TableName==DestinationTableName:
+            raise Exception('Selecting into source table is forbidden')
+    headers = [LOCAL_TABLE_CACHE[TableName]['header'] for TableName in SourceTables]
+    order = [par_name for par_name in headers[0]['order']
+             if not [header for header in headers if par_name not in header['order']]]
+    lengths = [header['number_of_rows'] for header in headers]
+    columns = {}
+    for par_name in order:
+        columns[par_name] = []
+        for TableName,length in zip(SourceTables,lengths):
+            column = LOCAL_TABLE_CACHE[TableName]['data'][par_name]
+            if type(column)==list: column = np.asarray(column)
+            columns[par_name].append(column[:length])
+        kinds = set(['U' if column.dtype.kind in 'SU' else column.dtype.kind in 'biuf'
+                     for column in columns[par_name]])
+        if len(kinds)>1:
+            raise Exception('Parameter %s has different types in %s' % (par_name,SourceTables))
+    # the nu order of each table is merged; without it the rows are concatenated
+    indexes = [getNuIndex(TableName) for TableName in SourceTables]
+    if 'nu' in order and not [index for index,length in zip(indexes,lengths)
+                              if index is None or index['length']!=length]:
+        table_ids,positions,values = mergeNuOrder([index['values'] for index in indexes])
+        row_orders = [arange(length) if index['order'] is None else index['order']
+                      for index,length in zip(indexes,lengths)]
+        RowIDs = np.empty(len(positions),dtype=np.intp)
+        for TableID,row_order in enumerate(row_orders):
+            mask = table_ids==TableID
+            RowIDs[mask] = row_order[positions[mask]]
+        nu_index = {'length':len(RowIDs),'order':None,'values':values,
+                    'nan':len(values)>0 and bool(np.isnan(values[-1]))}
+    else:
+        table_ids = np.repeat(arange(len(SourceTables)).astype(np.int16),lengths)
+        RowIDs = np.concatenate([arange(length) for length in lengths])
+        nu_index = None
+    dropTable(DestinationTableName)
+    header = {'order':order,
+              'format':{par_name:headers[0]['format'][par_name] for par_name in order},
+              'default':{par_name:headers[0]['default'][par_name] for par_name in order},
+              'number_of_rows':len(RowIDs),'size_in_bytes':0,
+              'table_name':DestinationTableName,'table_type':'column-fixed'}
+    data = CaselessDict({par_name:UnionColumn(columns[par_name],table_ids,RowIDs) for par_name in order})
+    LOCAL_TABLE_CACHE[DestinationTableName] = TableUnion(SourceTables,header,data)
+    if nu_index is not None:
+        nu_index['columns'] = [data['nu']]
+        nu_index['snapshot'] = getIndexSnapshot([data['nu']])
+        TABLE_INDEXES.setdefault(DestinationTableName,{})['nu'] = nu_index
+
+# BLOCK ITERATION
+# Tables which don't fit into memory are processed block by block.
+
+DEFAULT_BLOCK_LINES = 100000
+
+# entries of LOCAL_TABLE_CACHE holding the blocks read from the text storage
+STREAM_BUFFER = '__STREAM_%d__'
+STREAM_BUFFER_IDS = itertools.count()
+
+def iterTableBlocks(TableName,BlockLines=DEFAULT_BLOCK_LINES):
+    """
+    INPUT PARAMETERS: 
+        TableName:   name of the table                        (required)
+        BlockLines:  maximal number of rows in one block      (optional)
+    OUTPUT PARAMETERS: 
+        Blocks: iterator over dictionaries of columns
+    ---
+    DESCRIPTION:
+        Iterate over the table in blocks of at most BlockLines rows.
+        Each block is a dictionary {parameter name: column}.
+        If the table is in memory, the blocks are slices of its columns.
+        Otherwise the blocks are read from the storage (or from the
+        binary cache of the table) one at a time, so only one block
+        is kept in memory.
+    ---
+    EXAMPLE OF USAGE:
+        for block in iterTableBlocks('sampletab',1000):
+            print(max(block['nu']))
+    ---
+    """
+    if BlockLines<1:
+        raise Exception('BlockLines must be positive')
+    if isTableLoaded(TableName):
+        data = LOCAL_TABLE_CACHE[TableName]['data']
+        yield from sliceBlocks(data,BlockLines)
+        return
+    fullpath_data,fullpath_header = getFullTableAndHeaderName(TableName)
+    if VARIABLES['SIDECAR_CACHE']:
+        result = loadSidecar(TableName,fullpath_data,fullpath_header)
+        if result is not None:
+            # columns of the binary cache are mapped, not read
+            yield from sliceBlocks(result[1],BlockLines)
+            return
+    # read the storage with storage2cache in block mode into a buffer
+    #  of its own; the entry of the table is left as it is
+    buffer_name = STREAM_BUFFER % next(STREAM_BUFFER_IDS)
+    try:
+        flag_EOF = False
+        while not flag_EOF:
+            flag_EOF = storage2cache(TableName,nlines=BlockLines,CacheName=buffer_name)
+            block = LOCAL_TABLE_CACHE[buffer_name]
+            if block['header']['number_of_rows']>0:
+                yield block['data']
+    finally:
+        block = LOCAL_TABLE_CACHE.pop(buffer_name,None)
+        if block is not None and block.get('filehandler') is not None:
+            block['filehandler'].close()
+
+def sliceBlocks(data,BlockLines):
+    if isinstance(data,DerivedColumns): data.derive()
+    par_names = list(data.keys())
+    if not par_names: return
+    nrows = len(data[par_names[0]])
+    for start in range(0,nrows,BlockLines):
+        yield CaselessDict({par_name:data[par_name][start:start+BlockLines]
+                            for par_name in par_names})
+
+def getTableBlocks(TableName,BlockLines=None):
+    # Whole table as a single block if BlockLines is not given.
+    if BlockLines is None:
+        return [LOCAL_TABLE_CACHE[TableName]['data']]
+    return iterTableBlocks(TableName,BlockLines)
+
+# PARALLEL LOADING
+# Tables are parsed in a pool of processes. Each worker writes the binary
+#  sidecar of its table and returns nothing but a status flag; the main
+#  process then maps the columns from the sidecars instead of receiving
+#  the arrays through pickles. Tables without a sidecar after the pool
+#  are reported and parsed by the main process.
+
+def hasValidSidecar(TableName):
+    fullpath_data,fullpath_header = getFullTableAndHeaderName(TableName)
+    manifest = loadSidecarManifest(fullpath_data,fullpath_header)
+    return manifest is not None and manifest.get('profile')==getStorageProfile(TableName)
+
+def buildSidecar(args):
+    # Runs in a worker process.
+    StorageName,TableName,Profile = args
+    VARIABLES['BACKEND_DATABASE_NAME'] = StorageName
+    TABLE_STORAGE_PROFILES[TableName] = Profile
+    try:
+        storage2cache(TableName)
+    except Exception:
+        # the error is raised again when the table is loaded serially
+        return False
+    finally:
+        LOCAL_TABLE_CACHE.pop(TableName,None)
+    return hasValidSidecar(TableName)
+
+def buildSidecars(table_names,processes):
+    # Parse the tables lacking a valid sidecar in a process pool.
+    table_names = [TableName for TableName in table_names
+                   if not hasValidSidecar(TableName)]
+    processes = min(processes,len(table_names))
+    if processes<2: return
+    args = [(VARIABLES['BACKEND_DATABASE_NAME'],TableName,getStorageProfile(TableName))
+            for TableName in table_names]
+    pool = multiprocessing.Pool(processes)
+    try:
+        valid = pool.map(buildSidecar,args,chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    failed = [TableName for TableName,flag in zip(table_names,valid) if not flag]
+    if failed:
+        warn('no binary cache was built in parallel for %s, loading serially' % ', '.join(failed))
+
+def loadCache(lazy=False,processes=None):
     print('Using '+VARIABLES['BACKEND_DATABASE_NAME']+'\n')
-    LOCAL_TABLE_CACHE = {}
     table_names = getTableNamesFromStorage(VARIABLES['BACKEND_DATABASE_NAME'])
     parfiles_without_header = scanForNewParfiles(VARIABLES['BACKEND_DATABASE_NAME'])
     # create headers for new parfiles
@@ -1330,9 +2853,17 @@ def loadCache():
         # get name without 'par' extension
         createHeader(tab_name)
         table_names.append(tab_name)
+    if processes is not None and processes!=1 and not lazy:
+        if VARIABLES['SIDECAR_CACHE']:
+            buildSidecars(table_names,processes or multiprocessing.cpu_count())
+        else:
+            warn('parallel loading requires VARIABLES[\'SIDECAR_CACHE\'], loading serially')
     for TableName in table_names:
         print(TableName)
-        storage2cache(TableName)
+        if lazy:
+            registerLazyTable(TableName)
+        else:
+            storage2cache(TableName)
 
 def saveCache():
     try:
@@ -1341,18 +2872,22 @@ def saveCache():
     except:
         pass
     for TableName in LOCAL_TABLE_CACHE:
+        # tables which were never loaded are unchanged in storage
+        if isinstance(LOCAL_TABLE_CACHE[TableName],LazyTable) and \
+           not LOCAL_TABLE_CACHE[TableName].isLoaded():
+            continue
         print(TableName)
         cache2storage(TableName)
 
 # DB backend level, start transaction
-def databaseBegin(db=None):
+def databaseBegin(db=None,lazy=False,processes=None):
     if db:
        VARIABLES['BACKEND_DATABASE_NAME'] = db
     else:
        VARIABLES['BACKEND_DATABASE_NAME'] = BACKEND_DATABASE_NAME_DEFAULT
     if not os.path.exists(VARIABLES['BACKEND_DATABASE_NAME']):
        os.mkdir(VARIABLES['BACKEND_DATABASE_NAME'])
-    loadCache()
+    loadCache(lazy,processes)
 
 # DB backend level, end transaction
 def databaseCommit():
@@ -1749,35 +3284,91 @@ def evaluateExpression(root,VarDictionary,GroupIndexKey=None):
 
 def evaluateExpression(root,VarDictionary,GroupIndexKey=None):
     # input = local tree root
-    # XXX: this could be very slow due to passing
-    #      every time VarDictionary as a parameter
-    # Two special cases: 1) root=varname
-    #                    2) root=list/tuple
-    # These cases must be processed in a separate way
+    # The expression is compiled once (see COMPILED EXPRESSIONS);
+    #  loops over rows should compile it themselves and call the result.
+    return compileExpression(root)(VarDictionary)
+
+# COMPILED EXPRESSIONS
+# An expression is compiled into nested closures taking the VarDictionary of
+#  a row: the operators are looked up and the arguments are bound once, so
+#  evaluating a row is a chain of plain function calls. Compiled expressions
+#  are cached by the structure of the expression (see getExpressionKey), so
+#  equal expressions built anew for every query are compiled only once.
+#  Errors (unknown operators, malformed nodes) are raised when the compiled
+#  expression is evaluated, as the interpreter did.
+
+COMPILED_EXPRESSIONS = {}
+COMPILED_EXPRESSIONS_LIMIT = 1000
+
+def getExpressionKey(root):
+    # hashable structure of an expression; lists and tuples are the same
+    #  nodes, the types of the constants are kept so that 1, 1.0 and True differ
+    if type(root) in set([list,tuple]):
+        return ('()',)+tuple(getExpressionKey(element) for element in root)
+    if type(root)==set:
+        return ('set',frozenset(root))
+    return (type(root).__name__,root)
+
+def compileExpression(root):
+    # Function of VarDictionary evaluating the expression.
+    try:
+        key = getExpressionKey(root)
+        function = COMPILED_EXPRESSIONS.get(key)
+    except TypeError:
+        # unhashable constants
+        key,function = None,None
+    if function is None:
+        function = compileExpressionNode(root)
+        if key is not None:
+            if len(COMPILED_EXPRESSIONS)>=COMPILED_EXPRESSIONS_LIMIT:
+                COMPILED_EXPRESSIONS.clear()
+            COMPILED_EXPRESSIONS[key] = function
+    return function
+
+def compileExpressionNode(root):
     if type(root) in set([list,tuple]):
         # root is not a leaf
-        head = root[0].upper()
-        # string constants are treated specially
-        if head in set(['STR','STRING']): # one arg
-            return operationSTR(root[1])
-        elif head in set(['SET']):
-            return operationSET(root[1])
-        tail = root[1:]
-        args = []
-        # evaluate arguments recursively
-        for element in tail: # resolve tree by recursion
-            args.append(evaluateExpression(element,VarDictionary,GroupIndexKey))
-        # call functions with evaluated arguments
         try:
-            return OPERATORS[head](args)
-        except KeyError:
-            raise Exception('Unknown operator: %s' % head)
+            head = root[0].upper()
+            # string constants are treated specially
+            if head in set(['STR','STRING']):
+                value = operationSTR(root[1])
+                return lambda VarDictionary: value
+            elif head in set(['SET']):
+                value = operationSET(root[1])
+                return lambda VarDictionary: value
+        except Exception as error:
+            return compileExpressionError(error)
+        arguments = [compileExpressionNode(element) for element in root[1:]]
+        operator = OPERATORS.get(head)
+        if operator is None:
+            def evaluate(VarDictionary):
+                for argument in arguments: argument(VarDictionary)
+                raise Exception('Unknown operator: %s' % head)
+            return evaluate
+        # the common arities avoid looping over the arguments
+        if len(arguments)==1:
+            argument1, = arguments
+            return lambda VarDictionary: operator([argument1(VarDictionary)])
+        if len(arguments)==2:
+            argument1,argument2 = arguments
+            return lambda VarDictionary: operator([argument1(VarDictionary),argument2(VarDictionary)])
+        if len(arguments)==3:
+            argument1,argument2,argument3 = arguments
+            return lambda VarDictionary: operator([argument1(VarDictionary),argument2(VarDictionary),
+                                                   argument3(VarDictionary)])
+        return lambda VarDictionary: operator([argument(VarDictionary) for argument in arguments])
     elif type(root)==str:
-       # root is a par_name
-       return VarDictionary[root]
-    else: 
-       # root is a non-string constant
-       return root
+        # root is a par_name
+        return itemgetter(root)
+    else:
+        # root is a non-string constant
+        return lambda VarDictionary: root
+
+def compileExpressionError(error):
+    def evaluate(VarDictionary):
+        raise error
+    return evaluate
 
 def getVarDictionary(RowObject):
     # get VarDict from RowObject
@@ -1790,7 +3381,7 @@ def getVarDictionary(RowObject):
 def checkRowObject(RowObject,Conditions,VarDictionary):
     #VarDictionary = getVarDictionary(RowObject)   
     if Conditions:
-       Flag = evaluateExpression(Conditions,VarDictionary)
+       Flag = compileExpression(Conditions)(VarDictionary)
     else:
        Flag=True
     return Flag
@@ -1905,6 +3496,25 @@ def newRowObject(ParameterNames,RowObject,VarDictionary,ContextFormat,GroupIndex
         RowObjectNew.append((par_name,par_value,par_format))
     return RowObjectNew
 
+def compileParameterNames(ParameterNames):
+    # (par_name,function of VarDictionary) for each item of ParameterNames,
+    #  named as in newRowObject
+    anoncount = 0
+    Expressions = []
+    for expr in ParameterNames:
+        if type(expr) in set([list,tuple]):
+           if expr[0] in set(['let','bind','LET','BIND']):
+              par_name = expr[1]
+              par_expr = expr[2]
+           else:
+              par_name = "#%d" % anoncount
+              anoncount += 1
+              par_expr = expr
+           Expressions.append((par_name,compileExpression(par_expr)))
+        else:
+           Expressions.append((expr,itemgetter(expr)))
+    return Expressions
+
 # ----------------------------------------------------
 # /PARAMETER NAMES
 # ----------------------------------------------------
@@ -1963,11 +3573,12 @@ def outputTable(TableName,Conditions=None,File=None,Header=True):
           OutputFile.write(headstr)
        else:
           print(headstr)
+    Condition = compileExpression(Conditions) if Conditions else None
     for RowID in range(0,LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']):
         RowObject = getRowObject(RowID,TableName)
         VarDictionary = getVarDictionary(RowObject)
         VarDictionary['LineNumber'] = RowID
-        if not checkRowObject(RowObject,Conditions,VarDictionary):
+        if Condition is not None and not Condition(VarDictionary):
            continue
         raw_string = putRowObjectToString(RowObject)
         if File:
@@ -2021,6 +3632,7 @@ def dropTable(TableName):
        del LOCAL_TABLE_CACHE[TableName]
     except:
        pass
+    invalidateTableIndex(TableName)
     # delete from storage
     pass # TODO
 
@@ -2036,12 +3648,19 @@ def getColumn(TableName,ParameterName):
     DESCRIPTION:
         Returns a column with a name ParameterName from
         table TableName. Column is returned as a list of values.
+        The column of a view is its own copy (see TableView),
+        the column of a union is a copy gathered from its tables
+        (see unionTables): writing to it doesn't change the union.
     ---
     EXAMPLE OF USAGE:
         p1 = getColumn('sampletab','p1')
     ---
     """
-    return LOCAL_TABLE_CACHE[TableName]['data'][ParameterName]
+    data = LOCAL_TABLE_CACHE[TableName]['data']
+    if isinstance(data,ViewColumns): return data.own(ParameterName)
+    column = data[ParameterName]
+    if isinstance(column,UnionColumn): return column[:]
+    return column
 
 # Returns a list of columns corresponding to parameter names
 def getColumns(TableName,ParameterNames):
@@ -2062,7 +3681,7 @@ def getColumns(TableName,ParameterNames):
     """
     Columns = []
     for par_name in ParameterNames:
-        Columns.append(LOCAL_TABLE_CACHE[TableName]['data'][par_name])
+        Columns.append(getColumn(TableName,par_name))
     return Columns
 
 def addColumn(TableName,ParameterName,Before=None,Expression=None,Type=None,Default=None,Format=None):
@@ -2077,11 +3696,12 @@ def addColumn(TableName,ParameterName,Before=None,Expression=None,Type=None,Defa
        LOCAL_TABLE_CACHE[TableName]['data'][ParameterName]=[Default for i in range(0,number_of_rows)]
     else:
        data = []
+       Function = compileExpression(Expression)
        for RowID in range(0,number_of_rows):
            RowObject = getRowObject(RowID,TableName)
            VarDictionary = getVarDictionary(RowObject)
            VarDictionary['LineNumber'] = RowID
-           par_value = evaluateExpression(Expression,VarDictionary)
+           par_value = Function(VarDictionary)
            data.append(par_value)
            LOCAL_TABLE_CACHE[TableName]['data'][ParameterName] = data
     # Mess with header
@@ -2129,8 +3749,9 @@ def deleteRows(TableName,ParameterNames,Conditions):
     pass
 
 # select from table to another table
-def selectInto(DestinationTableName,TableName,ParameterNames,Conditions):
+def selectInto(DestinationTableName,TableName,ParameterNames,Conditions,RowIDOffset=0,RowIDs=None):
     # TableName must refer to an existing table in cache!!
+    # RowIDs: rows to take in this order instead of the rows satisfying Conditions
     # Conditions = Restrictables in specific format
     # Sample conditions: cond = {'par1':{'range',[b_lo,b_hi]},'par2':b}
     # return structure similar to TableObject and put it to QUERY_BUFFER
@@ -2147,30 +3768,914 @@ def selectInto(DestinationTableName,TableName,ParameterNames,Conditions):
     # do full scan each time
     if DestinationTableName == TableName:
        raise Exception('Selecting into source table is forbidden')
+    # evaluate the query on whole columns if possible (see COLUMN-WISE EVALUATION);
+    #  anything the column-wise operators don't reproduce is done row by row
+    # the stages of a failed column-wise attempt are replaced by its time in the fallback
+    clock = getQueryClock()
+    start = clock()
+    stages = [dict(stage) for stage in QUERY_PROFILE['stages']] if QUERY_PROFILE is not None else None
+    try:
+        return selectColumnsInto(DestinationTableName,TableName,ParameterNames,Conditions,RowIDOffset,RowIDs)
+    except ColumnExpressionUnsupported as e:
+        if stages is not None: QUERY_PROFILE['stages'] = stages
+        addQueryStage('fallback','row',clock()-start,reason=str(e))
     table_length = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
     row_count = 0
-    for RowID in range(0,table_length):
+    if RowIDs is not None:
+        Conditions = None
+    else:
+        # rows out of the bounds on nu, of other keys of the hash indexes or
+        #  failing equality/LIKE tests on categorical columns are skipped
+        RowIDs = getCandidateRowIDs(TableName,Conditions)
+        RowIDs = arange(table_length) if RowIDs is None else RowIDs
+        mask = getCategoricalMask(Conditions,LOCAL_TABLE_CACHE[TableName]['data'])
+        if mask is not None:
+            RowIDs = getRowIDArray(RowIDs)[mask[RowIDs]]
+            addQueryStage('candidates','categorical mask',Selected=len(RowIDs))
+    RowIDs = getRowIDArray(RowIDs).tolist()
+    # the conditions and the expressions are compiled once for all rows
+    Condition = compileExpression(Conditions) if Conditions else None
+    Expressions = compileParameterNames(ParameterNames)
+    Columns = [(par_name,[]) for par_name in LOCAL_TABLE_CACHE[DestinationTableName]['header']['order']]
+    ColumnIndex = dict(Columns)
+    # the time of each part of the loop is only taken for a profiled query
+    times = [0.,0.,0.]
+    for RowID in RowIDs:
+        start = clock()
         RowObject = getRowObject(RowID,TableName)
         VarDictionary = getVarDictionary(RowObject)
-        VarDictionary['LineNumber'] = RowID
-        ContextFormat = getContextFormat(RowObject)
-        RowObjectNew = newRowObject(ParameterNames,RowObject,VarDictionary,ContextFormat)
-        if checkRowObject(RowObject,Conditions,VarDictionary):
-           addRowObject(RowObjectNew,DestinationTableName)
+        VarDictionary['LineNumber'] = RowID+RowIDOffset
+        checked = clock()
+        passed = Condition is None or Condition(VarDictionary)
+        evaluated = clock()
+        times[0] += checked-start; times[1] += evaluated-checked
+        if passed:
+           for par_name,Expression in Expressions:
+               ColumnIndex[par_name].append(Expression(VarDictionary))
            row_count += 1
-    LOCAL_TABLE_CACHE[DestinationTableName]['header']['number_of_rows'] += row_count
+           times[2] += clock()-evaluated
+    start = clock()
+    appendTableColumns(DestinationTableName,Columns,row_count)
+    if QUERY_PROFILE is not None:
+        addQueryStage('row objects','row',times[0],Selected=len(RowIDs))
+        addQueryStage('conditions','row',times[1],len(RowIDs),row_count,
+                      expressions=explainConditions(TableName,Conditions))
+        addQueryStage('expressions','row',times[2],Selected=row_count)
+        addQueryStage('output','row',clock()-start,Selected=row_count)
+
+# Conditions which can be tested on the codes of a categorical column.
+CATEGORICAL_EQUAL = set(['=','==','EQ','EQUAL','EQUALS'])
+CATEGORICAL_NOTEQUAL = set(['!=','<>','~=','NE','NOTEQUAL'])
+CATEGORICAL_MATCH = set(['MATCH','LIKE'])
+CATEGORICAL_SUBSET = set(['IN','SUBSET'])
+
+def getCategoricalMask(Conditions,data):
+    # Mask of the rows which can satisfy Conditions, found from the conjuncts
+    #  comparing a categorical column with a string constant; None if there are none.
+    if type(Conditions) not in set([list,tuple]) or not Conditions: return None
+    if str(Conditions[0]).upper() in set(['&','&&','AND']):
+        conjuncts = Conditions[1:]
+    else:
+        conjuncts = [Conditions]
+    mask = None
+    for conjunct in conjuncts:
+        conjunct_mask = getCategoricalConjunctMask(conjunct,data)
+        if conjunct_mask is None: continue
+        mask = conjunct_mask if mask is None else mask & conjunct_mask
+    return mask
+
+def getCategoricalConjunctMask(Condition,data):
+    if type(Condition) not in set([list,tuple]) or len(Condition)!=3: return None
+    def column(arg):
+        if type(arg)!=str: return None
+        value = data.get(arg)
+        return value if isinstance(value,CategoricalColumn) else None
+    def constant(arg,heads):
+        if type(arg) not in set([list,tuple]) or len(arg)!=2: return None
+        if type(arg[0])!=str or arg[0].upper() not in heads: return None
+        return arg[1]
+    head = str(Condition[0]).upper()
+    arg1,arg2 = Condition[1],Condition[2]
+    if head in CATEGORICAL_EQUAL or head in CATEGORICAL_NOTEQUAL:
+        if column(arg2) is not None: arg1,arg2 = arg2,arg1
+        value = constant(arg2,set(['STR','STRING']))
+        if column(arg1) is None or type(value)!=str: return None
+        mask = column(arg1).equal(value)
+        return mask if head in CATEGORICAL_EQUAL else ~mask
+    if head in CATEGORICAL_MATCH:
+        # the first argument is the regular expression (see operationMATCH)
+        pattern = constant(arg1,set(['STR','STRING']))
+        if column(arg2) is None or type(pattern)!=str: return None
+        return column(arg2).search(pattern)
+    if head in CATEGORICAL_SUBSET:
+        values = constant(arg2,set(['SET']))
+        if column(arg1) is None or type(values) not in set([list,tuple,set]): return None
+        return column(arg1).isin(values)
+    return None
+
+# WAVENUMBER INDEX
+# Sort order of the nu column of a table, used to resolve bounds on nu with
+#  binary search: the rows of a sorted table (the usual case) within a window
+#  form a contiguous slice. The index is built on first use and is kept while
+#  the nu column is the same array with the same values: cells can be written
+#  in place by any code holding the column, so the values are compared with a
+#  copy kept in the index before each use (see isIndexCurrent). setRowObject
+#  and cache2storageCells also drop the indexes of a table (see invalidateTableIndex).
+
+TABLE_INDEXES = {}
+
+def invalidateTableIndex(TableName):
+    TABLE_INDEXES.pop(TableName,None)
+
+def getIndexValues(column):
+    # values of a column an index is built on, as a plain array
+    if isinstance(column,UnionColumn): column = column[:]
+    if isinstance(column,CategoricalColumn): return column.codes
+    return column
+
+def getIndexSnapshot(columns):
+    # copies of the values of the columns of an index
+    return [np.array(getIndexValues(column)) for column in columns]
+
+def isIndexCurrent(index,columns):
+    # True if the columns of an index are the same arrays with the same values as when it was built
+    if len(columns)!=len(index['columns']): return False
+    for column,indexed,snapshot in zip(columns,index['columns'],index['snapshot']):
+        if column is not indexed: return False
+        values = getIndexValues(column)
+        if len(values)!=len(snapshot) or values.dtype!=snapshot.dtype: return False
+        if snapshot.dtype.kind=='f':
+            # floats are compared bit by bit, so that NaN values are equal
+            values = values.view('i%d' % values.dtype.itemsize)
+            snapshot = snapshot.view('i%d' % snapshot.dtype.itemsize)
+        if not np.array_equal(values,snapshot): return False
+    return True
+
+def getNuIndex(TableName):
+    # {'values': nu in increasing order (NaN last), 'order': row of each value,
+    #  None if the table is sorted, 'nan': True if nu has NaN values};
+    #  None if the table has no plain float nu column.
+    column = LOCAL_TABLE_CACHE[TableName]['data'].get('nu')
+    index = TABLE_INDEXES.get(TableName,{}).get('nu')
+    if index is not None and isIndexCurrent(index,[column]):
+        return index
+    if not isinstance(column,ndarray) or np.ma.isMaskedArray(column) or column.dtype.kind!='f':
+        return None
+    if np.all(column[1:]>=column[:-1]):
+        order,values = None,column
+    else:
+        order = np.argsort(column,kind='stable')
+        values = column[order]
+    index = {'columns':[column],'snapshot':getIndexSnapshot([column]),'length':len(column),
+             'order':order,'values':values,'nan':len(values)>0 and bool(np.isnan(values[-1]))}
+    TABLE_INDEXES.setdefault(TableName,{})['nu'] = index
+    return index
+
+# Bounds found in the conjuncts of Conditions: operator => for 'nu' on the
+#  left and a constant on the right, the np.searchsorted sides giving the
+#  first and the last index positions.
+NU_BOUND_SIDES = {}
+NU_BOUND_SIDES.update(dict.fromkeys(['<','LESS','LT'],(None,'left')))
+NU_BOUND_SIDES.update(dict.fromkeys(['<=','LESSOREQUAL','LTE'],(None,'right')))
+NU_BOUND_SIDES.update(dict.fromkeys(['>','MORE','MT'],('right',None)))
+NU_BOUND_SIDES.update(dict.fromkeys(['>=','MOREOREQUAL','MTE'],('left',None)))
+NU_BOUND_SIDES.update(dict.fromkeys(['=','==','EQ','EQUAL','EQUALS'],('left','right')))
+NU_BOUND_REVERSE = {'<':'>','LESS':'>','LT':'>','<=':'>=','LESSOREQUAL':'>=','LTE':'>=',
+                    '>':'<','MORE':'<','MT':'<','>=':'<=','MOREOREQUAL':'<=','MTE':'<='}
+
+def isNuBoundConstant(value):
+    return type(value) in set([int,float]) and value==value
+
+def getNuBounds(Condition):
+    # (value,start_side,stop_side) bounds of one conjunct of Conditions; the bounds
+    #  of comparison chains have a fourth item since NaN values pass them
+    if type(Condition) not in set([list,tuple]) or not Condition or type(Condition[0])!=str:
+        return []
+    head = Condition[0].upper()
+    args = Condition[1:]
+    if head in set(['RANGE','BETWEEN']) and len(args)==3 and args[0]=='nu' and \
+            isNuBoundConstant(args[1]) and isNuBoundConstant(args[2]):
+        return [(args[1],'left',None),(args[2],None,'right')]
+    if head not in NU_BOUND_SIDES or len(args)!=2: return []
+    if args[1]=='nu' and args[0]!='nu':
+        args = args[::-1]
+        head = NU_BOUND_REVERSE.get(head,head)
+    if args[0]!='nu' or not isNuBoundConstant(args[1]): return []
+    start_side,stop_side = NU_BOUND_SIDES[head]
+    return [(args[1],start_side,stop_side,'chain')]
+
+def getNuWindow(TableName,Conditions):
+    # Rows which can satisfy the bounds on nu among the conjuncts of Conditions:
+    #  a slice for a sorted table, an index array otherwise; None if there are no bounds.
+    if type(Conditions) not in set([list,tuple]) or not Conditions: return None
+    if type(Conditions[0])==str and Conditions[0].upper() in set(['&','&&','AND']):
+        conjuncts = Conditions[1:]
+    else:
+        conjuncts = [Conditions]
+    bounds = [bound for conjunct in conjuncts for bound in getNuBounds(conjunct)]
+    if not bounds: return None
+    index = getNuIndex(TableName)
+    if index is None: return None
+    if index['nan'] and [bound for bound in bounds if len(bound)>3]: return None
+    table_length = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
+    values = index['values']
+    start,stop = 0,len(values)
+    for bound in bounds:
+        value,start_side,stop_side = bound[:3]
+        if start_side: start = max(start,np.searchsorted(values,value,start_side))
+        if stop_side: stop = min(stop,np.searchsorted(values,value,stop_side))
+    stop = max(start,stop)
+    if index['order'] is None:
+        return slice(int(start),int(min(stop,table_length)))
+    RowIDs = np.sort(index['order'][start:stop])
+    return RowIDs[RowIDs<table_length]
+
+def getNuWindowMask(TableName,data,NuMin,NuMax):
+    # Mask of the lines of data (the table or one of its blocks) with nu in [NuMin,NuMax].
+    if data is LOCAL_TABLE_CACHE[TableName]['data']:
+        RowIDs = getNuWindow(TableName,('RANGE','nu',float(NuMin),float(NuMax)))
+        if RowIDs is not None:
+            mask = np.zeros(len(data['nu']),dtype=bool)
+            mask[RowIDs] = True
+            return mask
+    nu = np.asarray(data['nu'])
+    return (nu>=NuMin) & (nu<=NuMax)
+
+def getRowIDArray(RowIDs):
+    # index array of a slice of rows
+    if isinstance(RowIDs,slice): return arange(RowIDs.start,RowIDs.stop)
+    return RowIDs
+
+# HASH INDEXES
+# Rows of a table by the values of a few key columns, used to visit only the
+#  rows of some isotopologues, quanta or references: the equality and IN
+#  conjuncts of Conditions on the key columns pick the keys, and the rows of
+#  these keys are the only ones the conditions are evaluated on. Like the
+#  wavenumber index, an index is built on first use, kept while its columns
+#  are the same arrays with the same values (see isIndexCurrent) and dropped
+#  by invalidateTableIndex.
+
+HASH_INDEX_COLUMNS = {
+    'isotopologue' : ('molec_id','local_iso_id'),
+    'quanta' : ('global_upper_quanta','global_lower_quanta'),
+    'iref' : ('iref',),
+}
+
+def getHashIndex(TableName,IndexName):
+    # {'keys': tuples of the values of the key columns, 'rows': increasing
+    #  row numbers for each key}; None if the table lacks a key column or
+    #  has masked or float values in it.
+    table = LOCAL_TABLE_CACHE[TableName]
+    columns = [table['data'].get(par_name) for par_name in HASH_INDEX_COLUMNS[IndexName]]
+    table_length = table['header']['number_of_rows']
+    index = TABLE_INDEXES.get(TableName,{}).get(IndexName)
+    if index is not None and index['length']==table_length and isIndexCurrent(index,columns):
+        return index
+    # the columns of a union are gathered for the index
+    values = [column[:table_length] if isinstance(column,UnionColumn) else column for column in columns]
+    # float keys are left out: equality with them depends on the widening of narrow columns
+    if not all(isinstance(column,CategoricalColumn) or isinstance(column,ndarray) and
+               column.dtype.kind in 'biuU' for column in values) or \
+            [column for column in values if np.ma.isMaskedArray(column)]:
+        return None
+    # factorize the key columns into a single key number per row
+    inverse = np.zeros(table_length,dtype=np.int64)
+    uniques = []
+    for column in values:
+        if isinstance(column,CategoricalColumn):
+            labels,codes = column.labels,column.codes[:table_length]
+        else:
+            labels,codes = np.unique(column[:table_length],return_inverse=True)
+        uniques.append(np.asarray(labels,dtype=object))
+        inverse = inverse*len(labels)+codes.ravel()
+    order = np.argsort(inverse,kind='stable')
+    numbers = inverse[order]
+    starts = np.flatnonzero(np.r_[True,numbers[1:]!=numbers[:-1]]) if table_length else []
+    rows = np.split(order,starts[1:])
+    keys = []
+    for number in numbers[starts].tolist():
+        key = []
+        for labels in uniques[::-1]:
+            number,code = divmod(number,len(labels))
+            key.append(labels[code])
+        keys.append(tuple(item.item() if isinstance(item,np.generic) else item for item in key[::-1]))
+    index = {'columns':columns,'snapshot':getIndexSnapshot(values),'length':table_length,
+             'keys':keys,'rows':dict(zip(keys,rows))}
+    TABLE_INDEXES.setdefault(TableName,{})[IndexName] = index
+    return index
+
+def getHashIndexConstant(arg):
+    # value of a constant argument of a condition, None if it isn't one
+    if type(arg) in set([int,float]): return arg
+    if type(arg) in set([list,tuple]) and len(arg)==2 and type(arg[0])==str and \
+            arg[0].upper() in set(['STR','STRING']) and type(arg[1])==str:
+        return arg[1]
+    return None
+
+def getHashIndexValues(Conditions):
+    # {par_name: values} allowed by the equality and IN conjuncts of Conditions
+    #  comparing a parameter with constants
+    if type(Conditions) not in set([list,tuple]) or not Conditions: return {}
+    if type(Conditions[0])==str and Conditions[0].upper() in set(['&','&&','AND']):
+        conjuncts = Conditions[1:]
+    else:
+        conjuncts = [Conditions]
+    values = {}
+    for conjunct in conjuncts:
+        if type(conjunct) not in set([list,tuple]) or len(conjunct)!=3 or type(conjunct[0])!=str:
+            continue
+        head = conjunct[0].upper()
+        arg1,arg2 = conjunct[1],conjunct[2]
+        if head in CATEGORICAL_EQUAL:
+            if type(arg1)!=str: arg1,arg2 = arg2,arg1
+            value = getHashIndexConstant(arg2)
+            if type(arg1)!=str or value is None: continue
+            allowed = set([value])
+        elif head in CATEGORICAL_SUBSET:
+            if type(arg1)!=str or type(arg2) not in set([list,tuple]) or len(arg2)!=2 or \
+                    type(arg2[0])!=str or arg2[0].upper()!='SET' or \
+                    type(arg2[1]) not in set([list,tuple,set]):
+                continue
+            allowed = set(arg2[1])
+        else:
+            continue
+        values[arg1] = values[arg1] & allowed if arg1 in values else allowed
+    return values
+
+def getHashIndexRowIDs(TableName,Conditions):
+    # Increasing numbers of the rows which can satisfy the equality and IN
+    #  conjuncts of Conditions on indexed columns; None if there are none.
+    values = getHashIndexValues(Conditions)
+    RowIDs = None
+    for IndexName,par_names in HASH_INDEX_COLUMNS.items():
+        if not set(par_names)&set(values): continue
+        index = getHashIndex(TableName,IndexName)
+        if index is None: continue
+        rows = [index['rows'][key] for key in index['keys']
+                if all(par_name not in values or item in values[par_name]
+                       for par_name,item in zip(par_names,key))]
+        rows = np.sort(np.concatenate(rows)) if rows else np.zeros(0,dtype=np.intp)
+        RowIDs = rows if RowIDs is None else np.intersect1d(RowIDs,rows,assume_unique=True)
+    return RowIDs
+
+def getIsotopologueRowIDs(TableName,data,Isotopologues):
+    # Increasing numbers of the lines of data (the table or one of its blocks)
+    #  of the (molec_id,local_iso_id) pairs in Isotopologues.
+    if data is LOCAL_TABLE_CACHE[TableName]['data']:
+        index = getHashIndex(TableName,'isotopologue')
+        if index is not None:
+            rows = [index['rows'][key] for key in Isotopologues if key in index['rows']]
+            return np.sort(np.concatenate(rows)) if rows else np.zeros(0,dtype=np.intp)
+    mask = np.zeros(len(data['nu']),dtype=bool)
+    for M,I in Isotopologues:
+        mask |= (np.asarray(data['molec_id'])==M) & (np.asarray(data['local_iso_id'])==I)
+    return np.flatnonzero(mask)
+
+def getCandidateRowIDs(TableName,Conditions):
+    # Rows within the bounds on nu and of the keys allowed by the hash indexes:
+    #  a slice or an index array, None if Conditions restrict neither.
+    clock = getQueryClock()
+    start = clock()
+    RowIDs = getNuWindow(TableName,Conditions)
+    rows = getHashIndexRowIDs(TableName,Conditions)
+    methods = [method for method,found in [('nu index',RowIDs),('hash index',rows)] if found is not None]
+    if rows is None:
+        pass
+    elif RowIDs is None:
+        RowIDs = rows
+    elif isinstance(RowIDs,slice):
+        RowIDs = rows[(rows>=RowIDs.start) & (rows<RowIDs.stop)]
+    else:
+        RowIDs = np.intersect1d(RowIDs,rows,assume_unique=True)
+    if QUERY_PROFILE is not None:
+        table_length = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
+        addQueryStage('candidates',', '.join(methods) or 'full scan',clock()-start,table_length,
+                      table_length if RowIDs is None else len(getRowIDArray(RowIDs)))
+    return RowIDs
+
+# COLUMN-WISE EVALUATION
+# Conditions and ParameterNames expressions are evaluated on whole columns:
+#  every node of the expression tree gives a column (or a constant) and the
+#  logical operators give boolean masks, so the tree is walked once per query
+#  instead of once per row. The operators follow the row interpreter above
+#  (operationXXX), NaN comparisons included. Operators without a column-wise
+#  version (SEARCH, FINDALL, COUNT), masked values and the comparisons of strings
+#  with numbers raise ColumnExpressionUnsupported; selectInto then falls back
+#  to evaluating the rows one by one.
+
+class ColumnExpressionUnsupported(Exception):
+    pass
+
+def getColumnKind(value):
+    # 'str' or 'number' for the values the column-wise operators accept, None otherwise
+    if isinstance(value,CategoricalColumn): return 'str'
+    if isinstance(value,ndarray):
+        if value.dtype.kind=='U': return 'str'
+        if value.dtype.kind in 'biuf': return 'number'
+        return None
+    if isinstance(value,str): return 'str'
+    if isinstance(value,(bool,int,float,np.number,np.bool_)): return 'number'
+    return None
+
+def isColumn(value):
+    return isinstance(value,(ndarray,CategoricalColumn))
+
+def columnTruth(value):
+    # bool() of every item
+    if isinstance(value,CategoricalColumn):
+        flags = np.array([bool(label) for label in value.labels],dtype=bool)
+        return flags[value.codes]
+    kind = getColumnKind(value)
+    if kind is None:
+        raise ColumnExpressionUnsupported('no truth value for %s' % type(value))
+    if not isinstance(value,ndarray): return bool(value)
+    if kind=='str': return np.char.str_len(value)>0
+    return value.astype(bool)
+
+def compareColumns(arg1,arg2,ufunc):
+    kind = getColumnKind(arg1)
+    if kind is None or kind!=getColumnKind(arg2):
+        raise ColumnExpressionUnsupported('comparison of %s and %s' % (type(arg1),type(arg2)))
+    if ufunc in set([np.equal,np.not_equal]):
+        # equality tests on a categorical column are done on its codes
+        if isinstance(arg2,CategoricalColumn) and isinstance(arg1,str): arg1,arg2 = arg2,arg1
+        if isinstance(arg1,CategoricalColumn) and isinstance(arg2,str):
+            mask = arg1.equal(arg2)
+            return mask if ufunc is np.equal else ~mask
+    if isinstance(arg1,CategoricalColumn): arg1 = np.asarray(arg1)
+    if isinstance(arg2,CategoricalColumn): arg2 = np.asarray(arg2)
+    return ufunc(arg1,arg2)
+
+def columnAND(args):
+    mask = True
+    for arg in args:
+        mask = mask & columnTruth(arg)
+    return mask
+
+def columnOR(args):
+    mask = False
+    for arg in args:
+        mask = mask | columnTruth(arg)
+    return mask
+
+def columnNOT(arg):
+    return np.logical_not(columnTruth(arg))
+
+def columnRANGE(x,x_min,x_max):
+    return compareColumns(x_min,x,np.less_equal) & compareColumns(x,x_max,np.less_equal)
+
+def columnSUBSET(arg1,arg2):
+    # arg2 must be a constant list (SET); its items of another kind never compare equal
+    if type(arg2)!=list:
+        raise ColumnExpressionUnsupported('IN needs a set of constants')
+    if isinstance(arg1,CategoricalColumn): return arg1.isin(arg2)
+    kind = getColumnKind(arg1)
+    if kind is None:
+        raise ColumnExpressionUnsupported('IN on %s' % type(arg1))
+    if not isinstance(arg1,ndarray): return arg1 in arg2
+    values = [value for value in arg2 if getColumnKind(value)==kind]
+    if not values: return np.zeros(len(arg1),dtype=bool)
+    return np.isin(arg1,values)
+
+def columnChain(args,ufunc):
+    # the row interpreter fails a chain when the negated test (ufunc) holds
+    mask = True
+    for i in range(1,len(args)):
+        mask = mask & np.logical_not(compareColumns(args[i-1],args[i],ufunc))
+    return mask
+
+def columnArithmetic(args,ufunc):
+    for arg in args:
+        if getColumnKind(arg)!='number':
+            raise ColumnExpressionUnsupported('arithmetic on %s' % type(arg))
+    result = args[0]
+    for arg in args[1:]:
+        result = ufunc(result,arg)
+    return result
+
+def columnSUM(args):
+    if all(getColumnKind(arg)=='str' for arg in args):
+        # string concatenation
+        result = args[0]
+        for arg in args[1:]:
+            result = np.char.add(np.asarray(result),np.asarray(arg))
+        return result
+    return columnArithmetic(args,np.add)
+
+def columnMATCH(arg1,arg2):
+    # Match regex (arg1) and string (arg2)
+    if type(arg1)!=str:
+        raise ColumnExpressionUnsupported('MATCH needs a constant regular expression')
+    if isinstance(arg2,str): return bool(re.search(arg1,arg2))
+    if getColumnKind(arg2)!='str':
+        raise ColumnExpressionUnsupported('MATCH on %s' % type(arg2))
+    return asCategorical(arg2).search(arg1)
+
+def columnLIST(args):
+    if len([arg for arg in args if isColumn(arg)]):
+        raise ColumnExpressionUnsupported('LIST of columns')
+    return list(args)
+
+COLUMN_OPERATORS = {\
+'LIST' : lambda args : columnLIST(args),
+'&' : lambda args : columnAND(args),
+'&&' : lambda args : columnAND(args),
+'AND' : lambda args : columnAND(args),
+'|' : lambda args : columnOR(args),
+'||' : lambda args : columnOR(args),
+'OR' : lambda args : columnOR(args),
+'!' : lambda args : columnNOT(args[0]),
+'NOT' : lambda args : columnNOT(args[0]),
+'RANGE' : lambda args : columnRANGE(args[0],args[1],args[2]),
+'BETWEEN' : lambda args : columnRANGE(args[0],args[1],args[2]),
+'IN' : lambda args : columnSUBSET(args[0],args[1]),
+'SUBSET': lambda args : columnSUBSET(args[0],args[1]),
+'<' : lambda args : columnChain(args,np.greater_equal),
+'LESS' : lambda args : columnChain(args,np.greater_equal),
+'LT'  : lambda args : columnChain(args,np.greater_equal),
+'>' : lambda args : columnChain(args,np.less_equal),
+'MORE' : lambda args : columnChain(args,np.less_equal),
+'MT'   : lambda args : columnChain(args,np.less_equal),
+'<=' : lambda args : columnChain(args,np.greater),
+'LESSOREQUAL' : lambda args : columnChain(args,np.greater),
+'LTE' : lambda args : columnChain(args,np.greater),
+'>=' : lambda args : columnChain(args,np.less),
+'MOREOREQUAL' : lambda args : columnChain(args,np.less),
+'MTE' : lambda args : columnChain(args,np.less),
+'=' : lambda args : columnChain(args,np.not_equal),
+'==' : lambda args : columnChain(args,np.not_equal),
+'EQ' : lambda args : columnChain(args,np.not_equal),
+'EQUAL' : lambda args : columnChain(args,np.not_equal),
+'EQUALS' : lambda args : columnChain(args,np.not_equal),
+'!=' : lambda args : compareColumns(args[0],args[1],np.not_equal),
+'<>' : lambda args : compareColumns(args[0],args[1],np.not_equal),
+'~=' : lambda args : compareColumns(args[0],args[1],np.not_equal),
+'NE' : lambda args : compareColumns(args[0],args[1],np.not_equal),
+'NOTEQUAL' : lambda args : compareColumns(args[0],args[1],np.not_equal),
+'+' : lambda args : columnSUM(args),
+'SUM' : lambda args : columnSUM(args),
+'-' : lambda args : columnArithmetic(args[:2],np.subtract),
+'DIFF' : lambda args : columnArithmetic(args[:2],np.subtract),
+'*' : lambda args : columnArithmetic(args,np.multiply),
+'MUL' : lambda args : columnArithmetic(args,np.multiply),
+'/' : lambda args : columnArithmetic(args[:2],np.true_divide),
+'DIV' : lambda args : columnArithmetic(args[:2],np.true_divide),
+'MATCH' : lambda args : columnMATCH(args[0],args[1]),
+'LIKE' : lambda args : columnMATCH(args[0],args[1]),
+}
+
+def evaluateColumnExpression(root,getColumn):
+    # Column-wise evaluateExpression; getColumn(par_name) gives the column of a parameter.
+    if type(root) in set([list,tuple]):
+        head = root[0].upper()
+        if head in set(['STR','STRING']):
+            return operationSTR(root[1])
+        elif head in set(['SET']):
+            return operationSET(root[1])
+        args = [evaluateColumnExpression(element,getColumn) for element in root[1:]]
+        try:
+            operator = COLUMN_OPERATORS[head]
+        except KeyError:
+            raise ColumnExpressionUnsupported('operator %s' % head)
+        return operator(args)
+    elif type(root)==str:
+        return getColumn(root)
+    else:
+        return root
+
+def getExpressionColumn(TableName,par_name,RowIDs=None,RowIDOffset=0):
+    # Column of a parameter at RowIDs (an index array or a slice; all rows if None)
+    #  as the expressions see it: narrow columns are upcast like the values of getRowObject.
+    header = LOCAL_TABLE_CACHE[TableName]['header']
+    if RowIDs is None: RowIDs = slice(0,header['number_of_rows'])
+    if par_name=='LineNumber':
+        return getRowIDArray(RowIDs)+RowIDOffset
+    if par_name not in header['order']:
+        raise ColumnExpressionUnsupported('no parameter %s' % par_name)
+    column = LOCAL_TABLE_CACHE[TableName]['data'][par_name]
+    if type(column)==list: column = np.asarray(column)
+    column = column[RowIDs]
+    if np.ma.is_masked(column):
+        raise ColumnExpressionUnsupported('masked values in %s' % par_name)
+    return widenColumn(np.ma.getdata(column) if np.ma.isMaskedArray(column) else column)
+
+def getConditionRowIDs(TableName,Conditions,RowIDOffset=0):
+    # Indices of the rows of a table satisfying Conditions, evaluated column-wise
+    #  on the rows within the bounds on nu and of the keys allowed by the hash
+    #  indexes (see getCandidateRowIDs).
+    table_length = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
+    if not Conditions: return arange(table_length)
+    RowIDs = getCandidateRowIDs(TableName,Conditions)
+    if RowIDs is None: RowIDs = slice(0,table_length)
+    clock = getQueryClock()
+    start = clock()
+    getColumn = lambda par_name: getExpressionColumn(TableName,par_name,RowIDs,RowIDOffset)
+    with np.errstate(all='ignore'):
+        mask = columnTruth(evaluateColumnExpression(Conditions,getColumn))
+    RowIDs = getRowIDArray(RowIDs)
+    SelectedRowIDs = RowIDs[np.broadcast_to(mask,RowIDs.shape)]
+    if QUERY_PROFILE is not None:
+        addQueryStage('conditions','column',clock()-start,len(RowIDs),len(SelectedRowIDs),
+                      expressions=explainConditions(TableName,Conditions))
+    return SelectedRowIDs
+
+def concatenateColumns(column1,column2):
+    if len(column1)==0: return column2
+    if len(column2)==0: return column1
+    if isinstance(column1,CategoricalColumn) or isinstance(column2,CategoricalColumn):
+        if isinstance(column2,CategoricalColumn) and getattr(column1,'labels',None) is column2.labels:
+            column = column1[:]
+            column.codes = np.concatenate([column1.codes,column2.codes])
+            return column
+        return CategoricalColumn.encode(np.concatenate([np.asarray(column1),np.asarray(column2)]))
+    if np.ma.isMaskedArray(column1) or np.ma.isMaskedArray(column2):
+        return np.ma.concatenate([column1,column2])
+    return np.concatenate([column1,column2])
+
+def appendTableColumns(TableName,Columns,Count):
+    # Append Count rows given as (par_name,column) pairs to a table.
+    materializeTable(TableName)
+    data = LOCAL_TABLE_CACHE[TableName]['data']
+    data.update([(par_name,concatenateColumns(data[par_name],column)) for par_name,column in Columns])
+    LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows'] += Count
+
+def selectColumnsInto(DestinationTableName,TableName,ParameterNames,Conditions,RowIDOffset=0,RowIDs=None):
+    # Column-wise selectInto: the selected rows are gathered with index arrays.
+    # Raises ColumnExpressionUnsupported before touching the destination.
+    header = LOCAL_TABLE_CACHE[TableName]['header']
+    if RowIDs is None: RowIDs = getConditionRowIDs(TableName,Conditions,RowIDOffset)
+    clock = getQueryClock()
+    start = clock()
+    if VARIABLES['SELECT_VIEWS'] and TableName!=BLOCK_BUFFER and \
+            LOCAL_TABLE_CACHE[DestinationTableName]['header']['number_of_rows']==0 and \
+            all(type(expr)==str and expr in header['order'] for expr in ParameterNames):
+        createView(DestinationTableName,TableName,ParameterNames,RowIDs)
+        addQueryStage('output','view',clock()-start,Selected=len(RowIDs))
+        return
+    getColumn = lambda par_name: getExpressionColumn(TableName,par_name,RowIDs,RowIDOffset)
+    Columns = []
+    anoncount = 0
+    for expr in ParameterNames:
+        if type(expr) in set([list,tuple]):
+            if expr[0] in set(['let','bind','LET','BIND']):
+                par_name = expr[1]
+                par_expr = expr[2]
+            else:
+                par_name = "#%d" % anoncount
+                anoncount += 1
+                par_expr = expr
+            with np.errstate(all='ignore'):
+                column = evaluateColumnExpression(par_expr,getColumn)
+            if not isColumn(column):
+                if getColumnKind(column) is None:
+                    raise ColumnExpressionUnsupported('value of %s' % par_name)
+                column = np.full(len(RowIDs),column)
+        else:
+            par_name = expr
+            if par_name not in header['order']:
+                raise ColumnExpressionUnsupported('no parameter %s' % par_name)
+            column = LOCAL_TABLE_CACHE[TableName]['data'][par_name]
+            if type(column)==list: column = np.asarray(column)
+            column = column[RowIDs]
+        Columns.append((par_name,column))
+    appendTableColumns(DestinationTableName,Columns,len(RowIDs))
+    addQueryStage('output','column',clock()-start,Selected=len(RowIDs))
+
+BLOCK_BUFFER = '__BLOCK__'
+
+# select from table to another table reading the source block by block
+def selectBlocksInto(DestinationTableName,TableName,ParameterNames,Conditions,BlockLines):
+    if DestinationTableName == TableName:
+       raise Exception('Selecting into source table is forbidden')
+    header = LOCAL_TABLE_CACHE[TableName]['header']
+    RowIDOffset = 0
+    try:
+        for block in iterTableBlocks(TableName,BlockLines):
+            block_length = len(block['nu']) if 'nu' in block else len(block[header['order'][0]])
+            LOCAL_TABLE_CACHE[BLOCK_BUFFER] = {'header':dict(header,number_of_rows=block_length),
+                                               'data':block}
+            selectInto(DestinationTableName,BLOCK_BUFFER,ParameterNames,Conditions,RowIDOffset)
+            RowIDOffset += block_length
+    finally:
+        LOCAL_TABLE_CACHE.pop(BLOCK_BUFFER,None)
+
+# select from table to the storage of another table block by block:
+#  the rows selected from each block are written to the data file
+#  and dropped, so only one block of the source and of the result
+#  is kept in memory. The destination becomes a lazy table.
+def selectBlocksToStorage(DestinationTableName,TableName,ParameterNames,Conditions,BlockLines,Compression=None):
+    if DestinationTableName == TableName:
+       raise Exception('Selecting into source table is forbidden')
+    try:
+       os.mkdir(VARIABLES['BACKEND_DATABASE_NAME'])
+    except:
+       pass
+    header = LOCAL_TABLE_CACHE[TableName]['header']
+    destination = LOCAL_TABLE_CACHE[DestinationTableName]
+    order = destination['header']['order']
+    formats = [destination['header']['format'][par_name] for par_name in order]
+    fullpath_data = getStorageFileName(DestinationTableName,Compression)
+    fullpath_header = VARIABLES['BACKEND_DATABASE_NAME'] + '/' + DestinationTableName + '.header'
+    line_number = 0
+    RowIDOffset = 0
+    with openStorageFile(fullpath_data,'w') as OutfileData:
+        try:
+            for block in iterTableBlocks(TableName,BlockLines):
+                block_length = len(block['nu']) if 'nu' in block else len(block[header['order'][0]])
+                LOCAL_TABLE_CACHE[BLOCK_BUFFER] = {'header':dict(header,number_of_rows=block_length),
+                                                   'data':block}
+                destination['data'] = {par_name:[] for par_name in order}
+                destination['header']['number_of_rows'] = 0
+                selectInto(DestinationTableName,BLOCK_BUFFER,ParameterNames,Conditions,RowIDOffset)
+                count = destination['header']['number_of_rows']
+                bulkWriteColumnFixed(OutfileData,[destination['data'][par_name] for par_name in order],
+                                     formats,count)
+                line_number += count
+                RowIDOffset += block_length
+        finally:
+            LOCAL_TABLE_CACHE.pop(BLOCK_BUFFER,None)
+    removeStaleStorageFiles(fullpath_data)
+    destination['data'] = {par_name:[] for par_name in order}
+    destination['header']['number_of_rows'] = line_number
+    with open(fullpath_header,'w') as OutfileHeader:
+        OutfileHeader.write(json.dumps(destination['header'],indent=2))
+    registerLazyTable(DestinationTableName)
+
+# QUERY PROFILER
+# With Explain=True select, sort and group return the plan of a query without
+#  running it; with Profile=True they run it and return the plan as it was done.
+#  A plan is a dictionary of plain values, so it can be saved or sent to the GUI:
+#  {'query','table','destination','rows','stages','rows_scanned','rows_selected','time'}.
+#  Each stage has the 'stage' and the 'method' used for it, the numbers of rows it
+#  'scanned' and 'selected' and its 'time' in seconds (zero in a plan which was not run);
+#  conditions have the method of each of their conjuncts in 'expressions'.
+# The stages of the query being profiled are recorded in QUERY_PROFILE.
+
+QUERY_PROFILE = None
+
+def getQueryClock():
+    # clock for the stages of a profiled query, a constant otherwise
+    return perf_counter if QUERY_PROFILE is not None else lambda: 0.
+
+def newQueryPlan(Query,TableName,DestinationTableName):
+    return {'query':Query,'table':TableName,'destination':DestinationTableName,
+            'rows':int(LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']),'stages':[]}
+
+def addQueryStage(Stage,Method,Time=0.,Scanned=None,Selected=None,**Info):
+    # Record a stage of the query being profiled; a stage repeated
+    #  for the blocks of a table is added up.
+    if QUERY_PROFILE is None: return
+    stages = [stage for stage in QUERY_PROFILE['stages'] if stage['stage']==Stage and stage['method']==Method]
+    if stages:
+        stage = stages[0]
+    else:
+        stage = {'stage':Stage,'method':Method,'time':0.}
+        QUERY_PROFILE['stages'].append(stage)
+    stage['time'] += Time
+    if Scanned is not None: stage['scanned'] = stage.get('scanned',0)+int(Scanned)
+    if Selected is not None: stage['selected'] = stage.get('selected',0)+int(Selected)
+    stage.update(Info)
+
+def finishQueryPlan(plan):
+    # rows read by the conditions (all rows of the table if there are none) and in the result
+    scanned = [stage['scanned'] for stage in plan['stages'] if stage['stage']=='conditions' and 'scanned' in stage]
+    plan['rows_scanned'] = sum(scanned) if scanned else plan['rows']
+    destination = LOCAL_TABLE_CACHE.get(plan['destination'])
+    plan['rows_selected'] = int(destination['header']['number_of_rows']) if destination else None
+    return plan
+
+def profileQuery(Query,TableName,DestinationTableName,Function,*args):
+    # Run a query with its stages recorded and return its plan.
+    global QUERY_PROFILE
+    QUERY_PROFILE = newQueryPlan(Query,TableName,DestinationTableName)
+    start = perf_counter()
+    try:
+        Function(*args)
+    finally:
+        plan,QUERY_PROFILE = QUERY_PROFILE,None
+    plan['time'] = perf_counter()-start
+    return finishQueryPlan(plan)
+
+def getConjuncts(Conditions):
+    if type(Conditions) not in set([list,tuple]) or not Conditions: return []
+    if type(Conditions[0])==str and Conditions[0].upper() in set(['&','&&','AND']):
+        return list(Conditions[1:])
+    return [Conditions]
+
+def isColumnExpression(TableName,root):
+    # True if an expression can be evaluated on the columns of the table
+    #  (see COLUMN-WISE EVALUATION). It is tried on the first row of a table
+    #  in memory; the columns of a table which is not are only checked by name.
+    if isTableLoaded(TableName) and type(root) in set([list,tuple]):
+        try:
+            with np.errstate(all='ignore'):
+                evaluateColumnExpression(root,lambda par_name: getExpressionColumn(TableName,par_name,slice(0,1)))
+        except ColumnExpressionUnsupported:
+            return False
+    if type(root) in set([list,tuple]):
+        head = str(root[0]).upper()
+        if head in set(['STR','STRING','SET']): return True
+        return head in COLUMN_OPERATORS and all([isColumnExpression(TableName,arg) for arg in root[1:]])
+    if type(root)==str:
+        if root=='LineNumber': return True
+        if root not in LOCAL_TABLE_CACHE[TableName]['header']['order']: return False
+        return not isTableLoaded(TableName) or not np.ma.is_masked(LOCAL_TABLE_CACHE[TableName]['data'][root])
+    return True
+
+def explainConditions(TableName,Conditions):
+    # Method of each conjunct of Conditions: the bounds on nu and the keys of hash indexes
+    #  give the rows which are checked column-wise, other conjuncts are evaluated on columns
+    #  or row by row. The indexes of a table which is not in memory are built for each block.
+    loaded = isTableLoaded(TableName)
+    indexed = set([par_name for par_names in HASH_INDEX_COLUMNS.values() for par_name in par_names])
+    expressions = []
+    for conjunct in getConjuncts(Conditions):
+        if getNuBounds(conjunct) and (not loaded or getNuIndex(TableName) is not None):
+            method = 'nu index'
+        elif set(getHashIndexValues(conjunct))&indexed and \
+                (not loaded or getHashIndexRowIDs(TableName,conjunct) is not None):
+            method = 'hash index'
+        elif isColumnExpression(TableName,conjunct):
+            method = 'column'
+        else:
+            method = 'row'
+        expressions.append({'expression':str(conjunct),'method':method})
+    return expressions
+
+def getParameterExpression(expr):
+    # expression of an item of ParameterNames
+    if type(expr) in set([list,tuple]) and expr[0] in set(['let','bind','LET','BIND']): return expr[2]
+    return expr
+
+def explainSelect(TableName,DestinationTableName,ParameterNames,Conditions,BlockLines,Storage):
+    plan = newQueryPlan('select',TableName,DestinationTableName)
+    header = LOCAL_TABLE_CACHE[TableName]['header']
+    blocks = Storage or BlockLines is not None
+    if blocks:
+        plan['stages'].append({'stage':'blocks','method':'memory' if isTableLoaded(TableName) else 'storage',
+                               'lines':BlockLines or DEFAULT_BLOCK_LINES,'time':0.})
+    expressions = explainConditions(TableName,Conditions)
+    methods = set([expression['method'] for expression in expressions])
+    row = 'row' in methods or \
+        not all([isColumnExpression(TableName,getParameterExpression(expr)) for expr in ParameterNames])
+    if Conditions:
+        candidates = {'stage':'candidates','method':', '.join([method for method in ['nu index','hash index']
+                                                            if method in methods]) or 'full scan','time':0.}
+        if not blocks:
+            RowIDs = getCandidateRowIDs(TableName,Conditions)
+            candidates['scanned'] = plan['rows']
+            candidates['selected'] = plan['rows'] if RowIDs is None else len(getRowIDArray(RowIDs))
+        plan['stages'].append(candidates)
+        plan['stages'].append({'stage':'conditions','method':'row' if row else 'column',
+                               'expressions':expressions,'time':0.})
+        if 'selected' in candidates: plan['stages'][-1]['scanned'] = candidates['selected']
+    if Storage:
+        output = 'storage'
+    elif row:
+        output = 'row'
+    elif VARIABLES['SELECT_VIEWS'] and not blocks and \
+            all([type(expr)==str and expr in header['order'] for expr in ParameterNames]):
+        output = 'view'
+    else:
+        output = 'column'
+    plan['stages'].append({'stage':'output','method':output,'time':0.})
+    plan['time'] = 0.
+    plan = finishQueryPlan(plan)
+    plan['rows_selected'] = None
+    return plan
+
+def explainQuery(Query,TableName,DestinationTableName,Stages):
+    # plan of a query done column-wise in fixed stages (see sort and group)
+    plan = newQueryPlan(Query,TableName,DestinationTableName)
+    plan['stages'] = [dict(stage,time=0.) for stage in Stages]
+    plan['time'] = 0.
+    plan['rows_scanned'] = plan['rows']
+    plan['rows_selected'] = None
+    return plan
 
 def length(TableName):
     tab_len = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
     #print(str(tab_len)+' rows in '+TableName)
     return tab_len
 
+# Create the (empty) destination table of a query,
+#  with the parameters and formats of ParameterNames
+def createSelectTable(DestinationTableName,TableName,ParameterNames):
+    LOCAL_TABLE_CACHE[DestinationTableName] = {} # clear QUERY_BUFFER for the new result
+    RowObjectDefault = getDefaultRowObject(TableName)
+    VarDictionary = getVarDictionary(RowObjectDefault)
+    ContextFormat = getContextFormat(RowObjectDefault)
+    RowObjectDefaultNew = newRowObject(ParameterNames,RowObjectDefault,VarDictionary,ContextFormat)
+    dropTable(DestinationTableName) # redundant
+    createTable(DestinationTableName,RowObjectDefaultNew)
+
 # Select parameters from a table with certain conditions.
 # Parameters can be the names or expressions.
 # Conditions contain a list of expressions in a special language.
 # Set Output to False to suppress output
 # Set File=FileName to redirect output to a file.
-def select(TableName,DestinationTableName=QUERY_BUFFER,ParameterNames=None,Conditions=None,Output=True,File=None):
+def select(TableName,DestinationTableName=QUERY_BUFFER,ParameterNames=None,Conditions=None,Output=True,File=None,
+           BlockLines=None,Storage=False,Explain=False,Profile=False):
     """
     INPUT PARAMETERS: 
         TableName:            name of source table              (required)
@@ -2179,12 +4684,39 @@ def select(TableName,DestinationTableName=QUERY_BUFFER,ParameterNames=None,Condi
         Conditions:           list of logincal expressions      (optional)
         Output:   enable (True) or suppress (False) text output (optional)
         File:     enable (True) or suppress (False) file output (optional)
+        BlockLines: read the source table in blocks of this size  (optional)
+        Storage:  write the result to the storage block by block  (optional)
+        Explain:  return the plan of the query without running it (optional)
+        Profile:  run the query and return its plan with timings  (optional)
     OUTPUT PARAMETERS: 
-        none
+        Plan:     plan of the query (only with Explain or Profile)
     ---
     DESCRIPTION:
         Select or filter the data in some table 
         either to standard output or to file (if specified)
+        If BlockLines is given, a source table which is not in memory
+        is streamed from the storage block by block (see iterTableBlocks).
+        If Storage is True, the selected rows of each block are written
+        to the data file of DestinationTableName as they are found, and
+        the destination is registered as a lazy table: neither the source
+        nor the result is loaded into memory. The source may be a table
+        which is only in the storage (see db_begin(lazy=True)).
+        With Explain or Profile, the plan of the query is returned:
+        the method of each stage (candidate rows from the nu or hash
+        indexes, conditions evaluated on columns or row by row, output
+        as a view, columns or rows), the rows scanned and selected and,
+        for Profile, the time of each stage (see QUERY PROFILER).
+        Conditions and expressions are evaluated on whole columns;
+        queries using operators without a column-wise version
+        (SEARCH, FINDALL, COUNT) or masked values are evaluated row by row.
+        Bounds on nu among the AND-ed conditions are resolved first
+        by binary search on the sort order of nu (see getNuWindow).
+        A selection of plain parameters is a view of the source table
+        which copies its columns only when they are used (see TableView);
+        set VARIABLES['SELECT_VIEWS'] to False to always copy the rows.
+        The columns of a view of consecutive rows share the memory of the
+        source and are read-only in LOCAL_TABLE_CACHE; getColumn gives
+        the view its own copy of a column, which can be edited.
     ---
     EXAMPLE OF USAGE:
         select('sampletab',DestinationTableName='outtab',ParameterNames=(p1,p2),
@@ -2195,16 +4727,26 @@ def select(TableName,DestinationTableName=QUERY_BUFFER,ParameterNames=None,Condi
     # TODO: Variables defined in ParameterNames ('LET') MUST BE VISIBLE IN Conditions !!
     # check if table exists
     if TableName not in LOCAL_TABLE_CACHE.keys():
-        raise Exception('%s: no such table. Check tableList() for more info.' % TableName)
+        if Storage and os.path.isfile(os.path.join(VARIABLES['BACKEND_DATABASE_NAME'],TableName+'.header')):
+            registerLazyTable(TableName)
+        else:
+            raise Exception('%s: no such table. Check tableList() for more info.' % TableName)
     if not ParameterNames: ParameterNames=LOCAL_TABLE_CACHE[TableName]['header']['order']
-    LOCAL_TABLE_CACHE[DestinationTableName] = {} # clear QUERY_BUFFER for the new result
-    RowObjectDefault = getDefaultRowObject(TableName)
-    VarDictionary = getVarDictionary(RowObjectDefault)
-    ContextFormat = getContextFormat(RowObjectDefault)
-    RowObjectDefaultNew = newRowObject(ParameterNames,RowObjectDefault,VarDictionary,ContextFormat)
-    dropTable(DestinationTableName) # redundant
-    createTable(DestinationTableName,RowObjectDefaultNew)
-    selectInto(DestinationTableName,TableName,ParameterNames,Conditions)
+    if Storage and DestinationTableName==QUERY_BUFFER:
+        raise Exception('Storage requires DestinationTableName')
+    if Explain:
+        return explainSelect(TableName,DestinationTableName,ParameterNames,Conditions,BlockLines,Storage)
+    if Profile:
+        return profileQuery('select',TableName,DestinationTableName,select,TableName,DestinationTableName,
+                            ParameterNames,Conditions,Output,File,BlockLines,Storage)
+    createSelectTable(DestinationTableName,TableName,ParameterNames)
+    if Storage:
+        selectBlocksToStorage(DestinationTableName,TableName,ParameterNames,Conditions,
+                              BlockLines or DEFAULT_BLOCK_LINES)
+    elif BlockLines is None:
+        selectInto(DestinationTableName,TableName,ParameterNames,Conditions)
+    else:
+        selectBlocksInto(DestinationTableName,TableName,ParameterNames,Conditions,BlockLines)
     if DestinationTableName!=QUERY_BUFFER:
         if File: outputTable(DestinationTableName,File=File)
     elif Output:
@@ -2213,20 +4755,27 @@ def select(TableName,DestinationTableName=QUERY_BUFFER,ParameterNames=None,Condi
 # SORTING ===========================================================
 
 def arrangeTable(TableName,DestinationTableName=None,RowIDList=None):
-    #print 'AT/'
-    #print 'AT: RowIDList = '+str(RowIDList)
     # make a subset of table rows according to RowIDList
     if not DestinationTableName:
        DestinationTableName = TableName
+    clock = getQueryClock()
+    start = clock()
+    RowIDs = np.asarray(RowIDList,dtype=np.intp)
+    # derived columns are computed from the source columns before they are reordered
+    deriveColumns(TableName)
+    data = LOCAL_TABLE_CACHE[TableName]['data']
     if DestinationTableName != TableName:
        dropTable(DestinationTableName)
-       LOCAL_TABLE_CACHE[DestinationTableName]['header']=LOCAL_TABLE_CACHE[TableName]['header']
-       LOCAL_TABLE_CACHE[DestinationTableName]['data']={}
-    LOCAL_TABLE_CACHE[DestinationTableName]['header']['number_of_rows'] = len(RowIDList)
-    #print 'AT: RowIDList = '+str(RowIDList)
+       LOCAL_TABLE_CACHE[DestinationTableName] = {}
+       LOCAL_TABLE_CACHE[DestinationTableName]['header'] = dict(LOCAL_TABLE_CACHE[TableName]['header'])
+       LOCAL_TABLE_CACHE[DestinationTableName]['data'] = {}
+    LOCAL_TABLE_CACHE[DestinationTableName]['header']['number_of_rows'] = len(RowIDs)
+    # the columns are gathered with the index array
     for par_name in LOCAL_TABLE_CACHE[DestinationTableName]['header']['order']:
-        par_data = LOCAL_TABLE_CACHE[TableName]['data'][par_name]
-        LOCAL_TABLE_CACHE[DestinationTableName]['data'][par_name] = [par_data[i] for i in RowIDList]
+        par_data = data[par_name]
+        if type(par_data)==list: par_data = np.asarray(par_data)
+        LOCAL_TABLE_CACHE[DestinationTableName]['data'][par_name] = par_data[RowIDs]
+    addQueryStage('output','gather',clock()-start,Selected=len(RowIDs))
     
 def compareLESS(RowObject1,RowObject2,ParameterNames):
     #print 'CL/'
@@ -2258,52 +4807,109 @@ def compareLESS(RowObject1,RowObject2,ParameterNames):
     Flag = row1 < row2
     return Flag
 
+def getSortKeys(TableName,Expression,Accending=True):
+    # Integer or float columns ordered like the values of a parameter or an
+    #  expression (evaluated column-wise); the first one is the primary key.
+    # Strings are replaced by their ranks and masked values go last.
+    header = LOCAL_TABLE_CACHE[TableName]['header']
+    number_of_rows = header['number_of_rows']
+    if type(Expression)==str and Expression in header['order']:
+        column = LOCAL_TABLE_CACHE[TableName]['data'][Expression]
+        if type(column)==list: column = np.asarray(column)
+        column = column[:number_of_rows]
+    else:
+        getColumn = lambda par_name: getExpressionColumn(TableName,par_name)
+        try:
+            with np.errstate(all='ignore'):
+                column = evaluateColumnExpression(Expression,getColumn)
+        except ColumnExpressionUnsupported as e:
+            raise Exception('Cannot sort by %s: %s' % (str(Expression),str(e)))
+        if not isColumn(column): column = np.full(number_of_rows,column)
+    keys = []
+    if np.ma.isMaskedArray(column):
+        mask = np.ma.getmaskarray(column)
+        keys.append(mask.astype(np.int8))
+        column = np.where(mask,np.zeros(1,dtype=column.dtype),np.ma.getdata(column))
+    if isinstance(column,CategoricalColumn):
+        ranks = np.empty(len(column.labels),dtype=np.int64)
+        ranks[np.argsort(np.asarray(column.labels,dtype=str),kind='stable')] = arange(len(column.labels))
+        column = ranks[column.codes]
+    elif column.dtype.kind not in 'biuf':
+        column = np.unique(column,return_inverse=True)[1].ravel()
+    elif column.dtype.kind in 'biu':
+        # narrow integers of storage profiles are widened before they are reversed
+        column = column.astype(np.int64)
+    if not Accending:
+        # ~x==-x-1 reverses integers without overflowing at the minimum
+        column = ~column if column.dtype.kind=='i' else -column
+    keys.append(column)
+    return keys
+
+def getSortOrder(TableName,ParameterNames,Accending=True,RowIDs=None):
+    # Row indices ordering the table by ParameterNames with a stable np.lexsort.
+    # Accending is either one flag or a flag for each of ParameterNames;
+    #  a single False gives the reversed ascending order.
+    if type(Accending) in set([list,tuple]):
+        if len(Accending)!=len(ParameterNames):
+            raise Exception('Accending must have a flag for each of ParameterNames')
+        directions = list(Accending)
+    else:
+        directions = [True]*len(ParameterNames)
+    clock = getQueryClock()
+    start = clock()
+    keys = []
+    for par_name,direction in zip(ParameterNames,directions):
+        keys += getSortKeys(TableName,par_name,direction)
+    if RowIDs is not None:
+        keys = [key[RowIDs] for key in keys]
+    keyed = clock()
+    order = np.lexsort(keys[::-1])
+    if QUERY_PROFILE is not None:
+        addQueryStage('keys','column',keyed-start,Selected=len(keys[0]) if keys else 0,columns=len(keys))
+        addQueryStage('order','lexsort',clock()-keyed)
+    if RowIDs is not None:
+        order = np.asarray(RowIDs)[order]
+    if type(Accending) not in set([list,tuple]) and not Accending:
+        order = order[::-1]
+    return order
+
 def quickSort(index,TableName,ParameterNames,Accending=True):
     # ParameterNames: names of parameters which are
     #  taking part in the sorting
-    if index == []:
-       return []
-    else:
-       PivotID = index[0]
-       Pivot = getRowObject(PivotID,TableName)
-       lesser_index = []
-       greater_index = [];
-       for RowID in index[1:]:
-           RowObject = getRowObject(RowID,TableName)           
-           if compareLESS(RowObject,Pivot,ParameterNames): 
-              lesser_index += [RowID]
-           else:
-              greater_index += [RowID]
-       lesser = quickSort(lesser_index,TableName,ParameterNames,Accending)
-       greater = quickSort(greater_index,TableName,ParameterNames,Accending)
-       if Accending:
-          return lesser + [PivotID] + greater
-       else:
-          return greater + [PivotID] + lesser
+    # kept for compatibility: sorting is done by getSortOrder
+    index = np.asarray(index,dtype=np.intp)
+    return getSortOrder(TableName,ParameterNames,Accending,index).tolist()
 
 # Sorting must work well on the table itself!
-def sort(TableName,DestinationTableName=None,ParameterNames=None,Accending=True,Output=False,File=None):
+def sort(TableName,DestinationTableName=None,ParameterNames=None,Accending=True,Output=False,File=None,
+         Explain=False,Profile=False):
     """
     INPUT PARAMETERS: 
         TableName:                name of source table          (required)
         DestinationTableName:     name of resulting table       (optional)
         ParameterNames:       list of parameters or expressions to sort by    (optional)
-        Accending:       sort in ascending (True) or descending (False) order (optional)
+        Accending:       sort in ascending (True) or descending (False) order,
+                         or a list of such flags, one for each of ParameterNames (optional)
         Output:   enable (True) or suppress (False) text output (optional)
         File:     enable (True) or suppress (False) file output (optional)
+        Explain:  return the plan of the sort without sorting  (optional)
+        Profile:  sort and return the plan with timings        (optional)
     OUTPUT PARAMETERS: 
-        none
+        Plan:     plan of the sort (only with Explain or Profile)
     ---
     DESCRIPTION:
         Sort a table by a list of it's parameters or expressions.
         The sorted table is saved in DestinationTableName (if specified).
+        The keys are evaluated on whole columns and the rows are ordered
+        with a stable np.lexsort: rows with equal keys keep their order
+        (descending order with a single flag reverses it).
+        See select and QUERY PROFILER for the plans.
     ---
     EXAMPLE OF USAGE:
         sort('sampletab',ParameterNames=(p1,('+',p1,p2)))
+        sort('sampletab',ParameterNames=('molec_id','sw'),Accending=(True,False))
     ---
     """
-    number_of_rows = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
-    index = range(0,number_of_rows)
     if not DestinationTableName:
        DestinationTableName = TableName
     # if names are not provided use all parameters in sorting
@@ -2311,12 +4917,136 @@ def sort(TableName,DestinationTableName=None,ParameterNames=None,Accending=True,
        ParameterNames = LOCAL_TABLE_CACHE[TableName]['header']['order']
     elif type(ParameterNames) not in set([list,tuple]):
        ParameterNames = [ParameterNames] # fix of stupid bug where ('p1',) != ('p1')
-    index_sorted = quickSort(index,TableName,ParameterNames,Accending)
+    if Explain:
+        return explainQuery('sort',TableName,DestinationTableName,
+                            [{'stage':'keys','method':'column'},{'stage':'order','method':'lexsort'},
+                             {'stage':'output','method':'gather'}])
+    if Profile:
+        return profileQuery('sort',TableName,DestinationTableName,sort,TableName,DestinationTableName,
+                            ParameterNames,Accending,Output,File)
+    index_sorted = getSortOrder(TableName,ParameterNames,Accending)
     arrangeTable(TableName,DestinationTableName,index_sorted)
     if Output:
        outputTable(DestinationTableName,File=File)
 
 # /SORTING ==========================================================
+
+# TOP LINES =========================================================
+# The N best rows by some key are found without sorting the table:
+#  np.argpartition gives the N-th value of the key in linear time, and only
+#  the rows before it are sorted. Rows with equal keys keep their order,
+#  so the result is the head of a stable sort (also in descending order).
+# Line intensities can be taken at another temperature, scaled like in
+#  the absorption coefficient (see EnvironmentDependency_Intensity).
+
+def getLineIntensityColumn(TableName,T,Tref=296.,partitionFunction=None,RowIDs=None):
+    # Intensities of the lines at RowIDs at temperature T, with the partition
+    #  sums calculated once for each isotopologue.
+    if partitionFunction is None: partitionFunction = PYTIPS2017
+    getColumn = lambda par_name: getExpressionColumn(TableName,par_name,RowIDs)
+    isotopologues,inverse = np.unique(np.stack([getColumn('molec_id'),getColumn('local_iso_id')],axis=1),
+                                      axis=0,return_inverse=True)
+    inverse = inverse.ravel()
+    SigmaT = np.array([partitionFunction(M,I,T) for M,I in isotopologues.tolist()],dtype=float64)
+    SigmaTref = np.array([partitionFunction(M,I,Tref) for M,I in isotopologues.tolist()],dtype=float64)
+    return EnvironmentDependency_Intensity(getColumn('sw'),__FloatType__(T),__FloatType__(Tref),
+                                           SigmaT[inverse],SigmaTref[inverse],
+                                           getColumn('elower'),getColumn('nu'))
+
+def getTopRowIDs(TableName,N,Key='sw',Conditions=None,Accending=False,Environment=None,partitionFunction=None):
+    # Rows of the N largest (smallest if Accending) values of Key among the rows
+    #  satisfying Conditions, ordered by Key.
+    try:
+        RowIDs = getConditionRowIDs(TableName,Conditions)
+    except ColumnExpressionUnsupported:
+        # conditions without a column-wise version are tested row by row
+        Condition = compileExpression(Conditions)
+        RowIDs = []
+        for RowID in range(LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']):
+            VarDictionary = getVarDictionary(getRowObject(RowID,TableName))
+            VarDictionary['LineNumber'] = RowID
+            if Condition(VarDictionary): RowIDs.append(RowID)
+        RowIDs = np.array(RowIDs,dtype=np.intp)
+    intensity = []
+    def getColumn(par_name):
+        if Environment and par_name=='sw':
+            if not intensity:
+                intensity.append(getLineIntensityColumn(TableName,Environment['T'],
+                                                        partitionFunction=partitionFunction,RowIDs=RowIDs))
+            return intensity[0]
+        return getExpressionColumn(TableName,par_name,RowIDs)
+    try:
+        with np.errstate(all='ignore'):
+            key = evaluateColumnExpression(Key,getColumn)
+    except ColumnExpressionUnsupported as e:
+        raise Exception('Cannot select top lines by %s: %s' % (str(Key),str(e)))
+    if not isColumn(key): key = np.full(len(RowIDs),key)
+    if isinstance(key,CategoricalColumn) or key.dtype.kind not in 'biuf':
+        key = np.unique(np.asarray(key,dtype=str),return_inverse=True)[1].ravel()
+    elif key.dtype.kind in 'bu':
+        key = key.astype(np.int64)
+    if not Accending: key = -key
+    if N<len(key):
+        if N<=0: return np.zeros(0,dtype=np.intp)
+        kth = key[np.argpartition(key,N-1)[N-1]]
+        # the rows before the N-th value and the first rows equal to it (NaN go last)
+        before = key<kth if kth==kth else ~np.isnan(key)
+        equal = np.flatnonzero(key==kth if kth==kth else np.isnan(key))
+        rows = np.flatnonzero(before)
+        rows = np.sort(np.concatenate([rows,equal[:N-len(rows)]]))
+    else:
+        rows = arange(len(key))
+    return getRowIDArray(RowIDs)[rows[np.argsort(key[rows],kind='stable')]]
+
+def selectTop(TableName,N,Key='sw',Conditions=None,DestinationTableName=QUERY_BUFFER,ParameterNames=None,
+              Environment=None,Accending=False,Output=True,File=None,partitionFunction=None):
+    """
+    INPUT PARAMETERS: 
+        TableName:            name of source table                    (required)
+        N:                    number of lines to select               (required)
+        Key:                  parameter or expression to rank by      (optional)
+        Conditions:           list of logincal expressions            (optional)
+        DestinationTableName: name of resulting table                 (optional)
+        ParameterNames:       list of parameters or expressions       (optional)
+        Environment:          dictionary with temperature, e.g. {'T':1500.} (optional)
+        Accending:  select the smallest (True) or largest (False) values (optional)
+        Output:   enable (True) or suppress (False) text output       (optional)
+        File:     enable (True) or suppress (False) file output       (optional)
+        partitionFunction:    partition sums for Environment, PYTIPS2017 by default (optional)
+    OUTPUT PARAMETERS: 
+        none
+    ---
+    DESCRIPTION:
+        Select the N lines with the largest (smallest if Accending)
+        values of Key among the lines satisfying Conditions,
+        ordered by Key. Lines with equal values keep their order,
+        so the result is the same as of a stable sort by Key
+        followed by taking the first N lines, but the table is not sorted.
+        If Environment is given, the intensities 'sw' in Key
+        are those at temperature Environment['T']
+        (see EnvironmentDependency_Intensity).
+        A selection of plain parameters is a view of the source table
+        (see select).
+    ---
+    EXAMPLE OF USAGE:
+        selectTop('sampletab',10000,Environment={'T':1500.},DestinationTableName='strong')
+        selectTop('sampletab',10,Key=('*','sw','nu'),Conditions=('=','molec_id',2))
+    ---
+    """
+    if TableName not in LOCAL_TABLE_CACHE.keys():
+        raise Exception('%s: no such table. Check tableList() for more info.' % TableName)
+    if DestinationTableName == TableName:
+       raise Exception('Selecting into source table is forbidden')
+    if not ParameterNames: ParameterNames=LOCAL_TABLE_CACHE[TableName]['header']['order']
+    RowIDs = getTopRowIDs(TableName,N,Key,Conditions,Accending,Environment,partitionFunction)
+    createSelectTable(DestinationTableName,TableName,ParameterNames)
+    selectInto(DestinationTableName,TableName,ParameterNames,None,RowIDs=RowIDs)
+    if DestinationTableName!=QUERY_BUFFER:
+        if File: outputTable(DestinationTableName,File=File)
+    elif Output:
+        outputTable(DestinationTableName,File=File)
+
+# /TOP LINES ========================================================
     
 
 # GROUPING ==========================================================
@@ -2334,71 +5064,206 @@ def sort(TableName,DestinationTableName=None,ParameterNames=None,Accending=True,
 #    than the following key is used: "__GLOBAL__"
 
 
-def group(TableName,DestinationTableName=QUERY_BUFFER,ParameterNames=None,GroupParameterNames=None,File=None,Output=True):
+# Group functions: the values of an expression in each group are reduced
+#  with a ufunc (COUNT counts them). Masked values are left out; groups
+#  without values get the defaults of GROUP_FUNCTION_NAMES.
+GROUP_REDUCTIONS = {
+    'SUM' : np.add,
+    'MUL' : np.multiply,
+    'MIN' : np.minimum,
+    'MAX' : np.maximum,
+    'SSQ' : np.add,
+}
+
+# Python types of the group columns by dtype kind, for their formats and defaults
+GROUP_COLUMN_TYPES = {'b':bool,'i':int,'u':int,'f':float}
+
+def factorizeGroups(TableName,GroupParameterNames):
+    # Group number of each row, numbered in the order of the first rows
+    #  of the groups, and the number of groups.
+    number_of_rows = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
+    inverse = np.zeros(number_of_rows,dtype=np.int64)
+    number_of_groups = 1 if number_of_rows else 0
+    for par_name in GroupParameterNames:
+        for key in getSortKeys(TableName,par_name):
+            uniques,codes = np.unique(key,return_inverse=True)
+            # combine with the previous keys and renumber to keep the codes small
+            uniques,inverse = np.unique(inverse*len(uniques)+codes.ravel(),return_inverse=True)
+            inverse = inverse.ravel()
+            number_of_groups = len(uniques)
+    first_rows = np.full(number_of_groups,number_of_rows,dtype=np.int64)
+    np.minimum.at(first_rows,inverse,arange(number_of_rows))
+    renumber = np.empty(number_of_groups,dtype=np.int64)
+    renumber[np.argsort(first_rows,kind='stable')] = arange(number_of_groups)
+    return renumber[inverse],number_of_groups
+
+def reduceGroups(FunctionName,values,inverse,number_of_groups):
+    # Values of a group function for each group.
+    if np.ma.isMaskedArray(values):
+        present = ~np.ma.getmaskarray(values)
+        values,inverse = np.ma.getdata(values)[present],inverse[present]
+    if FunctionName=='COUNT':
+        return np.bincount(inverse,minlength=number_of_groups)
+    if getColumnKind(values)!='number':
+        raise Exception('%s needs numeric values' % FunctionName)
+    values = widenColumn(values)
+    if FunctionName=='AVG':
+        counts = np.bincount(inverse,minlength=number_of_groups)
+        with np.errstate(all='ignore'):
+            result = reduceGroups('SUM',values,inverse,number_of_groups)/counts
+        # only groups without values take the default, a NaN of the values is kept
+        return np.where(counts==0,GROUP_FUNCTION_NAMES['AVG'],result)
+    if FunctionName=='SSQ': values = values*values
+    # reduce the runs of the rows sorted by group
+    order = np.argsort(inverse,kind='stable')
+    groups = inverse[order]
+    starts = np.flatnonzero(np.r_[True,groups[1:]!=groups[:-1]]) if len(groups) else groups
+    reduced = GROUP_REDUCTIONS[FunctionName].reduceat(values[order],starts) if len(groups) else values
+    dtype = np.result_type(values,reduced)
+    if len(starts)==number_of_groups:
+        result = np.empty(number_of_groups,dtype=dtype)
+    else:
+        # groups without values (all masked) take the default, which may not fit an integer column
+        default = GROUP_FUNCTION_NAMES[FunctionName]
+        if dtype.kind in 'biu' and \
+                not (default in (0,1) if dtype.kind=='b' else np.iinfo(dtype).min<=default<=np.iinfo(dtype).max):
+            dtype = float64
+        result = np.full(number_of_groups,default,dtype=dtype)
+    result[groups[starts]] = reduced
+    return result
+
+def evaluateGroupExpression(root,TableName,inverse,number_of_groups,last_rows):
+    # Column-wise evaluation of an expression with group functions: the values
+    #  of parameters outside group functions are taken from the last row of a group.
+    if type(root) in set([list,tuple]):
+        head = root[0].upper()
+        if head in GROUP_FUNCTION_NAMES:
+            if len(root)<2:
+                if head!='COUNT': raise Exception('%s needs an argument' % head)
+                values = inverse
+            elif type(root[1])==str and root[1] in LOCAL_TABLE_CACHE[TableName]['header']['order']:
+                values = LOCAL_TABLE_CACHE[TableName]['data'][root[1]]
+                if type(values)==list: values = np.asarray(values)
+                values = values[:len(inverse)]
+            else:
+                values = evaluateColumnExpression(root[1],lambda par_name: getExpressionColumn(TableName,par_name))
+                if not isColumn(values): values = np.full(len(inverse),values)
+            if isinstance(values,CategoricalColumn): values = np.asarray(values)
+            return reduceGroups(head,values,inverse,number_of_groups)
+        if head in set(['STR','STRING']):
+            return operationSTR(root[1])
+        elif head in set(['SET']):
+            return operationSET(root[1])
+        args = [evaluateGroupExpression(element,TableName,inverse,number_of_groups,last_rows)
+                for element in root[1:]]
+        try:
+            operator = COLUMN_OPERATORS[head]
+        except KeyError:
+            raise Exception('Unknown operator: %s' % head)
+        return operator(args)
+    elif type(root)==str:
+        return getExpressionColumn(TableName,root,last_rows)
+    else:
+        return root
+
+def group(TableName,DestinationTableName=QUERY_BUFFER,ParameterNames=None,GroupParameterNames=None,File=None,Output=True,
+          Explain=False,Profile=False):
     """
     INPUT PARAMETERS: 
         TableName:                name of source table          (required)
         DestinationTableName:     name of resulting table       (optional)
         ParameterNames:       list of parameters or expressions to take       (optional)
         GroupParameterNames:  list of parameters or expressions to group by   (optional)
-        Accending:       sort in ascending (True) or descending (False) order (optional)
         Output:   enable (True) or suppress (False) text output (optional)
+        Explain:  return the plan of the grouping without running it (optional)
+        Profile:  group and return the plan with timings         (optional)
     OUTPUT PARAMETERS: 
-        none
+        Plan:     plan of the grouping (only with Explain or Profile)
     ---
     DESCRIPTION:
-        none
+        Group the rows of a table having the same values of GroupParameterNames
+        (all rows if not given) and make a row for each group, in the order of
+        their first rows. ParameterNames can contain the group functions
+        COUNT, SUM, MUL, AVG, MIN, MAX and SSQ (sum of squares) of parameters
+        or expressions; parameters outside group functions take their values
+        from the last row of a group. By default the table has the group
+        parameters and the number of rows in each group.
+        See select and QUERY PROFILER for the plans.
     ---
     EXAMPLE OF USAGE:
         group('sampletab',ParameterNames=('p1',('sum','p2')),GroupParameterNames=('p1'))
-        ... makes grouping by p1,p2. For each group it calculates sum of p2 values.
+        ... makes grouping by p1. For each group it calculates sum of p2 values.
+        group('sampletab',ParameterNames=('molec_id','local_iso_id',('LET','sw_sum',('SUM','sw'))),
+              GroupParameterNames=('molec_id','local_iso_id'))
     ---
     """
     # Implements such functions as:
     # count,sum,avg,min,max,ssq etc...
     # 1) ParameterNames can contain group functions
     # 2) GroupParameterNames can't contain group functions
-    # 3) If ParameterNames contains parameters defined by LET directive,
-    #    it IS visible in the sub-context of GroupParameterNames
-    # 4) Parameters defined in GroupParameterNames are NOT visible in ParameterNames
-    # 5) ParameterNames variable represents the structure of the resulting table/collection
-    # 6) GroupParameterNames can contain either par_names or expressions with par_names
-    # Clear old GROUP_INDEX value
-    clearGroupIndex()
+    # 3) ParameterNames variable represents the structure of the resulting table/collection
+    # 4) GroupParameterNames can contain either par_names or expressions with par_names
     # Consistency check
     if TableName == DestinationTableName:
        raise Exception('TableName and DestinationTableName must be different')
-    #if not ParameterNames: ParameterNames=LOCAL_TABLE_CACHE[TableName]['header']['order']
-    # Prepare the new DestinationTable
-    RowObjectDefault = getDefaultRowObject(TableName)
-    VarDictionary = getVarDictionary(RowObjectDefault)
-    ContextFormat = getContextFormat(RowObjectDefault)
-    RowObjectDefaultNew = newRowObject(ParameterNames,RowObjectDefault,VarDictionary,ContextFormat)
-    dropTable(DestinationTableName) # redundant
-    createTable(DestinationTableName,RowObjectDefaultNew)
-    # Loop through rows of source Table
-    # On each iteration group functions update GROUP_INDEX (see description above)
-    number_of_rows = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']   
+    if not GroupParameterNames:
+       GroupParameterNames = []
+    elif type(GroupParameterNames) not in set([list,tuple]):
+       GroupParameterNames = [GroupParameterNames]
+    if not ParameterNames:
+       ParameterNames = list(GroupParameterNames)+[('LET','count',('COUNT',))]
+    if Explain:
+        return explainQuery('group',TableName,DestinationTableName,
+                            [{'stage':'groups','method':'factorize'},{'stage':'reduce','method':'ufunc'},
+                             {'stage':'output','method':'column'}])
+    if Profile:
+        return profileQuery('group',TableName,DestinationTableName,group,TableName,DestinationTableName,
+                            ParameterNames,GroupParameterNames,File,Output)
+    header = LOCAL_TABLE_CACHE[TableName]['header']
+    clock = getQueryClock()
+    start = clock()
     # STAGE 1: CREATE GROUPS
-    print('LOOP:')
-    for RowID in range(0,number_of_rows):
-        print('--------------------------------')
-        print('RowID='+str(RowID))
-        RowObject = getRowObject(RowID,TableName) # RowObject from source table
-        VarDictionary = getVarDictionary(RowObject)
-        print('VarDictionary='+str(VarDictionary))
-        # This is a trick which makes evaluateExpression function
-        #   not consider first expression as an operation
-        GroupParameterNames_ = ['LIST'] + list(GroupParameterNames)
-        GroupIndexKey = evaluateExpression(GroupParameterNames_,VarDictionary)
-        # List is an unhashable type in Python!
-        GroupIndexKey = tuple(GroupIndexKey)       
-        initializeGroup(GroupIndexKey)
-        print('GROUP_INDEX='+str(GROUP_INDEX))
-        ContextFormat = getContextFormat(RowObject)
-        RowObjectNew = newRowObject(ParameterNames,RowObject,VarDictionary,ContextFormat,GroupIndexKey)
-        RowIDGroup = GROUP_INDEX[GroupIndexKey]['ROWID']
-        setRowObject(RowIDGroup,RowObjectNew,DestinationTableName)
+    inverse,number_of_groups = factorizeGroups(TableName,GroupParameterNames)
+    last_rows = np.zeros(number_of_groups,dtype=np.int64)
+    last_rows[inverse] = arange(len(inverse))
+    addQueryStage('groups','factorize',clock()-start,len(inverse),number_of_groups)
+    start = clock()
+    # STAGE 2: EVALUATE THE PARAMETERS OF THE GROUPS
+    RowObjectDefault = []; data = {}
+    anoncount = 0
+    for expr in ParameterNames:
+        if type(expr) in set([list,tuple]):
+            if expr[0] in set(['let','bind','LET','BIND']):
+                par_name,par_expr = expr[1],expr[2]
+                par_format = expr[3] if len(expr)>3 else None
+            else:
+                par_name = "#%d" % anoncount
+                anoncount += 1
+                par_expr,par_format = expr,None
+            with np.errstate(all='ignore'):
+                column = evaluateGroupExpression(par_expr,TableName,inverse,number_of_groups,last_rows)
+            if not isColumn(column): column = np.full(number_of_groups,column)
+        else:
+            par_name = expr
+            column = LOCAL_TABLE_CACHE[TableName]['data'][par_name]
+            if type(column)==list: column = np.asarray(column)
+            column = column[last_rows]
+            par_format = header['format'][par_name]
+        if type(expr) in set([list,tuple]):
+            par_type = GROUP_COLUMN_TYPES.get(np.asarray(column[:0]).dtype.kind,str)
+            par_default = getDefaultValue(par_type)
+            if par_format is None: par_format = getDefaultFormat(par_type)
+        else:
+            par_default = header['default'][par_name]
+        RowObjectDefault.append((par_name,par_default,par_format))
+        data[par_name] = column
+    addQueryStage('reduce','ufunc',clock()-start,Selected=number_of_groups)
+    start = clock()
+    dropTable(DestinationTableName)
+    createTable(DestinationTableName,RowObjectDefault)
+    LOCAL_TABLE_CACHE[DestinationTableName]['header']['number_of_rows'] = number_of_groups
+    LOCAL_TABLE_CACHE[DestinationTableName]['data'] = data
+    addQueryStage('output','column',clock()-start,Selected=number_of_groups)
     # Output result if required
     if Output and DestinationTableName==QUERY_BUFFER:
        outputTable(DestinationTableName,File=File)
@@ -2417,8 +5282,161 @@ REGEX_STRING_FIXCOL = lambda n: '[^\s]{%d}' % n
 REGEX_FLOAT_F_FIXCOL = lambda n: '[\+\-\.\d]{%d}' % n
 REGEX_FLOAT_E_FIXCOL = lambda n: '[\+\-\.\deEfF]{%d}' % n
 
+# Extracted parameters are parsed from the distinct values of the source
+#  column only (the labels of a categorical column), and taken for the rows
+#  from the parsed values. Column-fixed values are sliced as bytes and parsed
+#  with the converters of the table reader (see bulkParseMatrix); others are
+#  parsed with a single compiled regular expression.
+
+EXTRACT_TYPES = {'d':int,'s':str,'f':float,'e':float}
+EXTRACT_REGEX = {'d':REGEX_INTEGER,'s':REGEX_STRING,'f':REGEX_FLOAT_F,'e':REGEX_FLOAT_E}
+
+def getExtractFormats(ParameterFormats):
+    # (par_type,width) of each format; width is None if not given
+    types = []
+    for par_format in ParameterFormats:
+        try:
+            (lng,trail,lngpnt,ty) = re.search(FORMAT_PYTHON_REGEX,par_format).groups()
+        except AttributeError:
+            raise Exception('Unknown data type')
+        types.append((EXTRACT_TYPES[ty.lower()],int(lng) if lng else None))
+    return types
+
+def getSourceStrings(column):
+    # (distinct values as a str array, index of the value of each row)
+    if isinstance(column,CategoricalColumn):
+        return np.array(column.labels,dtype=str).reshape(-1),column.codes
+    values,codes = np.unique(np.asarray(column,dtype=str),return_inverse=True)
+    return values,codes.ravel()
+
+def convertExtractedField(values,par_type,par_name):
+    # typed column from a str array of parsed fields
+    if par_type is str: return values
+    try:
+        if par_type is int: return values.astype(int64)
+        return bulkConvertFloat(np.char.encode(values,'latin-1'))
+    except ValueError as error:
+        raise Exception('Error while extracting parameter %s: %s' % (par_name,error))
+
+def extractFixedColumns(column,ParameterNames,Formats):
+    # parse the fields at consecutive positions, the widths of the formats
+    values,codes = getSourceStrings(column)
+    layout = []
+    end = 0
+    for par_name,(par_type,width) in zip(ParameterNames,Formats):
+        if width is None:
+            raise Exception('Format of %s has no width for FixCol' % par_name)
+        layout.append((par_name,par_type,end,end+width))
+        end += width
+    encoded = np.char.encode(values,'latin-1') if len(values) else np.zeros(0,dtype='S1')
+    if encoded.dtype.itemsize==0: encoded = encoded.astype('S1')
+    matrix = encoded.view(np.uint8).reshape(len(encoded),encoded.dtype.itemsize)
+    try:
+        fields = bulkParseMatrix(matrix,layout)
+    except ValueError as error:
+        raise Exception('Error while extracting parameters: %s' % error)
+    return {par_name:field[codes] for par_name,field in zip(ParameterNames,fields)}
+
+def extractRegexColumns(column,ParameterNames,Formats,Regex):
+    # parse the groups of a regular expression searched in every value
+    values,codes = getSourceStrings(column)
+    regex = re.compile(Regex)
+    groups = []
+    for value in values.tolist():
+        match = regex.search(value)
+        if match is None:
+            raise Exception('Error with line \"%s\"' % value)
+        groups.append(match.groups())
+    fields = np.array(groups,dtype=str).reshape(len(values),len(ParameterNames))
+    return {par_name:convertExtractedField(fields[:,i],par_type,par_name)[codes]
+            for i,(par_name,(par_type,width)) in enumerate(zip(ParameterNames,Formats))}
+
+def splitColumns(column,ParameterNames,Formats,Splitter):
+    # split every value at Splitter (whitespace if None), the last
+    #  parameter taking the rest of the value
+    values,codes = getSourceStrings(column)
+    number = len(ParameterNames)
+    fields = []
+    for value in values.tolist():
+        parts = value.split(Splitter,number-1) if Splitter is not None else value.split(None,number-1)
+        if len(parts)!=number:
+            raise Exception('Error with line \"%s\"' % value)
+        fields.append(parts)
+    fields = np.array(fields,dtype=str).reshape(len(values),number)
+    return {par_name:convertExtractedField(fields[:,i],par_type,par_name)[codes]
+            for i,(par_name,(par_type,width)) in enumerate(zip(ParameterNames,Formats))}
+
+class DerivedColumns(CaselessDict):
+    """
+    Columns of a table with derived columns, which are computed
+    from the other columns when they are first read.
+    """
+    def __init__(self,*args,**kwargs):
+        CaselessDict.__init__(self,*args,**kwargs)
+        self.derived = {} # par_name => function computing {par_name: column}
+
+    def addDerived(self,par_name,function):
+        self.derived[self._k(par_name)] = function
+
+    def __missing__(self,key):
+        if key not in self.derived:
+            raise KeyError(key)
+        columns = self.derived[key]()
+        for par_name in columns: self.derived.pop(self._k(par_name),None)
+        self.update(columns)
+        return CaselessDict.__getitem__(self,key)
+
+    def __contains__(self,par_name):
+        return CaselessDict.__contains__(self,par_name) or self._k(par_name) in self.derived
+
+    def get(self,par_name,default=None):
+        return self[par_name] if par_name in self else default
+
+    def derive(self):
+        # compute the derived columns which were not read yet
+        for par_name in list(self.derived):
+            if par_name in self.derived: self[par_name]
+
+    def __reduce__(self):
+        # the functions of the derived columns can't be pickled
+        self.derive()
+        return (CaselessDict,(dict(self),))
+
+def deriveColumns(TableName):
+    # Compute the derived columns of a table before its columns are
+    #  reordered or edited in place, or before they are iterated.
+    if isTableLoaded(TableName) and isinstance(LOCAL_TABLE_CACHE[TableName]['data'],DerivedColumns):
+        LOCAL_TABLE_CACHE[TableName]['data'].derive()
+
+def addExtractedColumns(TableName,SourceParameterName,ParameterNames,ParameterFormats,Function,Lazy):
+    # Add the columns computed by Function (a dictionary of columns
+    #  from the source column) to the header and the data of a table.
+    header = LOCAL_TABLE_CACHE[TableName]['header']
+    if type(header['default'][SourceParameterName])!=str:
+       raise Exception('Source parameter must be a string')
+    # check if ParameterNames are valid
+    Intersection = set(ParameterNames).intersection(header['order'])
+    if Intersection:
+       raise Exception('Parameters %s already exist' % str(list(Intersection)))
+    Formats = getExtractFormats(ParameterFormats)
+    materializeTable(TableName)
+    data = LOCAL_TABLE_CACHE[TableName]['data']
+    compute = lambda: Function(data[SourceParameterName],ParameterNames,Formats)
+    if Lazy:
+        if not isinstance(data,DerivedColumns):
+            data = LOCAL_TABLE_CACHE[TableName]['data'] = DerivedColumns(data)
+        for par_name in ParameterNames:
+            data.addDerived(par_name,compute)
+    else:
+        data.update(compute())
+    for par_name,par_format,(par_type,width) in zip(ParameterNames,ParameterFormats,Formats):
+        header['format'][par_name] = par_format
+        header['default'][par_name] = getDefaultValue(par_type)
+    # append new parameters in order list
+    header['order'] += ParameterNames
+
 # Extract sub-columns from string column
-def extractColumns(TableName,SourceParameterName,ParameterFormats,ParameterNames=None,FixCol=False):
+def extractColumns(TableName,SourceParameterName,ParameterFormats,ParameterNames=None,FixCol=False,Lazy=False):
     """
     INPUT PARAMETERS: 
         TableName:             name of source table              (required)
@@ -2426,6 +5444,7 @@ def extractColumns(TableName,SourceParameterName,ParameterFormats,ParameterNames
         ParameterFormats:      c formats of unpacked parameters  (required)
         ParameterNames:        list of resulting parameter names (optional)
         FixCol:      column-fixed (True) format of source column (optional)
+        Lazy:        compute the parameters when first used (True) (optional)
     OUTPUT PARAMETERS: 
         none
     ---
@@ -2433,6 +5452,11 @@ def extractColumns(TableName,SourceParameterName,ParameterFormats,ParameterNames
         Note, that this function is aimed to do some extra job on
         interpreting string parameters which is normally supposed
         to be done by the user.
+        With FixCol the parameters are read at consecutive positions
+        of the source values, with the widths of their formats.
+        Otherwise they are searched as whitespace-separated fields.
+        With Lazy the new columns are computed from the source
+        column the first time one of them is read.
     ---
     EXAMPLE OF USAGE:
         extractColumns('sampletab',SourceParameterName='p5',
@@ -2440,6 +5464,9 @@ def extractColumns(TableName,SourceParameterName,ParameterFormats,ParameterNames
                         ParameterNames=('p5_1','p5_2','p5_3'))
         This example extracts three integer parameters from
         a source column 'p5' and puts results in ('p5_1','p5_2','p5_3').
+        extractColumns('H2O',SourceParameterName='local_upper_quanta',
+                        ParameterFormats=('%3d','%3d','%3d'),
+                        ParameterNames=('J','Ka','Kc'),FixCol=True)
     ---
     """
     # ParameterNames = just the names without expressions
@@ -2447,8 +5474,6 @@ def extractColumns(TableName,SourceParameterName,ParameterFormats,ParameterNames
     # Example: ParameterNames=('v1','v2','v3')
     #          ParameterFormats=('%1s','%1s','%1s')
     # By default the format of parameters is column-fixed
-    if type(LOCAL_TABLE_CACHE[TableName]['header']['default'][SourceParameterName]) not in set([str,unicode]):
-       raise Exception('Source parameter must be a string')
     i=-1
     # bug when (a,) != (a)
     if ParameterNames and type(ParameterNames) not in set([list,tuple]):
@@ -2466,82 +5491,49 @@ def extractColumns(TableName,SourceParameterName,ParameterFormats,ParameterNames
                  fmt = LOCAL_TABLE_CACHE[TableName]['header']['format'].get(par_name,None)
                  if not fmt: break
            ParameterNames.append(par_name)
-    # check if ParameterNames are valid
-    Intersection = set(ParameterNames).intersection(LOCAL_TABLE_CACHE[TableName]['header']['order'])
-    if Intersection:
-       raise Exception('Parameters %s already exist' % str(list(Intersection)))
-    # loop over ParameterNames to prepare LOCAL_TABLE_CACHE
-    i=0
-    for par_name in ParameterNames:  
-        par_format = ParameterFormats[i]     
-        LOCAL_TABLE_CACHE[TableName]['header']['format'][par_name]=par_format
-        LOCAL_TABLE_CACHE[TableName]['data'][par_name]=[] 
-        i+=1
-    # append new parameters in order list
-    LOCAL_TABLE_CACHE[TableName]['header']['order'] += ParameterNames
-    # cope with default values
-    i=0
-    format_regex = []
-    format_types = []
-    for par_format in ParameterFormats:
-        par_name = ParameterNames[i]
-        regex = FORMAT_PYTHON_REGEX
-        (lng,trail,lngpnt,ty) = re.search(regex,par_format).groups()
-        ty = ty.lower()
-        if ty == 'd':
-           par_type = int
-           if FixCol:
-              format_regex_part = REGEX_INTEGER_FIXCOL(lng)
-           else:
-              format_regex_part = REGEX_INTEGER
-        elif ty == 's':
-           par_type = str
-           if FixCol:
-              format_regex_part = REGEX_STRING_FIXCOL(lng)
-           else:
-              format_regex_part = REGEX_STRING
-        elif ty == 'f':
-           par_type = float
-           if FixCol:
-              format_regex_part = REGEX_FLOAT_F_FIXCOL(lng)
-           else:
-              format_regex_part = REGEX_FLOAT_F
-        elif ty == 'e':
-           par_type = float
-           if FixCol:
-              format_regex_part = REGEX_FLOAT_E_FIXCOL(lng)
-           else:
-              format_regex_part = REGEX_FLOAT_E
-        else:
-           raise Exception('Unknown data type')
-        format_regex.append('('+format_regex_part+')')
-        format_types.append(par_type)
-        def_val = getDefaultValue(par_type)
-        LOCAL_TABLE_CACHE[TableName]['header']['default'][par_name]=def_val
-        i+=1
-    format_regex = '\s*'.join(format_regex)
-    # loop through values of SourceParameter
-    for SourceParameterString in LOCAL_TABLE_CACHE[TableName]['data'][SourceParameterName]:
-        try:
-           ExtractedValues = list(re.search(format_regex,SourceParameterString).groups())
-        except:
-           raise Exception('Error with line \"%s\"' % SourceParameterString)
-        i=0
-        # loop through all parameters which are supposed to be extracted
-        for par_name in ParameterNames:
-            par_value = format_types[i](ExtractedValues[i])
-            LOCAL_TABLE_CACHE[TableName]['data'][par_name].append(par_value)
-            i+=1
-    # explicitly check that number of rows are equal
-    number_of_rows = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
-    number_of_rows2 = len(LOCAL_TABLE_CACHE[TableName]['data'][SourceParameterName])
-    number_of_rows3 = len(LOCAL_TABLE_CACHE[TableName]['data'][ParameterNames[0]])
-    if not (number_of_rows == number_of_rows2 == number_of_rows3):
-       raise Exception('Error while extracting parameters: check your regexp')
+    ParameterNames = list(ParameterNames)
+    if FixCol:
+       Function = extractFixedColumns
+    else:
+       format_regex = []
+       for par_format in ParameterFormats:
+           ty = re.search(FORMAT_PYTHON_REGEX,par_format).groups()[3].lower()
+           format_regex.append('('+EXTRACT_REGEX[ty]+')')
+       Function = lambda column,ParameterNames,Formats: \
+           extractRegexColumns(column,ParameterNames,Formats,'\s*'.join(format_regex))
+    addExtractedColumns(TableName,SourceParameterName,ParameterNames,list(ParameterFormats),Function,Lazy)
 
 # Split string columns into sub-columns with given names
-def splitColumn(TableName,SourceParameterName,ParameterNames,Splitter):
-    pass
+def splitColumn(TableName,SourceParameterName,ParameterNames,Splitter=None,ParameterFormats=None,Lazy=False):
+    """
+    INPUT PARAMETERS: 
+        TableName:             name of source table              (required)
+        SourceParameterName:   name of source column to process  (required)
+        ParameterNames:        list of resulting parameter names (required)
+        Splitter:    separator of the parts, whitespace if None  (optional)
+        ParameterFormats:      c formats of the parts, str by default (optional)
+        Lazy:        compute the parameters when first used (True) (optional)
+    OUTPUT PARAMETERS: 
+        none
+    ---
+    DESCRIPTION:
+        Split the values of a string column into as many parts
+        as ParameterNames; the last part holds the rest of the value.
+    ---
+    EXAMPLE OF USAGE:
+        splitColumn('H2O','local_upper_quanta',('J','Ka','Kc'),
+                    ParameterFormats=('%3d','%3d','%3d'))
+    ---
+    """
+    if type(ParameterNames) not in set([list,tuple]):
+       ParameterNames = [ParameterNames]
+    if not ParameterFormats:
+       ParameterFormats = [getDefaultFormat(str)]*len(ParameterNames)
+    elif type(ParameterFormats) not in set([list,tuple]):
+       ParameterFormats = [ParameterFormats]
+    Function = lambda column,ParameterNames,Formats: \
+        splitColumns(column,ParameterNames,Formats,Splitter)
+    addExtractedColumns(TableName,SourceParameterName,list(ParameterNames),list(ParameterFormats),Function,Lazy)
 
 # /EXTRACTING =======================================================
 
@@ -2821,7 +5813,7 @@ def queryHITRAN(TableName,iso_id_list,numin,numax,pargroups=[],params=[],dotpar=
     ParameterList = prepareParlist(pargroups=pargroups,params=params,dotpar=dotpar)
     TableHeader = prepareHeader(ParameterList)
     TableHeader['table_name'] = TableName
-    DataFileName = VARIABLES['BACKEND_DATABASE_NAME'] + '/' + TableName + '.data'
+    DataFileName = getStorageFileName(TableName)
     HeaderFileName = VARIABLES['BACKEND_DATABASE_NAME'] + '/' + TableName + '.header'
     # create URL
     iso_id_list_str = [str(iso_id) for iso_id in iso_id_list]
@@ -2857,21 +5849,82 @@ def queryHITRAN(TableName,iso_id_list,numin,numax,pargroups=[],params=[],dotpar=
         raise Exception('Cannot connect to %s. Try again or edit GLOBAL_HOST variable.' % GLOBAL_HOST)
     CHUNK = 64 * 1024
     print('BEGIN DOWNLOAD: '+TableName)
-    with open_(DataFileName,'w') as fp:
-       while True:
-          chunk = req.read(CHUNK)
-          if not chunk: break
-          fp.write(chunk.decode('utf-8'))
-          print('  %d bytes written to %s' % (CHUNK,DataFileName))
+    # the lines are parsed while the data is downloaded and written
+    data = fetchTableData(req,DataFileName,TableHeader,CHUNK)
+    removeStaleStorageFiles(DataFileName)
     with open(HeaderFileName,'w') as fp:       
        fp.write(json.dumps(TableHeader,indent=2))
        print('Header written to %s' % HeaderFileName)
     print('END DOWNLOAD')
     # Set comment
     # Get this table to LOCAL_TABLE_CACHE
-    storage2cache(TableName)
+    if data is None:
+        storage2cache(TableName)
+    else:
+        registerFetchedTable(TableName,TableHeader,data,DataFileName,HeaderFileName)
     print('PROCESSED')
 
+# PIPELINED FETCH
+# The response of the server is written to the disk and parsed at the same time:
+#  the download loop hands every chunk to a writer thread and a parser thread
+#  (parseTextChunks), which converts complete lines in blocks.
+
+FETCH_QUEUE_CHUNKS = 256
+
+def writeFetchedChunks(fp,chunks,errors):
+    # Writer stage.
+    while True:
+        chunk = chunks.get()
+        if chunk is None: break
+        if errors: continue
+        try:
+            fp.write(chunk)
+        except Exception as e:
+            errors.append(e)
+
+def fetchTableData(req,DataFileName,Header,ChunkSize):
+    # Download the response to DataFileName and parse it on the fly.
+    # Return the parsed columns or None if the file has to be parsed by storage2cache.
+    header = json.loads(json.dumps(Header)) # parsers must not change the original header
+    write_queue = Queue(FETCH_QUEUE_CHUNKS)
+    parse_queue = Queue(FETCH_QUEUE_CHUNKS)
+    errors = []; result = []
+    parser = threading.Thread(target=parseTextChunks,args=(parse_queue,header,result))
+    parser.daemon = True
+    parser.start()
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        with openStorageFile(DataFileName,'w') as fp:
+            writer = threading.Thread(target=writeFetchedChunks,args=(fp,write_queue,errors))
+            writer.daemon = True
+            writer.start()
+            try:
+                while True:
+                    chunk = req.read(ChunkSize)
+                    text = decoder.decode(chunk,final=not chunk)
+                    if text:
+                        write_queue.put(text)
+                        parse_queue.put(text)
+                    if not chunk: break
+                    print('  %d bytes written to %s' % (len(chunk),DataFileName))
+            finally:
+                write_queue.put(None)
+                writer.join()
+    finally:
+        parse_queue.put(None)
+        parser.join()
+    if errors: raise errors[0]
+    return concatenateTableBlocks(result[0],header)
+
+def registerFetchedTable(TableName,Header,data,DataFileName,HeaderFileName):
+    header = json.loads(json.dumps(Header))
+    finalizeTableColumns(header,data,getStorageProfile(TableName))
+    header['number_of_rows'] = line_count = len(data[header['order'][0]]) if header['order'] else 0
+    LOCAL_TABLE_CACHE[TableName] = {'header':header,'data':data,'filehandler':None}
+    print('                     Lines parsed: %d' % line_count)
+    if VARIABLES['SIDECAR_CACHE']:
+        saveSidecar(TableName,DataFileName,HeaderFileName)
+
 def saveHeader(TableName):
     ParameterList = prepareParlist(dotpar=True)    
     TableHeader = prepareHeader(ParameterList)
@@ -4722,7 +7775,10 @@ def getHelp(arg=None):
         print('  describe')
         print('  select')
         print('  sort')
+        print('  selectTop')
+        print('  unionTables')
         print('  extractColumns')
+        print('  splitColumn')
         print('  getColumn')
         print('  getColumns')
         print('  dropTable')
@@ -4895,10 +7951,12 @@ def describe(TableName):
 
 # ---------------------- /ISO.PY ---------------------------------------
 
-def db_begin(db=None):
+def db_begin(db=None,lazy=False,processes=None):
     """
     INPUT PARAMETERS: 
         db: database name (optional)
+        lazy: read only the table headers at start (optional)
+        processes: number of processes parsing the tables (optional)
     OUTPUT PARAMETERS: 
         none
     ---
@@ -4906,12 +7964,20 @@ def db_begin(db=None):
         Open a database connection. A database is stored 
         in a folder given in db input parameter.
         Default=data
+        If lazy is True, the tables are registered by their
+        headers and the data of each table is read from disk
+        the first time it is used.
+        If processes is given, the tables are parsed in parallel
+        by that many processes (0 means one per CPU core) and
+        read back from their binary caches.
     ---
     EXAMPLE OF USAGE:
         db_begin('bar')
+        db_begin('bar',lazy=True)
+        db_begin('bar',processes=0)
     ---
     """
-    databaseBegin(db)
+    databaseBegin(db,lazy,processes)
 
 def db_commit():
     """
@@ -5080,6 +8146,43 @@ def AtoB(aa,A,B,npt):
 
     return bb
 
+def AtoBArray(aa,A,B):
+#...AtoB for an array of values aa (within the range of A, which is ascending);
+#...the stencils are found with np.searchsorted and the weights are evaluated
+#...for all values at once, in the same order of operations as in AtoB
+    aa = np.asarray(aa,dtype=float64)
+    A = np.asarray(A); B = np.asarray(B)
+    npt = len(A)
+    nonzero = lambda D: np.where(D==0.0,0.0001,D)
+    # K is the zero-based index of the first node >= aa, I-1 in AtoB
+    K = np.maximum(np.searchsorted(A,aa,'left'),1)
+    bb = np.empty(aa.shape,dtype=np.result_type(aa,A,B))
+    # 3-point interpolation at the ends of the grid
+    three = (K==1) | (K==npt-1)
+    J = np.where(K[three]==1,2,npt-1)
+    x = aa[three]
+    A0D1=nonzero(A[J-2]-A[J-1]); A0D2=A[J-2]-A[J]
+    A1D1=nonzero(A[J-1]-A[J-2]); A1D2=nonzero(A[J-1]-A[J])
+    A2D1=nonzero(A[J]-A[J-2]);   A2D2=nonzero(A[J]-A[J-1])
+    A0=(x-A[J-1])*(x-A[J])/(A0D1*A0D2)
+    A1=(x-A[J-2])*(x-A[J])/(A1D1*A1D2)
+    A2=(x-A[J-2])*(x-A[J-1])/(A2D1*A2D2)
+    bb[three] = A0*B[J-2] + A1*B[J-1] + A2*B[J]
+    # 4-point interpolation inside
+    four = ~three
+    J = K[four]
+    x = aa[four]
+    A0D1=nonzero(A[J-2]-A[J-1]); A0D2=nonzero(A[J-2]-A[J]); A0D3=nonzero(A[J-2]-A[J+1])
+    A1D1=nonzero(A[J-1]-A[J-2]); A1D2=nonzero(A[J-1]-A[J]); A1D3=nonzero(A[J-1]-A[J+1])
+    A2D1=nonzero(A[J]-A[J-2]);   A2D2=nonzero(A[J]-A[J-1]); A2D3=nonzero(A[J]-A[J+1])
+    A3D1=nonzero(A[J+1]-A[J-2]); A3D2=nonzero(A[J+1]-A[J-1]); A3D3=nonzero(A[J+1]-A[J])
+    A0=(x-A[J-1])*(x-A[J])*(x-A[J+1])/(A0D1*A0D2*A0D3)
+    A1=(x-A[J-2])*(x-A[J])*(x-A[J+1])/(A1D1*A1D2*A1D3)
+    A2=(x-A[J-2])*(x-A[J-1])*(x-A[J+1])/(A2D1*A2D2*A2D3)
+    A3=(x-A[J-2])*(x-A[J-1])*(x-A[J])/(A3D1*A3D2*A3D3)
+    bb[four] = A0*B[J-2] + A1*B[J-1] + A2*B[J] + A3*B[J+1]
+    return bb
+
 
 #  --------------- ISOTOPOLOGUE HASH ----------------------
 
@@ -17246,6 +20349,29 @@ def BD_TIPS_2017_PYTHON(M,I,T):
     
     return None,Qt
 
+def BD_TIPS_2017_ARRAY(M,I,T):
+    # Partition sums for arrays of M, I and T (broadcast together):
+    #  the temperatures of each isotopologue are interpolated at once with AtoBArray,
+    #  giving the same values as BD_TIPS_2017_PYTHON.
+    M,I,T = np.broadcast_arrays(np.asarray(M),np.asarray(I),np.asarray(T,dtype=float64))
+    Qt = np.empty(T.shape,dtype=float64)
+    isotopologues,inverse = np.unique(np.stack([M.ravel(),I.ravel()],axis=1),axis=0,return_inverse=True)
+    inverse = inverse.reshape(T.shape)
+    for index,(M_,I_) in enumerate(isotopologues.tolist()):
+        try:
+            TT = TIPS_2017_ISOT_HASH[(M_,I_)]
+            QQ = TIPS_2017_ISOQ_HASH[(M_,I_)]
+        except KeyError:
+            raise Exception('TIPS2017: no data for M,I = %d,%d.' % (M_,I_))
+        mask = inverse==index
+        T_ = T[mask]
+        # out of temperature range
+        outside = T_[(T_<TT[0]) | (T_>TT[-1])]
+        if len(outside):
+            raise Exception('TIPS2017: T(%.1fK) must be between %.1fK and %.1fK.'%(outside[0],TT[0],TT[-1]))
+        Qt[mask] = AtoBArray(T_,TT,QQ)
+    return None,Qt
+
 def BD_TIPS_2017_PYTHON_SLICE(M,I,T,n=20): # testing
     """
     Calculate partition sum using Lagrange interpolation
@@ -17280,7 +20406,8 @@ def BD_TIPS_2017_PYTHON_SLICE(M,I,T,n=20): # testing
     
 # ALIASES FOR TIPS
 PYTIPS2011 = lambda M,I,T: BD_TIPS_2011_PYTHON(M,I,T)[1]
-PYTIPS2017 = lambda M,I,T: BD_TIPS_2017_PYTHON(M,I,T)[1]
+PYTIPS2017 = lambda M,I,T: BD_TIPS_2017_ARRAY(M,I,T)[1] if np.ndim(M) or np.ndim(I) or np.ndim(T) \
+                           else BD_TIPS_2017_PYTHON(M,I,T)[1]
 PYTIPS2017_SLICE = lambda M,I,T,n=20: BD_TIPS_2017_PYTHON_SLICE(M,I,T,n)[1]
 PYTIPS = PYTIPS2017 # stub for backwards compatibility
 
@@ -17325,10 +20452,17 @@ def partitionSum(M,I,T,step=None,version=2017):
             2) If T is a list and step parameter IS provided,
                 then calculate partition sums between T[0] and T[1]
                 with a given step.
+            3) If T, M or I is a numpy array, then calculate an array
+                of partition sums for the isotopologues and temperatures
+                broadcast together (e.g. layers of an atmosphere).
+        With TIPS-2017 the temperatures of each isotopologue are
+        interpolated at once; the values are the same as for
+        single temperatures.
     ---
     EXAMPLE OF USAGE:
         PartSum = partitionSum(1,1,[296,1000])
         TT,PartSum = partitionSum(1,1,[296,1000],step=0.1)
+        PartSum = partitionSum(array([[1],[2]]),1,array([200.,250.,296.]))
     ---
     """
     # version selector
@@ -17340,12 +20474,20 @@ def partitionSum(M,I,T,step=None,version=2017):
         raise Exception('Unknown version of TIPS: %s'%str(version))
     # partitionSum
     if not step:
-       if type(T) not in set([list,tuple]):
+       if isinstance(T,ndarray) or np.ndim(M) or np.ndim(I):
+          if version==2017: return BD_TIPS_2017_ARRAY(M,I,T)[1]
+          M,I,T = np.broadcast_arrays(M,I,T)
+          return array([BD_TIPS(M_,I_,temp)[1] for M_,I_,temp in zip(M.ravel().tolist(),I.ravel().tolist(),
+                                                                      T.ravel().tolist())]).reshape(T.shape)
+       elif type(T) not in set([list,tuple]):
           return BD_TIPS(M,I,T)[1]
+       elif version==2017:
+          return list(BD_TIPS_2017_ARRAY(M,I,T)[1])
        else:
           return [BD_TIPS(M,I,temp)[1] for temp in T]
     else:
        TT = arange(T[0],T[1],step)
+       if version==2017: return TT,BD_TIPS_2017_ARRAY(M,I,TT)[1]
        return TT,array([BD_TIPS(M,I,temp)[1] for temp in TT])
 
 # ------------------ partition sum --------------------------------------
@@ -19035,7 +22177,7 @@ def listOfTuples(a):
 
 # determine default parameters from those which are passed to absorptionCoefficient_...
 def getDefaultValuesForXsect(Components,SourceTables,Environment,OmegaRange,
-                             OmegaStep,OmegaWing,IntensityThreshold,Format):
+                             OmegaStep,OmegaWing,IntensityThreshold,Format,BlockLines=None):
     if SourceTables[0] == None:
         SourceTables = ['__BUFFER__',]
     if Environment == None:
@@ -19046,26 +22188,29 @@ def getDefaultValuesForXsect(Components,SourceTables,Environment,OmegaRange,
             # check table existance
             if TableName not in LOCAL_TABLE_CACHE.keys():
                 raise Exception('%s: no such table. Check tableList() for more info.' % TableName)
-            mol_ids = LOCAL_TABLE_CACHE[TableName]['data']['molec_id']
-            iso_ids = LOCAL_TABLE_CACHE[TableName]['data']['local_iso_id']
-            if len(mol_ids) != len(iso_ids):
-                raise Exception('Lengths if mol_ids and iso_ids differ!')
-            MI_zip = zip(mol_ids,iso_ids)
-            MI_zip = set(MI_zip)
-            for mol_id,iso_id in MI_zip:
-                CompDict[(mol_id,iso_id)] = None
+            for block in getTableBlocks(TableName,BlockLines):
+                mol_ids = block['molec_id']
+                iso_ids = block['local_iso_id']
+                if len(mol_ids) != len(iso_ids):
+                    raise Exception('Lengths if mol_ids and iso_ids differ!')
+                MI_zip = zip(mol_ids,iso_ids)
+                MI_zip = set(MI_zip)
+                for mol_id,iso_id in MI_zip:
+                    CompDict[(mol_id,iso_id)] = None
         Components = CompDict.keys()
     if OmegaRange == None:
         omega_min = float('inf')
         omega_max = float('-inf')
         for TableName in SourceTables:
-            nu = LOCAL_TABLE_CACHE[TableName]['data']['nu']
-            numin = min(nu)
-            numax = max(nu)
-            if omega_min > numin:
-                omega_min = numin
-            if omega_max < numax:
-                omega_max = numax
+            for block in getTableBlocks(TableName,BlockLines):
+                nu = block['nu']
+                if len(nu)==0: continue
+                numin = min(nu)
+                numax = max(nu)
+                if omega_min > numin:
+                    omega_min = numin
+                if omega_max < numax:
+                    omega_max = numax
         OmegaRange = (omega_min,omega_max)
     if OmegaStep == None:
         OmegaStep = 0.01 # cm-1
@@ -19099,6 +22244,7 @@ ABSCOEF_DOCSTRING_TEMPLATE = \
         File:   write output to file (if specified)
         Format:  c-format of file output (accounts for significant digits in WavenumberStep)
         LineMixingRosen: include 1st order line mixing to calculation
+        BlockLines:  read the source tables in blocks of this size (see iterTableBlocks)
     OUTPUT PARAMETERS: 
         Wavenum: wavenumber grid with respect to parameters WavenumberRange and WavenumberStep
         Xsect: absorption coefficient calculated on the grid
@@ -19127,7 +22273,7 @@ def absorptionCoefficient_Generic(Components=None,SourceTables=None,partitionFun
                                   WavenumberWingHW=None,WavenumberGrid=None,
                                   Diluent={},LineMixingRosen=False,
                                   profile=None,calcpars=None,exclude=set(),
-                                  DEBUG=None):
+                                  DEBUG=None,BlockLines=None):
                                                               
     # Throw exception if profile or calcpars are empty.
     if profile is None: raise Exception('user must provide the line profile function')
@@ -19157,7 +22303,7 @@ def absorptionCoefficient_Generic(Components=None,SourceTables=None,partitionFun
     Components,SourceTables,Environment,OmegaRange,OmegaStep,OmegaWing,\
     IntensityThreshold,Format = \
        getDefaultValuesForXsect(Components,SourceTables,Environment,OmegaRange,
-                                OmegaStep,OmegaWing,IntensityThreshold,Format)
+                                OmegaStep,OmegaWing,IntensityThreshold,Format,BlockLines)
     
     # warn user about too large omega step
     if OmegaStep>0.005 and profile is PROFILE_DOPPLER: 
@@ -19228,71 +22374,95 @@ def absorptionCoefficient_Generic(Components=None,SourceTables=None,partitionFun
     t = time()
     
     CALC_INFO_TOTAL = []
+    nlines_total = 0
     
     # SourceTables contain multiple tables
     for TableName in SourceTables:
-    
-        # exclude parameters not involved in calculation
-        DATA_DICT = LOCAL_TABLE_CACHE[TableName]['data']
-        parnames_exclude = ['a','global_upper_quanta','global_lower_quanta',
-            'local_upper_quanta','local_lower_quanta','ierr','iref','line_mixing_flag'] 
-        parnames = set(DATA_DICT)-set(parnames_exclude)
+
+        # the table is read at once or block by block
+        for DATA_DICT in getTableBlocks(TableName,BlockLines):
+
+            # lines within the absolute wing of the grid are always calculated
+            if number_of_points:
+                near = getNuWindowMask(TableName,DATA_DICT,Omegas[0]-OmegaWing,Omegas[-1]+OmegaWing)
+            else:
+                near = np.zeros(len(DATA_DICT['nu']),dtype=bool)
+            # lines of other isotopologues than the Components are not calculated
+            components = getIsotopologueRowIDs(TableName,DATA_DICT,ABUNDANCES)
+
+            # exclude parameters not involved in calculation
+            parnames_exclude = ['a','global_upper_quanta','global_lower_quanta',
+                'local_upper_quanta','local_lower_quanta','ierr','iref','line_mixing_flag'] 
+            parnames = set(DATA_DICT)-set(parnames_exclude)
+            # narrow columns of the storage profile are upcast for the calculation
+            DATA_DICT = widenColumns(DATA_DICT,parnames,LOCAL_TABLE_CACHE[TableName]['header']['format'])
         
-        nlines = len(DATA_DICT['nu'])
+            nlines = len(DATA_DICT['nu'])
+            nlines_total += nlines
 
-        for RowID in range(nlines):
+            for RowID in components.tolist():
                             
-            # create the transition object
-            TRANS = CaselessDict({parname:DATA_DICT[parname][RowID] for parname in parnames}) # CORRECTLY HANDLES DIFFERENT SPELLING OF PARNAMES
-            TRANS['T'] = T
-            TRANS['p'] = p
-            TRANS['T_ref'] = T_ref_default
-            TRANS['p_ref'] = p_ref_default
-            TRANS['Diluent'] = Diluent
-            TRANS['Abundances'] = ABUNDANCES
+                # create the transition object
+                TRANS = CaselessDict({parname:DATA_DICT[parname][RowID] for parname in parnames}) # CORRECTLY HANDLES DIFFERENT SPELLING OF PARNAMES
+                TRANS['T'] = T
+                TRANS['p'] = p
+                TRANS['T_ref'] = T_ref_default
+                TRANS['p_ref'] = p_ref_default
+                TRANS['Diluent'] = Diluent
+                TRANS['Abundances'] = ABUNDANCES
             
-            # filter by molecule and isotopologue
-            if (TRANS['molec_id'],TRANS['local_iso_id']) not in ABUNDANCES: continue
+                # filter by molecule and isotopologue
+                if (TRANS['molec_id'],TRANS['local_iso_id']) not in ABUNDANCES: continue
+
+                # the other lines are skipped if their halfwidth wing doesn't reach
+                #  the grid either; only Sw needs the partition sums
+                if not near[RowID] and not VARIABLES['abscoef_debug']:
+                    PROBE = calcpars(TRANS=TRANS,CALC_INFO=None,exclude=exclude|set(['Sw']))
+                    GammaMax = max(PROBE.get('Gamma0',0),PROBE.get('GammaD',0))
+                    if GammaMax!=0 or OmegaWingHW!=0:
+                        OmegaWingF = max(OmegaWing,OmegaWingHW*GammaMax)
+                        if bisect(Omegas,TRANS['nu']-OmegaWingF)==bisect(Omegas,TRANS['nu']+OmegaWingF):
+                            continue
                 
-            #   FILTER by LineIntensity: compare it with IntencityThreshold
-            TRANS['SigmaT']     = partitionFunction(TRANS['molec_id'],TRANS['local_iso_id'],TRANS['T'])
-            TRANS['SigmaT_ref'] = partitionFunction(TRANS['molec_id'],TRANS['local_iso_id'],TRANS['T_ref'])
-            LineIntensity = calculate_parameter_Sw(None,TRANS)
-            if LineIntensity < IntensityThreshold: continue
-
-            # calculate profile parameters 
-            if VARIABLES['abscoef_debug']:
-                CALC_INFO = {}
-            else:
-                CALC_INFO = None                
-            PARAMETERS = calcpars(TRANS=TRANS,CALC_INFO=CALC_INFO,exclude=exclude)
+                #   FILTER by LineIntensity: compare it with IntencityThreshold
+                TRANS['SigmaT']     = partitionFunction(TRANS['molec_id'],TRANS['local_iso_id'],TRANS['T'])
+                TRANS['SigmaT_ref'] = partitionFunction(TRANS['molec_id'],TRANS['local_iso_id'],TRANS['T_ref'])
+                LineIntensity = calculate_parameter_Sw(None,TRANS)
+                if LineIntensity < IntensityThreshold: continue
+
+                # calculate profile parameters 
+                if VARIABLES['abscoef_debug']:
+                    CALC_INFO = {}
+                else:
+                    CALC_INFO = None                
+                PARAMETERS = calcpars(TRANS=TRANS,CALC_INFO=CALC_INFO,exclude=exclude)
             
-            # get final wing of the line according to max(Gamma0,GammaD), OmegaWingHW and OmegaWing
-            try:
-                GammaD = PARAMETERS['GammaD']
-            except KeyError:
-                GammaD = 0
-            try:
-                Gamma0 = PARAMETERS['Gamma0']
-            except KeyError:
-                Gamma0 = 0
-            GammaMax = max(Gamma0,GammaD)
-            if GammaMax==0 and OmegaWingHW==0:
-                OmegaWing = 10.0 # 10 cm-1 default in case if Gamma0 and GammaD are missing
-                warn('Gamma0 and GammaD are missing; setting OmegaWing to %f cm-1'%OmegaWing)
-            OmegaWingF = max(OmegaWing,OmegaWingHW*GammaMax)
+                # get final wing of the line according to max(Gamma0,GammaD), OmegaWingHW and OmegaWing
+                try:
+                    GammaD = PARAMETERS['GammaD']
+                except KeyError:
+                    GammaD = 0
+                try:
+                    Gamma0 = PARAMETERS['Gamma0']
+                except KeyError:
+                    Gamma0 = 0
+                GammaMax = max(Gamma0,GammaD)
+                if GammaMax==0 and OmegaWingHW==0:
+                    OmegaWing = 10.0 # 10 cm-1 default in case if Gamma0 and GammaD are missing
+                    warn('Gamma0 and GammaD are missing; setting OmegaWing to %f cm-1'%OmegaWing)
+                OmegaWingF = max(OmegaWing,OmegaWingHW*GammaMax)
             
-            # calculate profile on a grid            
-            BoundIndexLower = bisect(Omegas,TRANS['nu']-OmegaWingF)
-            BoundIndexUpper = bisect(Omegas,TRANS['nu']+OmegaWingF)
-            PARAMETERS['WnGrid'] = Omegas[BoundIndexLower:BoundIndexUpper]
-            lineshape_vals = profile(**PARAMETERS)
-            Xsect[BoundIndexLower:BoundIndexUpper] += factor * lineshape_vals
+                # calculate profile on a grid            
+                BoundIndexLower = bisect(Omegas,TRANS['nu']-OmegaWingF)
+                BoundIndexUpper = bisect(Omegas,TRANS['nu']+OmegaWingF)
+                PARAMETERS['WnGrid'] = Omegas[BoundIndexLower:BoundIndexUpper]
+                lineshape_vals = profile(**PARAMETERS)
+                Xsect[BoundIndexLower:BoundIndexUpper] += factor * lineshape_vals
                    
-            # append debug information for the abscoef routine                
-            if VARIABLES['abscoef_debug']: DEBUG.append(CALC_INFO)
+                # append debug information for the abscoef routine                
+                if VARIABLES['abscoef_debug']: DEBUG.append(CALC_INFO)
         
-    print('%f seconds elapsed for abscoef; nlines = %d'%(time()-t,nlines))
+    print('%f seconds elapsed for abscoef; nlines = %d'%(time()-t,nlines_total))
     
     if File: save_to_file(File,Format,Omegas,Xsect)
     return Omegas,Xsect    
@@ -19561,7 +22731,9 @@ def absorptionCoefficient_HT_OLD(Components=None,SourceTables=None,partitionFunc
         parnames = LOCAL_TABLE_CACHE[TableName]['data'].keys()
         
         # loop through line centers (single stream)
-        for RowID in range(nline):
+        # only the lines of the Components are visited (see getIsotopologueRowIDs)
+        data = LOCAL_TABLE_CACHE[TableName]['data']
+        for RowID in getIsotopologueRowIDs(TableName,data,ABUNDANCES).tolist():
             
             # Get the custom environment dependences
             Line = {}
@@ -19919,7 +23091,9 @@ def absorptionCoefficient_SDVoigt_OLD(Components=None,SourceTables=None,partitio
         parnames = LOCAL_TABLE_CACHE[TableName]['data'].keys()
         
         # loop through line centers (single stream)
-        for RowID in range(nline):
+        # only the lines of the Components are visited (see getIsotopologueRowIDs)
+        data = LOCAL_TABLE_CACHE[TableName]['data']
+        for RowID in getIsotopologueRowIDs(TableName,data,ABUNDANCES).tolist():
             
             # Get the custom environment dependences
             Line = {}
@@ -20239,7 +23413,9 @@ def absorptionCoefficient_Voigt_OLD(Components=None,SourceTables=None,partitionF
         parnames = LOCAL_TABLE_CACHE[TableName]['data'].keys()
         
         # loop through line centers (single stream)
-        for RowID in range(nline):
+        # only the lines of the Components are visited (see getIsotopologueRowIDs)
+        data = LOCAL_TABLE_CACHE[TableName]['data']
+        for RowID in getIsotopologueRowIDs(TableName,data,ABUNDANCES).tolist():
             
             # Get the custom environment dependences
             Line = {}
@@ -20478,7 +23654,9 @@ def absorptionCoefficient_Lorentz_OLD(Components=None,SourceTables=None,partitio
         parnames = LOCAL_TABLE_CACHE[TableName]['data'].keys()
         
         # loop through line centers (single stream)
-        for RowID in range(nline):
+        # only the lines of the Components are visited (see getIsotopologueRowIDs)
+        data = LOCAL_TABLE_CACHE[TableName]['data']
+        for RowID in getIsotopologueRowIDs(TableName,data,ABUNDANCES).tolist():
             
             # Get the custom environment dependences
             Line = {}
@@ -20693,7 +23871,9 @@ def absorptionCoefficient_Doppler_OLD(Components=None,SourceTables=None,partitio
         nline = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
         
         # loop through line centers (single stream)
-        for RowID in range(nline):
+        # only the lines of the Components are visited (see getIsotopologueRowIDs)
+        data = LOCAL_TABLE_CACHE[TableName]['data']
+        for RowID in getIsotopologueRowIDs(TableName,data,ABUNDANCES).tolist():
             
             # get basic line parameters (lower level)
             LineCenterDB = LOCAL_TABLE_CACHE[TableName]['data']['nu'][RowID]
@@ -20891,20 +24071,25 @@ def radianceSpectrum(Omegas,AbsorptionCoefficient,Environment={'l':100.,'T':296.
 
 
 # GET X,Y FOR FINE PLOTTING OF A STICK SPECTRUM
-def getStickXY(TableName):
+def getStickXY(TableName,BlockLines=None):
     """
     Get X and Y for fine plotting of a stick spectrum.
     Usage: X,Y = getStickXY(TableName).
+    If BlockLines is given, the table is read block by block.
     """
-    cent,intens = getColumns(TableName,('nu','sw'))
+    if BlockLines is None:
+        cent,intens = getColumns(TableName,('nu','sw'))
+    else:
+        cent = []; intens = []
+        for block in iterTableBlocks(TableName,BlockLines):
+            cent.append(np.asarray(block['nu'],dtype=float64))
+            intens.append(np.asarray(block['sw'],dtype=float64))
+        cent = np.concatenate(cent) if cent else zeros(0)
+        intens = np.concatenate(intens) if intens else zeros(0)
     n = len(cent)
-    cent_ = zeros(n*3)
+    cent_ = np.repeat(np.asarray(cent,dtype=float64),3)
     intens_ = zeros(n*3)
-    for i in range(n):
-        intens_[3*i] = 0
-        intens_[3*i+1] = intens[i]
-        intens_[3*i+2] = 0
-        cent_[(3*i):(3*i+3)] = cent[i]
+    intens_[1::3] = intens
     return cent_,intens_
 # /GET X,Y FOR FINE PLOTTING OF A STICK SPECTRUM
 
@@ -5,14 +5,19 @@ from typing import *
 
 from test.config_editor_test import ConfigEditorTest
 from test.fail_test import FailTest
+from test.hapi_fetch_test import HapiFetchTest
+from test.hapi_query_test import HapiQueryTest
 from test.hapi_sources_test import HapiSourcesTest
+from test.hapi_storage_test import HapiStorageTest
+from test.hapi_writer_test import HapiWriterTest
 from test.molecule_info_test import MoleculeInfoTest
 from test.test import Test
 from test.throw_test import ThrowTest
 
 
 tests: List[Test] = [Test(), FailTest(), ThrowTest(), HapiSourcesTest(), MoleculeInfoTest(),
-                     ConfigEditorTest()]
+                     ConfigEditorTest(), HapiStorageTest(), HapiWriterTest(),
+                     HapiFetchTest(), HapiQueryTest()]
 
 
 def run_tests():
@@ -0,0 +1,72 @@
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from test.hapi_storage_test import PAR_LINES
+from test.test import Test
+
+# Enough lines for the response to be parsed in several blocks
+NUMBER_OF_LINES = 20000
+
+
+class ParFileHandler(BaseHTTPRequestHandler):
+    """
+    Stands in for the HITRAN line-by-line API: serves .par lines, followed by a comma-separated
+    parameter when specific parameters are requested.
+    """
+
+    def do_GET(self):
+        lines = [PAR_LINES[i % len(PAR_LINES)] for i in range(NUMBER_OF_LINES)]
+        if 'request_params' in self.path:
+            lines = [line + ',0.0{}00'.format(i % 10) for i, line in enumerate(lines)]
+        body = ('\n'.join(lines) + '\n').encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class HapiFetchTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'hapi fetch test'
+
+    def test(self) -> bool:
+        import numpy as np
+        import hapi
+
+        server = HTTPServer(('127.0.0.1', 0), ParFileHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            hapi.VARIABLES['BACKEND_DATABASE_NAME'] = tempfile.mkdtemp()
+            hapi.VARIABLES['GLOBAL_HOST'] = 'http://127.0.0.1:{}'.format(server.server_port)
+            hapi.queryHITRAN('fetchpar', [1], 0, 10000)
+            hapi.queryHITRAN('fetchcsv', [1], 0, 10000, params=['gamma_H2'])
+        finally:
+            server.shutdown()
+
+        # The tables parsed during the download must equal the tables read from the files
+        for table_name in ['fetchpar', 'fetchcsv']:
+            fetched = hapi.LOCAL_TABLE_CACHE[table_name]
+            if fetched['header']['number_of_rows'] != NUMBER_OF_LINES:
+                return False
+            hapi.VARIABLES['SIDECAR_CACHE'] = False
+            try:
+                hapi.storage2cache(table_name)
+            finally:
+                hapi.VARIABLES['SIDECAR_CACHE'] = True
+            stored = hapi.LOCAL_TABLE_CACHE[table_name]
+            if fetched['header'] != stored['header']:
+                return False
+            for par_name in stored['header']['order']:
+                if not np.array_equal(fetched['data'][par_name], stored['data'][par_name]):
+                    return False
+        return True
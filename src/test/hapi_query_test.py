@@ -0,0 +1,255 @@
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+from test.hapi_storage_test import PAR_LINES
+from test.test import Test
+
+
+class HapiQueryTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'hapi query test'
+
+    def test(self) -> bool:
+        import numpy as np
+        import hapi
+
+        folder = tempfile.mkdtemp()
+        with open(os.path.join(folder, 'querytest.data'), 'w') as file:
+            file.write('\n'.join(PAR_LINES) + '\n')
+        header = dict(hapi.HITRAN_DEFAULT_HEADER, table_name='querytest')
+        with open(os.path.join(folder, 'querytest.header'), 'w') as file:
+            file.write(json.dumps(header, indent=2))
+        hapi.VARIABLES['BACKEND_DATABASE_NAME'] = folder
+        hapi.storage2cache('querytest')
+        table = hapi.LOCAL_TABLE_CACHE['querytest']
+        nu = np.array(table['data']['nu'])
+
+        # Sort keys are evaluated on whole columns; rows with equal keys keep their order
+        def sorted_rows(**kwargs):
+            hapi.sort('querytest', DestinationTableName='sorttest', **kwargs)
+            return [int(np.flatnonzero(nu == value)[0]) for value in
+                    hapi.LOCAL_TABLE_CACHE['sorttest']['data']['nu']]
+        if sorted_rows(ParameterNames=('molec_id', ('*', -1, 'sw'))) != [0, 1, 3, 2]:
+            return False
+        if sorted_rows(ParameterNames=('molec_id', 'local_iso_id'), Accending=(False, True)) != [3, 2, 0, 1]:
+            return False
+        # a single descending flag reverses the ascending order, as the recursive sort did
+        if sorted_rows(ParameterNames='molec_id', Accending=False) != [3, 2, 1, 0]:
+            return False
+        if sorted_rows(ParameterNames='global_upper_quanta') != [0, 2, 3, 1]:
+            return False
+        # narrow integer keys are reversed without overflowing at their minimum
+        hapi.LOCAL_TABLE_CACHE['narrowtest'] = {'header': {'order': ['k'], 'format': {'k': '%4d'}, 'default': {'k': 0},
+                                                           'number_of_rows': 4},
+                                                'data': {'k': np.array([3, -128, 127, 0], dtype=np.int8)}}
+        hapi.sort('narrowtest', DestinationTableName='sorttest', ParameterNames=('k',), Accending=(False,))
+        if list(hapi.LOCAL_TABLE_CACHE['sorttest']['data']['k']) != [127, 3, 0, -128]:
+            return False
+        # the source table is left as it was
+        sorted_table = hapi.LOCAL_TABLE_CACHE['sorttest']
+        if sorted_table['header'] is table['header'] or not np.array_equal(table['data']['nu'], nu):
+            return False
+
+        # The top lines are the head of a stable sort, found without sorting the table
+        def top_rows(*args, **kwargs):
+            hapi.selectTop('querytest', *args, DestinationTableName='toptest', Output=False, **kwargs)
+            return [int(np.flatnonzero(nu == value)[0]) for value in
+                    hapi.LOCAL_TABLE_CACHE['toptest']['data']['nu']]
+        if top_rows(2) != [3, 0] or top_rows(1, 'nu', ('=', 'molec_id', 2), Accending=True) != [2] or \
+                top_rows(3, 'molec_id') != [2, 3, 0] or top_rows(10, 'sw', ('>', 'nu', 100.01)) != [3, 1, 2]:
+            return False
+        # intensities are scaled to the temperature of Environment
+        data = table['data']
+        intensity = [hapi.EnvironmentDependency_Intensity(
+            data['sw'][i], 1500., 296., hapi.PYTIPS2017(data['molec_id'][i], data['local_iso_id'][i], 1500.),
+            hapi.PYTIPS2017(data['molec_id'][i], data['local_iso_id'][i], 296.), data['elower'][i], data['nu'][i])
+            for i in range(len(nu))]
+        if top_rows(4, Environment={'T': 1500.}) != list(np.argsort(intensity)[::-1]) or \
+                not np.allclose(hapi.getLineIntensityColumn('querytest', 1500.), intensity, rtol=1e-14):
+            return False
+        # partition sums of arrays of isotopologues and temperatures are those of single temperatures
+        temperatures = np.array([1., 19.5, 296., 1234.5, 3499.9, 3500.])
+        sums = hapi.partitionSum(np.array([[1], [2]]), np.array([[1], [3]]), temperatures)
+        if sums.shape != (2, 6) or list(sums[1]) != [hapi.PYTIPS2017(2, 3, T) for T in temperatures.tolist()] or \
+                list(hapi.partitionSum(1, 1, [296, 1000])) != [hapi.PYTIPS2017(1, 1, 296), hapi.PYTIPS2017(1, 1, 1000)]:
+            return False
+
+        # A union orders the rows of its tables by nu without copying their columns
+        hapi.select('querytest', DestinationTableName='uniontest1', Output=False, Conditions=('=', 'molec_id', 2))
+        hapi.select('querytest', DestinationTableName='uniontest2', Output=False,
+                    ParameterNames=('nu', 'sw', 'molec_id'), Conditions=('=', 'molec_id', 1))
+        hapi.unionTables('uniontest', ['uniontest1', 'uniontest2'])
+        union = hapi.LOCAL_TABLE_CACHE['uniontest']
+        if union['header']['order'] != ['molec_id', 'nu', 'sw'] or list(union['data']['nu']) != list(nu) or \
+                not isinstance(union['data']['sw'], hapi.UnionColumn):
+            return False
+        hapi.select('uniontest', DestinationTableName='unionselect', Output=False, Conditions=('=', 'molec_id', 2))
+        if hapi.getNuWindow('uniontest', ('>', 'nu', 100.01)) != slice(1, 4) or \
+                list(hapi.LOCAL_TABLE_CACHE['unionselect']['data']['nu']) != list(nu[2:]):
+            return False
+        # editing a table first gives the unions of its views their own copies of the rows
+        sw_top = table['data']['sw'][3]
+        hapi.setRowObject(3, [('sw', 1e-30, '%10.3E')], 'querytest')
+        hapi.setRowObject(3, [('sw', sw_top, '%10.3E')], 'querytest')
+        if union.isUnion() or union['data']['sw'][3] != sw_top:
+            return False
+        # a column taken with getColumn is a detached copy, the union stays a union
+        hapi.unionTables('uniontest', ['uniontest1', 'uniontest2'])
+        column = hapi.getColumn('uniontest', 'sw')
+        column[0] = 1e-30
+        union = hapi.LOCAL_TABLE_CACHE['uniontest']
+        if not union.isUnion() or union['data']['sw'][0] == 1e-30 or table['data']['sw'][0] == 1e-30 or \
+                list(column[1:]) != list(union['data']['sw'][1:]):
+            return False
+
+        # Groups are made by factorizing the keys and reduced column-wise, in the order of their first rows
+        hapi.group('querytest', DestinationTableName='grouptest', Output=False,
+                   ParameterNames=('molec_id', ('LET', 'lines', ('COUNT',)), ('LET', 'sw_sum', ('SUM', 'sw')),
+                                   ('LET', 'nu_max', ('MAX', 'nu')), ('/', ('SSQ', 'sw'), ('COUNT',))),
+                   GroupParameterNames=(('*', -1, 'molec_id'),))
+        grouped = hapi.LOCAL_TABLE_CACHE['grouptest']
+        sw = np.array(table['data']['sw'])
+        if grouped['header']['order'] != ['molec_id', 'lines', 'sw_sum', 'nu_max', '#0'] or \
+                grouped['header']['format']['lines'] != '%10d' or list(grouped['data']['molec_id']) != [1, 2]:
+            return False
+        if list(grouped['data']['lines']) != [2, 2] or list(grouped['data']['nu_max']) != [nu[1], nu[3]]:
+            return False
+        if not np.allclose(grouped['data']['sw_sum'], [sw[0] + sw[1], sw[2] + sw[3]]) or \
+                not np.allclose(grouped['data']['#0'], [(sw[0] ** 2 + sw[1] ** 2) / 2, (sw[2] ** 2 + sw[3] ** 2) / 2]):
+            return False
+        # without group parameters the whole table is one group
+        hapi.group('querytest', DestinationTableName='grouptest', Output=False,
+                   ParameterNames=(('MIN', 'local_iso_id'),))
+        if list(hapi.LOCAL_TABLE_CACHE['grouptest']['data']['#0']) != [1]:
+            return False
+        # a group without values (all masked) takes the default of the function, also for integers
+        values = np.ma.array([5, 7, 3], mask=[False, True, True])
+        if list(hapi.reduceGroups('MIN', values, np.array([0, 1, 1]), 2)) != [5, 1e100] or \
+                hapi.reduceGroups('MAX', np.array([5, 3]), np.array([0, 1]), 2).dtype.kind != 'i':
+            return False
+        # an average of NaN values stays NaN
+        average = hapi.reduceGroups('AVG', np.ma.array([np.nan, 2.0, 3.0], mask=[False, False, True]),
+                                    np.array([0, 1, 2]), 3)
+        if not np.isnan(average[0]) or list(average[1:]) != [2.0, 0.0]:
+            return False
+        # the header of the groups has the fields of a created table
+        if hapi.LOCAL_TABLE_CACHE['grouptest']['header']['table_type'] != 'column-fixed' or \
+                hapi.LOCAL_TABLE_CACHE['grouptest']['header']['table_name'] != 'grouptest':
+            return False
+        hapi.describeTable('grouptest')
+
+        # Equality and IN tests on indexed columns only visit the rows of the matching keys
+        conditions = ('AND', ('=', 'molec_id', 2), ('IN', 'local_iso_id', ('SET', [10, 11])))
+        if list(hapi.getHashIndexRowIDs('querytest', conditions)) != [2, 3] or \
+                list(hapi.getHashIndexRowIDs('querytest', ('=', 'molec_id', 3))) != []:
+            return False
+        if list(hapi.getIsotopologueRowIDs('querytest', table['data'], [(1, 2), (2, 10)])) != [1, 3]:
+            return False
+        # an edited row moves to its new key
+        hapi.setRowObject(0, [('molec_id', 2, '%2d')], 'querytest')
+        if list(hapi.getHashIndexRowIDs('querytest', ('=', 'molec_id', 2))) != [0, 2, 3]:
+            return False
+        # and so does a row written in place
+        hapi.getColumn('querytest', 'molec_id')[1] = 2
+        if list(hapi.getHashIndexRowIDs('querytest', ('=', 'molec_id', 2))) != [0, 1, 2, 3]:
+            return False
+        hapi.getColumn('querytest', 'molec_id')[1] = 1
+
+        # A plan tells how each condition is evaluated; a profile also runs the query
+        conditions = ('AND', ('>', 'nu', 100.01), ('=', 'molec_id', 2), ('IN', ('STR', '1 0'), 'global_upper_quanta'))
+        plan = hapi.select('querytest', DestinationTableName='plantest', Conditions=conditions, Explain=True)
+        if [expression['method'] for expression in plan['stages'][1]['expressions']] != \
+                ['nu index', 'hash index', 'row'] or 'plantest' in hapi.LOCAL_TABLE_CACHE:
+            return False
+        plan = hapi.select('querytest', DestinationTableName='plantest', Output=False, Conditions=conditions,
+                           Profile=True)
+        stages = dict((stage['stage'], stage) for stage in plan['stages'])
+        if stages['fallback']['method'] != 'row' or stages['candidates']['selected'] != 2 or \
+                plan['rows_scanned'] != 2 or plan['rows_selected'] != 2 or hapi.QUERY_PROFILE is not None:
+            return False
+        plan = hapi.group('querytest', DestinationTableName='plantest', Output=False,
+                          GroupParameterNames=('molec_id',), Profile=True)
+        if [stage['stage'] for stage in plan['stages']] != ['groups', 'reduce', 'output'] or \
+                plan['rows_selected'] != 2 or json.loads(json.dumps(plan)) != plan:
+            return False
+
+        # Row-wise expressions are compiled once per structure
+        expression = ('AND', ('<', 100.0, 'nu'), ('IN', 'local_iso_id', ('SET', [1, 2])))
+        compiled = hapi.compileExpression(expression)
+        if compiled is not hapi.compileExpression(['AND', ['<', 100.0, 'nu'], ['IN', 'local_iso_id', ['SET', [1, 2]]]]) \
+                or compiled is hapi.compileExpression(('AND', ('<', 100, 'nu'), ('IN', 'local_iso_id', ('SET', [1, 2])))):
+            return False
+        if not compiled({'nu': 101.0, 'local_iso_id': 2}) or compiled({'nu': 101.0, 'local_iso_id': 3}):
+            return False
+        # errors are raised when a row is evaluated, not when compiling
+        unknown = hapi.compileExpression(('NOSUCHOP', 'nu'))
+        try:
+            unknown({'nu': 1.0})
+            return False
+        except Exception:
+            pass
+
+        # Quanta are split into typed columns, parsing each distinct value once
+        hapi.extractColumns('querytest', 'local_upper_quanta', ('%9d', '%3d', '%3d'), ('J', 'Ka', 'Kc'), FixCol=True)
+        hapi.extractColumns('querytest', 'local_upper_quanta', ('%d', '%d'), ('J2', 'Ka2'))
+        hapi.splitColumn('querytest', 'local_upper_quanta', ('J3', 'rest'), ParameterFormats=('%3d', '%6s'), Lazy=True)
+        quanta = [value.split() for value in table['data']['local_upper_quanta']]
+        if list(table['data']['J']) != [int(q[0]) for q in quanta] or list(table['data']['Kc']) != \
+                [int(q[2]) for q in quanta] or list(table['data']['Ka2']) != [int(q[1]) for q in quanta]:
+            return False
+        # a lazy column is computed when it is first read
+        if dict.__contains__(table['data'], 'j3') or list(table['data']['J3']) != list(table['data']['J']) or \
+                table['data']['rest'][0] != table['data']['local_upper_quanta'][0].split(None, 1)[1] or table['header']['order'][-2:] != ['J3', 'rest']:
+            return False
+        # lazy columns are computed before the rows are reordered, iterated in blocks or pickled
+        for extension in ('.data', '.header'):
+            shutil.copy(os.path.join(folder, 'querytest' + extension), os.path.join(folder, 'lazytest' + extension))
+        hapi.storage2cache('lazytest')
+        hapi.extractColumns('lazytest', 'local_upper_quanta', ('%9d',), ('J',), FixCol=True, Lazy=True)
+        hapi.sort('lazytest', ParameterNames=('nu',), Accending=False)
+        lazy = hapi.LOCAL_TABLE_CACHE['lazytest']['data']
+        if list(lazy['J']) != [int(value.split()[0]) for value in lazy['local_upper_quanta']]:
+            return False
+        hapi.extractColumns('lazytest', 'local_upper_quanta', ('%9d', '%3d'), ('J4', 'Ka4'), FixCol=True, Lazy=True)
+        hapi.select('lazytest', DestinationTableName='lazyblocks', Output=False, BlockLines=2,
+                    ParameterNames=('nu', 'Ka4'), Conditions=('>', 'J4', 0))
+        if list(hapi.LOCAL_TABLE_CACHE['lazyblocks']['data']['Ka4']) != list(lazy['Ka4'][lazy['J4'] > 0]):
+            return False
+        hapi.extractColumns('lazytest', 'local_upper_quanta', ('%9d',), ('J5',), FixCol=True, Lazy=True)
+        unpickled = pickle.loads(pickle.dumps(hapi.LOCAL_TABLE_CACHE['lazytest']))
+        if list(unpickled['data']['J5']) != list(lazy['J']):
+            return False
+        hapi.dropTable('lazytest')
+
+        # A select of plain parameters is a view of the rows of its source, also when chained
+        hapi.select('querytest', DestinationTableName='viewtest', Output=False, Conditions=('>', 'nu', 100.01))
+        hapi.select('viewtest', DestinationTableName='viewtest2', Output=False, ParameterNames=('nu', 'sw'),
+                    Conditions=('=', 'molec_id', 2))
+        view = hapi.LOCAL_TABLE_CACHE['viewtest2']
+        if not view.isView() or view.parent != 'querytest' or view['data'].row_ids != slice(2, 4) or \
+                list(view['data']) != ['nu', 'sw'] or list(view['data']['nu']) != list(nu[2:]):
+            return False
+        # getColumn gives a view its own copy of a column; a materialized view only keeps the labels of its rows
+        hapi.select('querytest', DestinationTableName='viewtest3', Output=False, Conditions=('>', 'nu', 100.01))
+        hapi.getColumn('viewtest3', 'sw')[0] = 1e-30
+        hapi.materializeTable('viewtest3')
+        if table['data']['sw'][1] == 1e-30 or len(hapi.LOCAL_TABLE_CACHE['viewtest3']['data']['global_upper_quanta'].labels) != \
+                len(set(table['data']['global_upper_quanta'][1:])):
+            return False
+        # editing the source first gives its views their own copies of the rows
+        sw_value = table['data']['sw'][2]
+        hapi.setRowObject(2, [('sw', 1e-30, '%10.3E')], 'querytest')
+        if view.isView() or hapi.LOCAL_TABLE_CACHE['viewtest'].isView() or view['data']['sw'][0] != sw_value:
+            return False
+        # a view is saved with its rows
+        hapi.select('querytest', DestinationTableName='viewtest', Output=False, Conditions=('<', 'nu', 100.01))
+        hapi.cache2storage('viewtest')
+        with open(os.path.join(folder, 'viewtest.data')) as file:
+            return not hapi.LOCAL_TABLE_CACHE['viewtest'].isView() and len(file.readlines()) == 1
@@ -0,0 +1,198 @@
+import gzip
+import json
+import os
+import tempfile
+
+from test.test import Test
+
+# A few lines in the .par format, including the special cases the parser has to handle:
+# D exponents, intensities without an exponent character and letter / zero local iso ids.
+PAR_LINES = [
+    ' 11  100.002150 2.380E-20 5.442E+00.04330.342 3128.60150.33-.008763        0 1 1'
+    ' 0        0 1 1 0       17  7  6       22 15 15455433 1 2 3 4 5 6*   25.0    1.0',
+    ' 12  100.014302 2.319D-20 1.516E+00.09320.256   75.73370.69-.006131        1 0 0'
+    ' 0        0 0 0 0        9  0  8       15 12 13455433 1 2 3 4 5 6*   25.0   25.0',
+    ' 2A  100.014856 2.700-164 9.356E+00.08900.139  679.84430.410.008379        0 1 1'
+    ' 0        1 0 0 0       27  9 13       16 12 11455433 1 2 3 4 5 6*   25.0    1.0',
+    ' 20  100.015522 9.042E-20 6.820E+00.09350.443 4954.94820.64-.006064        0 1 1'
+    ' 0        1 0 0 0       28  3  6       20  8  9455433 1 2 3 4 5 6     1.0    3.0',
+]
+
+
+class HapiStorageTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'hapi storage test'
+
+    def test(self) -> bool:
+        import numpy as np
+        import hapi
+
+        folder = tempfile.mkdtemp()
+        with open(os.path.join(folder, 'partest.data'), 'w') as file:
+            file.write('\n'.join(PAR_LINES) + '\n')
+        header = dict(hapi.HITRAN_DEFAULT_HEADER, table_name='partest')
+        with open(os.path.join(folder, 'partest.header'), 'w') as file:
+            file.write(json.dumps(header, indent=2))
+
+        hapi.VARIABLES['BACKEND_DATABASE_NAME'] = folder
+        hapi.storage2cache('partest')
+        data = hapi.LOCAL_TABLE_CACHE['partest']['data']
+
+        # The bulk parser must agree with the line-by-line converters
+        for qnt, dtype, start, end in hapi.getColumnFixedLayout(header):
+            convert = hapi.getColumnFixedConverter(qnt, dtype, start, end)
+            expected = np.array([convert(line) for line in PAR_LINES])
+            if not np.array_equal(expected, data[qnt]):
+                return False
+        if list(data['local_iso_id']) != [1, 2, 11, 10]:
+            return False
+
+        # The second load comes from the binary sidecar and must give the same table
+        if not os.path.isdir(hapi.getSidecarName(os.path.join(folder, 'partest.data'))):
+            return False
+        hapi.storage2cache('partest')
+        cached = hapi.LOCAL_TABLE_CACHE['partest']['data']
+        if not all(np.array_equal(data[qnt], cached[qnt]) for qnt in header['order']):
+            return False
+
+        # Quanta are dictionary-encoded; items are still read and written as strings
+        quanta = cached['global_upper_quanta']
+        if not isinstance(quanta, hapi.CategoricalColumn) or len(quanta.labels) != 2 or \
+                quanta[1] != '        1 0 0 0' or list(quanta == quanta[1]) != [False, True, False, False]:
+            return False
+        quanta[0] = '        2 0 0 0'
+        if quanta[0] != '        2 0 0 0' or quanta[1:][0] != '        1 0 0 0':
+            return False
+        hapi.select('partest', DestinationTableName='quantatest', Output=False,
+                    Conditions=('LIKE', ('STR', '^ *1 '), 'global_lower_quanta'))
+        if list(hapi.LOCAL_TABLE_CACHE['quantatest']['data']['nu']) != list(data['nu'][2:]):
+            return False
+
+        # Conditions and expressions are evaluated on whole columns
+        hapi.select('partest', DestinationTableName='columntest', Output=False,
+                    ParameterNames=('nu', ('LET', 'half_sw', ('*', 0.5, 'sw'), '%10.3E')),
+                    Conditions=('AND', ('<', 100.01, 'nu', 100.0155), ('IN', 'local_iso_id', ('SET', [2, 11]))))
+        selected = hapi.LOCAL_TABLE_CACHE['columntest']
+        if selected['header']['number_of_rows'] != 2 or not np.array_equal(selected['data']['nu'], data['nu'][1:3]) \
+                or not np.array_equal(selected['data']['half_sw'], 0.5 * data['sw'][1:3]):
+            return False
+        # a substring test has no column-wise version and is done row by row
+        hapi.select('partest', DestinationTableName='columntest', Output=False, ParameterNames=('nu',),
+                    Conditions=('IN', ('STR', '2 0'), 'global_upper_quanta'))
+        if list(hapi.LOCAL_TABLE_CACHE['columntest']['data']['nu']) != [data['nu'][0]]:
+            return False
+
+        # Bounds on nu are found by binary search, also once the table is no longer sorted
+        conditions = ('AND', ('>=', 'nu', 100.01), ('<', 'nu', 100.0155))
+        if hapi.getNuWindow('partest', conditions) != slice(1, 3):
+            return False
+        hapi.setRowObject(0, [('nu', 100.02, '%12.6f')], 'partest')
+        if list(hapi.getNuWindow('partest', conditions)) != [1, 2]:
+            return False
+        hapi.setRowObject(0, [('nu', data['nu'][0], '%12.6f')], 'partest')
+        # cells written in place are found when the index is checked before its use
+        if hapi.getNuWindow('partest', conditions) != slice(1, 3):
+            return False
+        hapi.getColumn('partest', 'nu')[0] = 100.012
+        if list(hapi.getRowIDArray(hapi.getNuWindow('partest', conditions))) != [0, 1, 2]:
+            return False
+        hapi.getColumn('partest', 'nu')[0] = data['nu'][0]
+
+        # A storage profile narrows the columns of the table, and of its later loads
+        hapi.setStorageProfile('partest', 'compact')
+        try:
+            narrow = hapi.LOCAL_TABLE_CACHE['partest']['data']
+            if narrow['molec_id'].dtype != np.int8 or narrow['gamma_air'].dtype != np.float32 or \
+                    narrow['nu'].dtype != np.float64 or hapi.getRowObject(0, 'partest')[0][1] != 1:
+                return False
+            hapi.storage2cache('partest')
+            reloaded = hapi.LOCAL_TABLE_CACHE['partest']['data']
+            if reloaded['gp'].dtype != np.float32 or \
+                    not isinstance(reloaded['ierr'], hapi.CategoricalColumn):
+                return False
+            widened = hapi.widenColumn(reloaded['gamma_air'], '%5.4f')
+            if not np.array_equal(widened, data['gamma_air']):
+                return False
+            # row objects round their float32 values the same way
+            row = dict((name, value) for name, value, fmt in hapi.getRowObject(1, 'partest'))
+            if row['gamma_air'] != data['gamma_air'][1] or type(row['gamma_air']) is not float:
+                return False
+        finally:
+            hapi.setStorageProfile('partest', None)
+
+        # A compressed data file is found and parsed while it is decompressed
+        with gzip.open(os.path.join(folder, 'partest.data.gz'), 'wt') as file:
+            file.write('\n'.join(PAR_LINES) + '\n')
+        os.remove(os.path.join(folder, 'partest.data'))
+        hapi.storage2cache('partest')
+        compressed = hapi.LOCAL_TABLE_CACHE['partest']['data']
+        if not all(np.array_equal(data[qnt], compressed[qnt]) for qnt in header['order']):
+            return False
+
+        # Comma-separated extra parameters: '#' placeholders become masked values
+        with open(os.path.join(folder, 'csvtest.data'), 'w') as file:
+            file.write(PAR_LINES[0] + ',0.0600,#\n' + PAR_LINES[1] + ',#,-0.2500\n')
+        csv_header = dict(header, table_name='csvtest', extra=['gamma_H2', 'n_H2'],
+                          extra_format={'gamma_H2': '%6.4f', 'n_H2': '%7.4f'},
+                          extra_separator=',')
+        with open(os.path.join(folder, 'csvtest.header'), 'w') as file:
+            file.write(json.dumps(csv_header, indent=2))
+        hapi.storage2cache('csvtest')
+        csv_data = hapi.LOCAL_TABLE_CACHE['csvtest']['data']
+        if list(np.ma.getmaskarray(csv_data['gamma_H2'])) != [False, True] or \
+                csv_data['n_H2'][1] != -0.25 or csv_data['nu'][1] != data['nu'][1]:
+            return False
+
+        # A lazily opened table only has its header until the data is used
+        hapi.db_begin(folder, lazy = True)
+        table = hapi.LOCAL_TABLE_CACHE['partest']
+        if table.isLoaded() or table['header']['number_of_rows'] != len(PAR_LINES):
+            return False
+
+        # Blocks streamed from the text storage must add up to the table
+        hapi.VARIABLES['SIDECAR_CACHE'] = False
+        try:
+            blocks = list(hapi.iterTableBlocks('partest', 3))
+            # the entry of the table is left as it is while blocks are read, also by an abandoned iterator
+            abandoned = hapi.iterTableBlocks('partest', 3)
+            next(abandoned)
+            if hapi.LOCAL_TABLE_CACHE['partest'] is not table:
+                return False
+        finally:
+            hapi.VARIABLES['SIDECAR_CACHE'] = True
+        if [len(block['nu']) for block in blocks] != [3, 1] or table.isLoaded():
+            return False
+        if not np.array_equal(np.concatenate([block['nu'] for block in blocks]), data['nu']):
+            return False
+        # A select to the storage writes the rows of each block to the data file of the result
+        hapi.select('partest', DestinationTableName='streamtest', Output=False, Storage=True, BlockLines=3,
+                    ParameterNames=('nu', 'sw'), Conditions=('>', 'nu', 100.01))
+        streamed = hapi.LOCAL_TABLE_CACHE['streamtest']
+        if table.isLoaded() or streamed.isLoaded() or streamed['header']['number_of_rows'] != 3 or \
+                not np.array_equal(streamed['data']['nu'], data['nu'][1:]):
+            return False
+        if not np.array_equal(data['nu'], table['data']['nu']) or not table.isLoaded():
+            return False
+
+        # Tables parsed by a pool of processes have the columns of a serial load and valid sidecars
+        pool_folder = tempfile.mkdtemp()
+        for pool_name in ('pooltest1', 'pooltest2'):
+            with open(os.path.join(pool_folder, pool_name + '.data'), 'w') as file:
+                file.write('\n'.join(PAR_LINES) + '\n')
+            with open(os.path.join(pool_folder, pool_name + '.header'), 'w') as file:
+                file.write(json.dumps(dict(header, table_name=pool_name), indent=2))
+        hapi.db_begin(pool_folder, processes=2)
+        if not all(hapi.hasValidSidecar(pool_name) for pool_name in ('pooltest1', 'pooltest2')):
+            return False
+        pooled = hapi.LOCAL_TABLE_CACHE['pooltest2']['data']
+        hapi.VARIABLES['SIDECAR_CACHE'] = False
+        try:
+            hapi.storage2cache('pooltest1')
+        finally:
+            hapi.VARIABLES['SIDECAR_CACHE'] = True
+        serial = hapi.LOCAL_TABLE_CACHE['pooltest1']['data']
+        return all(np.array_equal(np.asarray(serial[qnt]), np.asarray(pooled[qnt])) for qnt in header['order'])
@@ -0,0 +1,75 @@
+import json
+import lzma
+import os
+import tempfile
+
+from test.hapi_storage_test import PAR_LINES
+from test.test import Test
+
+
+class HapiWriterTest(Test):
+
+    def __init__(self):
+        Test.__init__(self)
+
+    def name(self) -> str:
+        return 'hapi writer test'
+
+    def test(self) -> bool:
+        import numpy as np
+        import hapi
+
+        folder = tempfile.mkdtemp()
+        with open(os.path.join(folder, 'writetest.data'), 'w') as file:
+            file.write('\n'.join(PAR_LINES) + '\n')
+        header = dict(hapi.HITRAN_DEFAULT_HEADER, table_name='writetest')
+        with open(os.path.join(folder, 'writetest.header'), 'w') as file:
+            file.write(json.dumps(header, indent=2))
+
+        hapi.VARIABLES['BACKEND_DATABASE_NAME'] = folder
+        hapi.storage2cache('writetest')
+        table = hapi.LOCAL_TABLE_CACHE['writetest']
+        # Negative values and a masked value exercise the Fortran-style corrections
+        table['data']['delta_air'][0] = -0.000123
+        # a negative zero is written as by the baseline writer
+        table['data']['delta_air'][3] = -0.0
+        if hapi.formatString('%9.6f', -0.0) != '-0.000000' or hapi.formatString('%10.3E', -0.0) != '-0.000E+00':
+            return False
+        table['data']['gamma_air'] = np.ma.array(table['data']['gamma_air'],
+                                                 mask=[False, True, False, False])
+
+        # The bulk writer must give exactly the lines of the row-by-row serializer
+        def expected():
+            return ''.join(
+                hapi.putRowObjectToString(hapi.getRowObject(row_id, 'writetest')) + '\n'
+                for row_id in range(len(PAR_LINES)))
+        hapi.cache2storage('writetest')
+        with open(os.path.join(folder, 'writetest.data')) as file:
+            if file.read() != expected():
+                return False
+
+        # Edited cells are patched into the file in place
+        table['data']['nu'][0] = 2000.123456
+        table['data']['sw'][1] = 1.5e-25
+        if not hapi.cache2storageCells('writetest', [('nu', 0), ('sw', 1)]):
+            return False
+        with open(os.path.join(folder, 'writetest.data')) as file:
+            if file.read() != expected():
+                return False
+
+        # A value wider than its field makes the whole table be rewritten
+        table['data']['molec_id'][0] = 123
+        if hapi.cache2storageCells('writetest', [('molec_id', 0)]):
+            return False
+
+        # A compressed table replaces the plain data file
+        hapi.cache2storage('writetest', 'xz')
+        if sorted(name for name in os.listdir(folder) if name.startswith('writetest.data')) != \
+                ['writetest.data.xz']:
+            return False
+        with lzma.open(os.path.join(folder, 'writetest.data.xz'), 'rt') as file:
+            if file.read() != expected():
+                return False
+        # and edited cells are saved by rewriting it
+        return not hapi.cache2storageCells('writetest', [('nu', 0)]) and \
+            sorted(os.listdir(folder)) == ['writetest.data.xz', 'writetest.header']
@@ -328,7 +328,10 @@ class HapiTableView(QTableView):
         # Name for the new table.
         output_name = self.view_widget.get_output_name()
 
-        worker = HapiWorker(WorkRequest.SAVE_TABLE, {'table': self.table, 'name': output_name},
+        worker = HapiWorker(WorkRequest.SAVE_TABLE,
+                            {'table': self.table, 'name': output_name,
+                             'dirty_cells': list(self.hmd.dirty_cells),
+                             'source_name': self.table_name},
                             self.done_saving)
 
         self.hmd.save_as(output_name)
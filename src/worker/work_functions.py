@@ -2,9 +2,12 @@ import functools
 import traceback
 from typing import Any, Dict, List, Optional, Tuple, Union
 
+import numpy as np
+
 from data_structures.bands import Band, Bands
 from data_structures.xsc import CrossSection
 from hapi import *
+from hapi import asCategorical
 from metadata.config import Config
 from metadata.hapi_metadata import HapiMetaData
 from utils.fetch_error import FetchError, FetchErrorKind
@@ -55,11 +58,12 @@ class WorkFunctions:
     @staticmethod
     def start_hapi(**_kwargs) -> bool:
         """
-        Initilizes the hapi database (i.e. loads all data into RAM).
+        Initilizes the hapi database. Only the table headers are read here, the data of a table
+        is loaded into RAM the first time the table is used.
         """
         print('Initializing hapi db...')
         try:
-            db_begin(Config.data_folder)
+            db_begin(Config.data_folder, lazy = True)
             del LOCAL_TABLE_CACHE['sampletab']
             print('Done initializing hapi db...')
         except Exception as e:
@@ -102,55 +106,33 @@ class WorkFunctions:
     @staticmethod
     def graph_bands(TableName: str, **_kwargs) -> Bands:
         """
-        The following set of local functions were supplied by R.V. Kochanov, modified /
-        refactored by Joshua Karns.
-        The process every line in a table and separate the bands (i.e. groups together bands that
-        have the same lower
-        and upper quanta.
-        :returns: the bands for the table!
+        Separates the lines of a table into bands, i.e. groups together the lines that have the
+        same global upper and lower quanta. The grouping is done on the codes of the
+        dictionary-encoded quanta columns rather than on the strings of every line.
+        :returns: the bands for the table, in the order of their first line
         """
-
-        def make_band_index():
-            """
-            Create the band index.
-            Band index is a dictionary of the format:
-                DICT[BAND] = IDS,
-                where BAND = (global_upper_quanta,global_lower_quanta)   (i.e. a tuple consisting
-                from two parameters)
-                IDS = indexes of the lines in LOCAL_TABLE_HASH corresponding to the BAND
-            """
-            data = LOCAL_TABLE_CACHE[TableName]['data']
-            band2index = { }
-
-            def process_band(params):
-                """
-                params should be a 3-tuple that contains (global_upper_quanta,
-                global_lower_quanta, index)
-                """
-                band2index.setdefault((params[0], params[1]), []).append(params[2])
-
-            quanta_with_index = zip(data['global_upper_quanta'], data['global_lower_quanta'],
-                                    range(0, len(data['global_lower_quanta'])))
-            list(map(process_band, quanta_with_index))
-
-            return band2index
-
-        def get_parameters(ids, params=('nu', 'sw')):
-            """
-            Get line parameters as a columns from the LOCAL_TABLE_HASH
-            using the ID numbers. Parameter names are specified in PARS.
-            """
-            data = LOCAL_TABLE_CACHE[TableName]['data']
-            return zip(*list(map(lambda id: list(map(lambda par: data[par][id], params)), ids)))
-
-        band2index = make_band_index()
+        data = LOCAL_TABLE_CACHE[TableName]['data']
+        upper = asCategorical(data['global_upper_quanta'])
+        lower = asCategorical(data['global_lower_quanta'])
+        # A band is a pair of (upper, lower) codes
+        keys = upper.codes.astype(np.int64) * max(len(lower.labels), 1) + lower.codes
+        _, first_ids, band_ids = np.unique(keys, return_index=True, return_inverse=True)
+        band_ids = band_ids.ravel()
+        # Line ids grouped by band, in the order of the lines within each band
+        line_ids = np.argsort(band_ids, kind='stable')
+        counts = np.bincount(band_ids, minlength=len(first_ids))
+        ends = np.cumsum(counts)
+        starts = ends - counts
+        nu = np.asarray(data['nu'])
+        sw = np.asarray(data['sw'])
 
         def get_band(band) -> Band:
-            ids = band2index[band]
-            nu, sw = get_parameters(ids)
-            return Band(nu, sw, "{} _ {}".format(band[0].strip(), band[1].strip()))
+            ids = line_ids[starts[band]:ends[band]]
+            first = first_ids[band]
+            return Band(nu[ids].tolist(), sw[ids].tolist(),
+                        "{} _ {}".format(upper[first].strip(), lower[first].strip()))
 
-        return Bands(list(map(get_band, band2index.keys())), TableName)
+        return Bands(list(map(get_band, np.argsort(first_ids))), TableName)
 
     @staticmethod
     def convolve_spectrum(x, y, instrumental_fn: str, Resolution: float, AF_wing: float):
@@ -386,16 +368,31 @@ class WorkFunctions:
     @staticmethod
     def get_table(table_name: str) -> Optional[Dict[str, Any]]:
         if table_name in LOCAL_TABLE_CACHE:
+            # Make sure the data of a lazily loaded table is read before it is sent away, and
+            # that a view or a union is sent with its own (writable) copies of the rows
+            LOCAL_TABLE_CACHE[table_name]['data']
+            materializeTable(table_name)
             return LOCAL_TABLE_CACHE[table_name]
         else:
             return None
 
     @staticmethod
-    def save_table(table: Dict[str, Any], name: str, **_kwargs):
+    def save_table(table: Dict[str, Any], name: str, dirty_cells: List[Tuple[int, int]] = None,
+                   source_name: str = None, **_kwargs):
         """
         Saves the modified table in the local table cache and on disk.
+
+        :param dirty_cells: (column, row) pairs of the edited cells. If they are given and the
+            table is saved under its own name (`source_name`), only these cells are written to the
+            existing files.
         """
         try:
+            if dirty_cells is not None and name == source_name and name in LOCAL_TABLE_CACHE:
+                LOCAL_TABLE_CACHE[name] = table
+                order = table['header']['order']
+                cache2storageCells(name, [(order[col], row) for col, row in dirty_cells])
+                return True
+
             # This also means the files already exist on disk and do not need to be created
             if name in LOCAL_TABLE_CACHE:
                 del LOCAL_TABLE_CACHE[name]
@@ -453,17 +450,19 @@ class WorkFunctions:
     @staticmethod
     def select(TableName: str, DestinationTableName: str = QUERY_BUFFER,
                ParameterNames: List[str] = None,
-               Conditions: List[Any] = None, Output: bool = False, File=None, **_kwargs):
+               Conditions: List[Any] = None, Output: bool = False, File=None, Profile: bool = False,
+               **_kwargs):
         """
-        Attempts to call the select() method from hapi.
+        Attempts to call the select() method from hapi. With Profile the plan of the query
+        (see hapi's QUERY PROFILER) is returned as well.
         """
-        select(TableName = TableName, DestinationTableName = DestinationTableName,
-               ParameterNames = ParameterNames,
-               Conditions = Conditions, Output = Output, File = File)
+        plan = select(TableName = TableName, DestinationTableName = DestinationTableName,
+                      ParameterNames = ParameterNames,
+                      Conditions = Conditions, Output = Output, File = File, Profile = Profile)
         hmd = HapiMetaData(DestinationTableName)
         WorkFunctions.save_table(LOCAL_TABLE_CACHE[TableName], table_name = DestinationTableName)
 
-        return echo(new_table_name = DestinationTableName, all_tables = list(tableList()))
+        return echo(new_table_name = DestinationTableName, all_tables = list(tableList()), plan = plan)
 
     @staticmethod
     def download_xscs(xscs: List[str], molecule_name: str, **_kwargs):